@@ -0,0 +1,318 @@
+'''
+local stand-in for a rasdaman WCS/WCPS endpoint (ows), used by the benchmarks
+
+The server answers GetCoverage and ProcessCoverages requests (GET or POST form) for the layers used in this repo:
+
+    PHASE_*             text/csv of a point ({"doy doy ..."}) or GeoTIFF of a bounding box (1000 m pixels)
+    DWD_*               text/csv time series of a point, one value (1/10 mm) per day of the ansi subset
+    S2_*                GeoTIFF (uint16 reflectances, 10 m pixels) of the CLIP polygon or the E/N subset
+    ProcessCoverages    text/csv with one value per day of the ansi range found in the WCPS query
+
+Responses are synthetic and deterministic, or recorded responses are replayed: with --responses DIR, a file
+DIR/<prefix>.csv or DIR/<prefix>.tif is returned for every coverage ID starting with <prefix> (the longest prefix wins).
+Every answer is delayed by --latency (+ uniform --jitter) seconds, and a share of --error-rate requests is answered
+with --error-status, so retries and the throttle are exercised as well:
+
+    python -m benchmarks.mock_server --port 8080 --latency 0.05 --jitter 0.05 --error-rate 0.01
+
+The first line written to stdout is the endpoint URL (useful with --port 0, which picks a free port).
+'''
+import argparse
+import collections
+import datetime
+import os
+import random
+import re
+import socket
+import sys
+import threading
+import time
+import zlib
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from urllib.parse import parse_qsl, urlsplit
+
+import numpy as np
+
+# typical starting dates (DOY) of the phenological stages of a PHASE layer
+PHASE_DOYS = (60, 95, 120, 140, 160, 180, 200, 225)
+
+PHASE_RESOLUTION = 1000
+S2_RESOLUTION = 10
+
+_NUMBER = re.compile(r'-?\d+(?:\.\d+)?')
+_DATE = re.compile(r'\d{4}-\d{2}-\d{2}')
+_SUBSET = re.compile(r'^(\w+)\((.*)\)$')
+
+
+def _parse_subsets(values):
+    # SUBSET=E(600000,601000) -> {'E': ('600000', '601000')}, quotes of dates are removed
+    subsets = {}
+    for value in values:
+        match = _SUBSET.match(value)
+        if match is not None:
+            subsets[match.group(1)] = tuple(v.strip().strip('"') for v in match.group(2).split(','))
+    return subsets
+
+
+def _get_days(startdate, enddate):
+    start = datetime.date.fromisoformat(startdate)
+    end = datetime.date.fromisoformat(enddate)
+    return max(1, (end - start).days + 1)
+
+
+def _encode_geotiff(data, xmin, ymax, resolution, epsg, nodata):
+    import rasterio # only needed for image/tiff answers
+    from rasterio.io import MemoryFile
+    from rasterio.transform import from_origin
+
+    with MemoryFile() as memfile:
+        with memfile.open(driver='GTiff', width=data.shape[2], height=data.shape[1], count=data.shape[0], dtype=data.dtype,
+                          crs=rasterio.crs.CRS.from_epsg(epsg), transform=from_origin(xmin, ymax, resolution, resolution),
+                          nodata=nodata) as dst:
+            dst.write(data)
+        return memfile.read()
+
+
+class MockWCS:
+    '''
+    synthetic and replayed answers of the mock server
+
+    PARAMETERS:
+        latency (float(opt)): delay of every answer in seconds. Defaults to 0.
+        jitter (float(opt)): additional uniform random delay in seconds. Defaults to 0.
+        error_rate (float(opt)): share of requests answered with error_status. Defaults to 0.
+        error_status (int(opt)): status code of failed requests. Defaults to 503.
+        responses (str(opt)): directory of recorded responses (<coverage ID prefix>.csv/.tif). Defaults to None.
+        max_size (int(opt)): largest width and height of synthetic images in pixels. Defaults to 2048.
+        seed (int(opt)): seed of the latencies, errors and synthetic values. Defaults to 0.
+    '''
+
+    def __init__(self, latency=0.0, jitter=0.0, error_rate=0.0, error_status=503, responses=None, max_size=2048, seed=0):
+        self.latency = latency
+        self.jitter = jitter
+        self.error_rate = error_rate
+        self.error_status = error_status
+        self.max_size = max_size
+        self.seed = seed
+        self.requests = 0
+        self._random = random.Random(seed)
+        self._lock = threading.Lock()
+        self._bodies = collections.OrderedDict() # LRU of encoded images, encoding must not dominate the benchmark
+        self._recorded = {}
+        if responses is not None:
+            for name in os.listdir(responses):
+                prefix, ext = os.path.splitext(name)
+                if ext in ('.csv', '.tif', '.tiff'):
+                    with open(os.path.join(responses, name), 'rb') as f:
+                        self._recorded[prefix] = ('text/csv' if ext == '.csv' else 'image/tiff', f.read())
+
+    def delay(self):
+        '''
+        draw the delay of the next answer and whether it fails
+        '''
+        with self._lock:
+            self.requests += 1
+            return self.latency + self._random.uniform(0, self.jitter), self._random.random() < self.error_rate
+
+    def answer(self, params):
+        '''
+        answer a request
+
+        PARAMETERS:
+            params (list): (name, value) tuples of the query string or the form body
+
+        RETURNS:
+            status (int): HTTP status code
+            content_type (str): MIME type of the body
+            body (bytes): response body
+        '''
+        names = {name.upper(): value for name, value in params}
+        request = names.get('REQUEST', '')
+        if request == 'ProcessCoverages':
+            return self._process_coverages(names.get('QUERY', ''))
+        if request != 'GetCoverage':
+            return _exception('OperationNotSupported', 'the mock server supports GetCoverage and ProcessCoverages only')
+        layer = names.get('COVERAGEID', '')
+        subsets = _parse_subsets(value for name, value in params if name.upper() == 'SUBSET')
+        fmt = names.get('FORMAT', 'text/csv')
+
+        recorded = self._get_recorded(layer)
+        if recorded is not None:
+            return (200,) + recorded
+        if layer.startswith('PHASE_'):
+            return self._phase(subsets, fmt, names)
+        if layer.startswith('DWD_'):
+            return self._dwd(subsets)
+        if layer.startswith('S2_'):
+            return self._s2(subsets, names)
+        return _exception('NoSuchCoverage', 'coverage {} is not offered by the mock server'.format(layer), status=404)
+
+    def _get_recorded(self, layer):
+        prefixes = [prefix for prefix in self._recorded if layer.startswith(prefix)]
+        if len(prefixes) == 0:
+            return None
+        return self._recorded[max(prefixes, key=len)]
+
+    def _values(self, *key):
+        # deterministic pseudo random generator of a request (hash() of strings differs between processes)
+        return np.random.default_rng(zlib.crc32(repr((self.seed,) + key).encode()))
+
+    def _bbox(self, subsets, names, resolution):
+        # extent of the CLIP polygon or of the E/N trims, at least one pixel
+        if 'CLIP' in names:
+            coords = np.array([float(v) for v in _NUMBER.findall(names['CLIP'])])
+            xs, ys = coords[0::2], coords[1::2]
+            xmin, xmax, ymin, ymax = xs.min(), xs.max(), ys.min(), ys.max()
+        else:
+            x = [float(v) for v in subsets.get('E', subsets.get('X', ('0',)))]
+            y = [float(v) for v in subsets.get('N', subsets.get('Y', ('0',)))]
+            xmin, xmax, ymin, ymax = min(x), max(x), min(y), max(y)
+        width = int(min(self.max_size, max(1, np.ceil((xmax - xmin) / resolution))))
+        height = int(min(self.max_size, max(1, np.ceil((ymax - ymin) / resolution))))
+        return xmin, ymax, width, height
+
+    def _geotiff(self, key, build, xmin, ymax, resolution, names, nodata):
+        epsg = int(names.get('OUTPUTCRS', '/32632').rstrip('/').rsplit('/', 1)[-1])
+        key = key + (epsg,)
+        with self._lock:
+            body = self._bodies.get(key)
+            if body is not None:
+                self._bodies.move_to_end(key)
+                return 200, 'image/tiff', body
+        body = _encode_geotiff(build(), xmin, ymax, resolution, epsg, nodata)
+        with self._lock:
+            self._bodies[key] = body
+            while len(self._bodies) > 256:
+                self._bodies.popitem(last=False)
+        return 200, 'image/tiff', body
+
+    def _phase(self, subsets, fmt, names):
+        if fmt == 'image/tiff':
+            xmin, ymax, width, height = self._bbox(subsets, names, PHASE_RESOLUTION)
+
+            def build():
+                rng = self._values('PHASE', xmin, ymax, width, height)
+                offsets = rng.integers(-10, 11, size=(1, height, width))
+                return (np.array(PHASE_DOYS, dtype=np.float32)[:, None, None] + offsets).astype(np.float32)
+            return self._geotiff(('PHASE', xmin, ymax, width, height), build, xmin, ymax, PHASE_RESOLUTION, names, None)
+        x = subsets.get('E', ('0',))[0]
+        y = subsets.get('N', ('0',))[0]
+        offsets = self._values('PHASE', x, y).integers(-10, 11, size=len(PHASE_DOYS))
+        return 200, 'text/csv', ('{"' + ' '.join(str(d + o) for d, o in zip(PHASE_DOYS, offsets)) + '"}').encode()
+
+    def _dwd(self, subsets):
+        ansi = subsets.get('ansi', ('2020-01-01',))
+        days = _get_days(ansi[0], ansi[-1])
+        rng = self._values('DWD', ansi, subsets.get('E'), subsets.get('N'))
+        # most days are dry, rainy days have a few mm (1/10 mm in the data cube)
+        values = np.where(rng.random(days) < 0.6, 0, rng.gamma(1.5, 40, size=days)).astype(np.int64)
+        return 200, 'text/csv', ('{' + ','.join(map(str, values.tolist())) + '}').encode()
+
+    def _s2(self, subsets, names):
+        bands = len(names['RANGESUBSET'].split(',')) if 'RANGESUBSET' in names else 12
+        xmin, ymax, width, height = self._bbox(subsets, names, S2_RESOLUTION)
+        date = subsets.get('ansi', ('',))[0]
+
+        def build():
+            rng = self._values('S2', date, xmin, ymax, width, height)
+            data = rng.integers(200, 5000, size=(bands, height, width), dtype=np.uint16)
+            # clouds are masked with no data
+            data[:, rng.random((height, width)) < rng.random() * 0.5] = 0
+            return data
+        return self._geotiff(('S2', bands, xmin, ymax, width, height), build, xmin, ymax, S2_RESOLUTION, names, 0)
+
+    def _process_coverages(self, wcps):
+        dates = _DATE.findall(wcps)
+        days = _get_days(dates[0], dates[-1]) if len(dates) > 0 else 1
+        values = self._values('WCPS', wcps).integers(0, 10000, size=days)
+        return 200, 'text/csv', ('{' + ','.join(map(str, values.tolist())) + '}').encode()
+
+
+def _exception(code, text, status=400):
+    body = ('<?xml version="1.0" encoding="UTF-8"?>\n<ows:ExceptionReport xmlns:ows="http://www.opengis.net/ows/2.0" version="2.0.0">'
+            '<ows:Exception exceptionCode="{}"><ows:ExceptionText>{}</ows:ExceptionText></ows:Exception></ows:ExceptionReport>').format(code, text)
+    return status, 'application/xml', body.encode()
+
+
+class _Handler(BaseHTTPRequestHandler):
+    protocol_version = 'HTTP/1.1' # keep-alive, as rasdaman behind a reverse proxy
+
+    def setup(self):
+        super().setup()
+        # headers and body are separate writes, without TCP_NODELAY every answer on a kept-alive connection
+        # would wait for the delayed ACK of the client (~40 ms) and the benchmark would measure the mock
+        self.connection.setsockopt(socket.IPPROTO_TCP, socket.TCP_NODELAY, 1)
+
+    def do_GET(self):
+        self._answer(parse_qsl(urlsplit(self.path).query, keep_blank_values=True))
+
+    def do_POST(self):
+        length = int(self.headers.get('Content-Length', 0))
+        self._answer(parse_qsl(self.rfile.read(length).decode(), keep_blank_values=True))
+
+    def _answer(self, params):
+        wcs = self.server.wcs
+        wait, failed = wcs.delay()
+        if failed:
+            status, content_type, body = _exception('ServiceUnavailable', 'simulated error', status=wcs.error_status)
+        else:
+            try:
+                status, content_type, body = wcs.answer(params)
+            except Exception as e:
+                status, content_type, body = _exception('InvalidRequest', str(e))
+        if wait > 0:
+            time.sleep(wait)
+        self.send_response(status)
+        self.send_header('Content-Type', content_type)
+        self.send_header('Content-Length', str(len(body)))
+        if failed:
+            self.send_header('Retry-After', '0')
+        self.end_headers()
+        self.wfile.write(body)
+
+    def log_message(self, format, *args):
+        pass
+
+
+def serve(wcs, host='127.0.0.1', port=0):
+    '''
+    create the HTTP server of a MockWCS, call serve_forever() (e.g. in a thread) to start it
+
+    RETURNS:
+        server (http.server.ThreadingHTTPServer): server with the attribute url (endpoint of the mock service)
+    '''
+    ThreadingHTTPServer.request_queue_size = 1024
+    server = ThreadingHTTPServer((host, port), _Handler)
+    server.daemon_threads = True
+    server.wcs = wcs
+    server.url = 'http://{}:{}/rasdaman/ows'.format(*server.server_address[:2])
+    return server
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description='mock rasdaman WCS/WCPS server for benchmarks')
+    parser.add_argument('--host', default='127.0.0.1')
+    parser.add_argument('--port', type=int, default=8080, help='0 picks a free port')
+    parser.add_argument('--latency', type=float, default=0.0, help='delay of every answer in seconds')
+    parser.add_argument('--jitter', type=float, default=0.0, help='additional uniform random delay in seconds')
+    parser.add_argument('--error-rate', type=float, default=0.0, help='share of requests answered with --error-status')
+    parser.add_argument('--error-status', type=int, default=503)
+    parser.add_argument('--responses', default=None, help='directory of recorded responses <coverage ID prefix>.csv/.tif')
+    parser.add_argument('--max-size', type=int, default=2048, help='largest width/height of synthetic images')
+    parser.add_argument('--seed', type=int, default=0)
+    args = parser.parse_args(argv)
+
+    wcs = MockWCS(args.latency, args.jitter, args.error_rate, args.error_status, args.responses, args.max_size, args.seed)
+    server = serve(wcs, args.host, args.port)
+    print(server.url, flush=True)
+    try:
+        server.serve_forever()
+    except KeyboardInterrupt:
+        pass
+    finally:
+        server.server_close()
+    return 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
@@ -0,0 +1,301 @@
+'''
+offline benchmarks of the fetchers, decoders and index functions against the local mock WCS server
+
+    python -m benchmarks.run                                    # all benchmarks, no latency
+    python -m benchmarks.run --latency 0.05 --jitter 0.05 --concurrency 16 --benchmarks phase_point,s2_season
+    python -m benchmarks.run --json baseline.json               # save the results
+    python -m benchmarks.run --compare baseline.json            # exit code 1 on a regression
+
+Benchmarks:
+
+    phase_point     get_phases_from_point for random points
+    dwd_point       get_precipitation_from_point, a year of daily sums per point
+    s2_season       the notebook loop: get_S2_imagery + calculate_savi for every day of a season
+    s2_pipeline     the same season as pipeline (fetch and compute overlap), latency from fetch start to the sink
+    index           calculate_index of a field time series (no network)
+    parse_csv       parse_csv of PHASE and DWD responses (no network)
+
+Every benchmark runs in a fresh process, so the reported peak RSS is its own. The mock server runs in another
+process and does not compete for the GIL. Network benchmarks run --requests operations on --concurrency threads;
+the throttle of the mock host is fixed to --concurrency unless --adaptive is given.
+'''
+import argparse
+import json
+import multiprocessing
+import os
+import resource
+import subprocess
+import sys
+import time
+from concurrent.futures import ProcessPoolExecutor, ThreadPoolExecutor
+
+import numpy as np
+
+from .mock_server import MockWCS
+
+BENCHMARKS = ('phase_point', 'dwd_point', 's2_season', 's2_pipeline', 'index', 'parse_csv')
+
+# results, which are compared with a baseline: (key, True if higher is better)
+COMPARED = (('ops_per_s', True), ('p99_ms', False))
+
+
+def _peak_rss():
+    # ru_maxrss is given in kilobytes on Linux and in bytes on macOS
+    rss = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    return rss if sys.platform == 'darwin' else rss * 1024
+
+
+def _run_threads(operation, items, concurrency):
+    # run operation(item) on a thread pool and measure the latency of every call
+    def timed(item):
+        start = time.perf_counter()
+        ok = operation(item)
+        return time.perf_counter() - start, ok
+
+    with ThreadPoolExecutor(max_workers=concurrency) as executor:
+        results = list(executor.map(timed, items))
+    return [r[0] for r in results], sum(1 for r in results if not r[1])
+
+
+def _run_serial(operation, n):
+    latencies = []
+    for i in range(n):
+        start = time.perf_counter()
+        operation(i)
+        latencies.append(time.perf_counter() - start)
+    return latencies, 0
+
+
+def _bench_phase_point(url, args):
+    from jki_datacube.phase import get_phases_from_point
+
+    rng = np.random.default_rng(args.seed)
+    points = np.column_stack([rng.uniform(300000, 900000, args.requests), rng.uniform(5300000, 6100000, args.requests)])
+    return _run_threads(lambda p: isinstance(get_phases_from_point('2020', 'winterwheat', p[0], p[1], url), list), points, args.concurrency)
+
+
+def _bench_dwd_point(url, args):
+    from jki_datacube.dwd import get_precipitation_from_point
+
+    rng = np.random.default_rng(args.seed)
+    # points in the CRS of the data cube (EPSG:31467), so no transformation is benchmarked
+    points = np.column_stack([rng.uniform(3300000, 3900000, args.requests), rng.uniform(5300000, 6100000, args.requests)])
+    return _run_threads(lambda p: isinstance(get_precipitation_from_point('2020-01-01', '2020-12-31', 'DWD_Niederschlag', p[0], p[1], url, epsg=31467), list),
+                        points, args.concurrency)
+
+
+def _get_field_polygon(size, x=600000, y=5800000):
+    return 'POLYGON(({0} {1}, {2} {1}, {2} {3}, {0} {3}, {0} {1}))'.format(x, y, x + size, y + size)
+
+
+def _bench_s2_season(url, args):
+    from jki_datacube.misc import calculate_savi
+    from jki_datacube.s2 import _get_dates, get_S2_imagery
+
+    polygon = _get_field_polygon(args.field_size)
+    days = _get_dates('2020-03-01', '2020-10-31')
+    # the season is looped, if more operations are requested
+    days = [days[i % len(days)] for i in range(max(args.requests, len(days)))]
+
+    def operation(day):
+        response = get_S2_imagery(polygon, 'S2_GermanyGrid', day, 'user', 'pw', url)
+        if response is None or response.status_code != 200:
+            return False
+        calculate_savi(response, valid_pixel_portion=0)
+        return True
+    return _run_threads(operation, days, args.concurrency)
+
+
+def _bench_s2_pipeline(url, args):
+    import functools
+    from jki_datacube.pipeline import _calculate_savi, _fetch_S2_imagery, pipeline
+    from jki_datacube.s2 import _get_dates
+
+    polygon = _get_field_polygon(args.field_size)
+    days = _get_dates('2020-03-01', '2020-10-31')
+    # the season is looped, if more operations are requested (items are (repetition, day) to keep them unique)
+    items = [(i // len(days), days[i % len(days)]) for i in range(max(args.requests, len(days)))]
+    # the stages of get_S2_savi_range, the fetch is wrapped to get the latency of every item (fetch start -> sink)
+    fetch_S2 = functools.partial(_fetch_S2_imagery, polygon=polygon, layer='S2_GermanyGrid', user='user', pw='pw', host=url, epsg=32632,
+                                 band1='NIR10', band2='R')
+    compute = functools.partial(_calculate_savi, valid_pixel_portion=0, noData=0)
+    starts = {}
+
+    def fetch(item):
+        starts[item] = time.perf_counter()
+        return fetch_S2(item[1])
+
+    latencies = []
+    errors = 0
+    for item, savi in pipeline(items, fetch, compute, fetch_workers=args.concurrency):
+        latencies.append(time.perf_counter() - starts.pop(item))
+        errors += savi is None
+    return latencies, errors
+
+
+def _bench_index(url, args):
+    from jki_datacube.index import calculate_index
+
+    size = max(1, args.field_size // 10)
+    stack = np.random.default_rng(args.seed).integers(0, 5000, size=(100, 3, size, size), dtype=np.uint16)
+    out = np.empty((100, size, size), dtype=np.float32)
+    return _run_serial(lambda i: calculate_index(stack, 'savi', bands={'nir': 0, 'red': 1}, out=out), args.requests)
+
+
+def _bench_parse_csv(url, args):
+    from jki_datacube.decode import parse_csv
+
+    wcs = MockWCS(seed=args.seed)
+    bodies = [
+        wcs.answer([('REQUEST', 'GetCoverage'), ('COVERAGEID', 'PHASE_202_Winterweizen'), ('SUBSET', 'E(600000)'), ('SUBSET', 'N(5800000)')])[2],
+        wcs.answer([('REQUEST', 'GetCoverage'), ('COVERAGEID', 'DWD_Niederschlag'), ('SUBSET', 'ansi("2020-01-01","2020-12-31")')])[2]
+    ]
+    return _run_serial(lambda i: parse_csv(bodies[i % len(bodies)]), args.requests * 10)
+
+
+def run_benchmark(name, url, args):
+    '''
+    run one benchmark in the current process
+
+    PARAMETERS:
+        name (str): benchmark name, see BENCHMARKS
+        url (str): endpoint of the mock server
+        args (argparse.Namespace): options of the harness
+
+    RETURNS:
+        result (dict): operations, errors, retries, seconds, ops_per_s, p50_ms, p99_ms, peak_rss_mb
+    '''
+    from jki_datacube import instrument
+    from jki_datacube.client import client
+    from jki_datacube.throttle import set_throttle
+
+    client.max_connections = max(client.max_connections, args.concurrency)
+    if args.backoff is not None:
+        client.backoff_factor = args.backoff
+        client.backoff_jitter = 0
+    if args.adaptive == False:
+        set_throttle(url, initial=args.concurrency, min_limit=args.concurrency, max_limit=args.concurrency)
+    instrument.reset()
+
+    start = time.perf_counter()
+    latencies, errors = globals()['_bench_' + name](url, args)
+    seconds = time.perf_counter() - start
+    retries = sum(v for (n, labels), v in instrument.snapshot()['counters'].items() if n == 'retries')
+    latencies = np.asarray(latencies) * 1000
+    return {
+        'benchmark': name,
+        'operations': len(latencies),
+        'errors': errors,
+        'retries': retries,
+        'seconds': seconds,
+        'ops_per_s': len(latencies) / seconds,
+        'p50_ms': float(np.percentile(latencies, 50)),
+        'p99_ms': float(np.percentile(latencies, 99)),
+        'peak_rss_mb': _peak_rss() / 1024**2
+    }
+
+
+def start_server(args):
+    '''
+    start the mock server in a child process
+
+    RETURNS:
+        process (subprocess.Popen): server process
+        url (str): endpoint of the server
+    '''
+    command = [sys.executable, '-m', 'benchmarks.mock_server', '--port', '0', '--latency', str(args.latency), '--jitter', str(args.jitter),
+               '--error-rate', str(args.error_rate), '--seed', str(args.seed)]
+    if args.responses is not None:
+        command += ['--responses', args.responses]
+    process = subprocess.Popen(command, stdout=subprocess.PIPE, cwd=os.path.dirname(os.path.dirname(os.path.abspath(__file__))), text=True)
+    url = process.stdout.readline().strip()
+    if not url.startswith('http'):
+        process.kill()
+        raise RuntimeError('the mock server did not start')
+    return process, url
+
+
+def compare(results, baseline, tolerance):
+    '''
+    compare results with a baseline
+
+    RETURNS:
+        regressions (list): (benchmark, key, baseline value, value) of all results, which are worse by more than tolerance
+    '''
+    baseline = {r['benchmark']: r for r in baseline}
+    regressions = []
+    for result in results:
+        base = baseline.get(result['benchmark'])
+        if base is None:
+            continue
+        for key, higher_is_better in COMPARED:
+            if higher_is_better and result[key] < base[key] * (1 - tolerance):
+                regressions.append((result['benchmark'], key, base[key], result[key]))
+            elif not higher_is_better and result[key] > base[key] * (1 + tolerance):
+                regressions.append((result['benchmark'], key, base[key], result[key]))
+    return regressions
+
+
+def print_results(results):
+    print('{:<12} {:>8} {:>7} {:>8} {:>10} {:>9} {:>9} {:>12}'.format(
+        'benchmark', 'ops', 'errors', 'retries', 'ops/s', 'p50 ms', 'p99 ms', 'peak RSS MB'))
+    for r in results:
+        print('{benchmark:<12} {operations:>8} {errors:>7} {retries:>8} {ops_per_s:>10.1f} {p50_ms:>9.2f} {p99_ms:>9.2f} {peak_rss_mb:>12.1f}'.format(**r))
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description='offline benchmarks against a mock rasdaman WCS server')
+    parser.add_argument('--benchmarks', default=','.join(BENCHMARKS), help='comma separated, any of ' + ', '.join(BENCHMARKS))
+    parser.add_argument('--requests', type=int, default=500, help='operations per network benchmark (x10 for parse_csv)')
+    parser.add_argument('--concurrency', type=int, default=8, help='threads of the network benchmarks')
+    parser.add_argument('--adaptive', action='store_true', help='keep the default adaptive throttle instead of fixing it to --concurrency')
+    parser.add_argument('--field-size', type=int, default=500, help='edge length of the S2 field in m')
+    parser.add_argument('--latency', type=float, default=0.0, help='server latency in seconds')
+    parser.add_argument('--jitter', type=float, default=0.0, help='additional uniform random server latency in seconds')
+    parser.add_argument('--error-rate', type=float, default=0.0, help='share of requests answered with 503')
+    parser.add_argument('--backoff', type=float, default=None, help='backoff factor of the client retries, e.g. 0.01 with --error-rate')
+    parser.add_argument('--responses', default=None, help='directory of recorded responses, see benchmarks.mock_server')
+    parser.add_argument('--repeat', type=int, default=1, help='runs per benchmark, the run with the median throughput is reported')
+    parser.add_argument('--seed', type=int, default=0)
+    parser.add_argument('--json', default=None, help='write the results to this file')
+    parser.add_argument('--compare', default=None, help='baseline results (--json of an earlier run)')
+    parser.add_argument('--tolerance', type=float, default=0.1, help='allowed relative regression. Defaults to 0.1.')
+    args = parser.parse_args(argv)
+
+    names = [name.strip() for name in args.benchmarks.split(',') if name.strip() != '']
+    unknown = [name for name in names if name not in BENCHMARKS]
+    if len(unknown) > 0:
+        parser.error('unknown benchmark {}, available: {}'.format(', '.join(unknown), ', '.join(BENCHMARKS)))
+
+    server, url = start_server(args)
+    results = []
+    try:
+        context = multiprocessing.get_context('spawn')
+        for name in names:
+            runs = []
+            for i in range(args.repeat):
+                # a fresh process per run: own peak RSS, no warm caches or connections of earlier runs
+                with ProcessPoolExecutor(max_workers=1, mp_context=context) as executor:
+                    runs.append(executor.submit(run_benchmark, name, url, args).result())
+            runs.sort(key=lambda r: r['ops_per_s'])
+            results.append(runs[len(runs) // 2])
+    finally:
+        server.terminate()
+        server.wait()
+
+    print_results(results)
+    if args.json is not None:
+        with open(args.json, 'w') as f:
+            json.dump({'options': vars(args), 'results': results}, f, indent=2)
+    if args.compare is not None:
+        with open(args.compare) as f:
+            regressions = compare(results, json.load(f)['results'], args.tolerance)
+        for name, key, base, value in regressions:
+            print('regression: {} {} {:.2f} -> {:.2f}'.format(name, key, base, value))
+        if len(regressions) > 0:
+            return 1
+    return 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
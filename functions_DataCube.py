@@ -17,7 +17,9 @@ def get_phases_from_point(year, crop, easting, northing, epsg, host, printout=Fa
         list_ (list): A list of the potential starting dates of the phenological stages.
     
     '''
-    import requests # python package to handle REST query
+    from jki_datacube.client import client # shared HTTP client (connection pool, retries, cache)
+    from jki_datacube.decode import parse_csv # rasdaman text/csv -> numpy array
+    from jki_datacube.query import WCSQuery # WCS query builder (encoding, POST for long URLs)
 
     try:
         date = str(year)+'-01-01' # multiband layers of the whole year are always stored at the 1st of january
@@ -46,32 +48,20 @@ def get_phases_from_point(year, crop, easting, northing, epsg, host, printout=Fa
         else:
             print('wrong name for crop name!')
         
-        service = '?&SERVICE=WCS'
-        version = '&VERSION=2.0.1'
-        request = '&REQUEST=GetCoverage'
-        coverage_id = '&COVERAGEID=' + rasdaman_layer
-        subset_time = '&SUBSET=ansi(\"' + date + '\")'
-        subsetting_crs = '&subsettingCrs=http://ows.rasdaman.org/def/crs/EPSG/0/' + str(epsg)
-        subset_lat = '&SUBSET=E(' + str(easting) + ',' + str(easting) + ')'
-        subset_long = '&SUBSET=N('+ str(northing) + ',' + str(northing) + ')'
-        output_crs = '&outputCrs=http://ows.rasdaman.org/def/crs/EPSG/0/' + str(epsg)
-        encode_format = '&FORMAT=text/csv'
-        
-        query = host + service + version + request + coverage_id + subset_time + subsetting_crs + subset_lat + subset_long + output_crs + encode_format
+        query = (WCSQuery(rasdaman_layer).subset('ansi', date).crs(epsg)
+                 .subset('E', easting, easting).subset('N', northing, northing).format('text/csv'))
         if get_query == True:
-            print(query)
+            print(query.url(host))
 
         # run query
-        img = requests.get(query)
+        img = client.send(query, host)
         
         # check if query successful
         if img.status_code == 200: # ststus code 200 means request wasd successful
             if printout==True:
                 print('request was sucessfull! Request Status: {}'.format(img.status_code))
             # transform binary result to python-like list
-            list_ =str(img.content).split('"')[1].split(' ') 
-            for ind, i in enumerate(list_):
-                list_[ind] = float(i)
+            list_ = parse_csv(img.content).ravel().tolist()
             return list_
         else:
             if printout==True:
@@ -94,55 +84,35 @@ def get_tif_rasdaman(shp, endpoint, user, pw, layer = 'Nalamki', EPSG = 32632, r
         list_ (list): 
     
     '''
-    # import sys
-    # sys.path.insert(1, '/path/to/crdentials.py')
-    import credentials
     import geopandas as gpd
-    import requests
-    from requests.auth import HTTPBasicAuth
+    from jki_datacube.client import client
+    from jki_datacube.misc import get_polygon_wkt
+    from jki_datacube.query import WCSQuery
     
     polygon = gpd.read_file(shp).to_crs('EPSG:32632')
-    polygon = str(polygon.geometry[0]).replace(' (', '(')
+    polygon = get_polygon_wkt(polygon.geometry[0])
 
     # set WCS query parameters
-    service = '?&SERVICE=WCS'
-    version = '&VERSION=2.0.1'
-    request = '&REQUEST=GetCoverage'
-    coverage_id = '&COVERAGEID=' + layer # set name of RASDAMAN layer here
-    subset_time = '&SUBSET=ansi(\"' + rDate + '\")'
-    subsetting_crs = '&subsettingCrs=http://ows.rasdaman.org/def/crs/EPSG/0/' + str(EPSG) # your EPSG code
-    clip = '&CLIP='+polygon
-    output_crs = '&outputCrs=http://ows.rasdaman.org/def/crs/EPSG/0/' + str(EPSG) # your EPSG code
-    encode_format = '&FORMAT=image/tiff'
-    rangesubset = '&RANGESUBSET='+band1+','+band2+','+band3
-
-    # build query string
-    query = endpoint + service + version + request + coverage_id + subset_time + subsetting_crs + clip + output_crs + encode_format + rangesubset
+    query = WCSQuery(layer).subset('ansi', rDate).crs(EPSG).clip(polygon).format('image/tiff').range_subset(band1, band2, band3)
     if get_query == True:
-        print(query)
+        print(query.url(endpoint))
 
-    # run WCS query
-    img = requests.get(query, auth=HTTPBasicAuth(user, pw))
+    # run WCS query (sent as POST if the polygon makes the URL too long),
+    # 429 and 5xx responses are retried by the shared client with bounded backoff
+    img = client.send(query, endpoint, auth=(user, pw))
     # if printout == True:
     #     print('request status = {}'.format(img.status_code))
     
     try:
-        if img.status_code != 200 and img.status_code != 404:
+        if img.status_code == 200:
             if printout==True:
-                print('bad request, trying again!')
-            counter = 0
-            while img.status_code != 200:
-                img = requests.get(query, auth=HTTPBasicAuth(credentials.ras_user, credentials.ras_pw))
-                counter += 1
-            else:
-                if printout==True:
-                    print('now it worked after {} trails: {}'.format(counter, img.status_code))
+                print('request status successful (200)')
         elif img.status_code == 404:
             if printout == True:
                 print('request error {}! something does not work'.format(img.status_code))
-        elif img.status_code == 200:
+        else:
             if printout==True:
-                print('request status successful (200)')
+                print('request failed after {} retries: {}'.format(client.retries, img.status_code))
     except Exception as e:
         print('something went wrong: {}'.format(e))
         
@@ -160,45 +130,26 @@ def get_REGNIE_from_point(startdate, enddate, layer, easting, northing, epsg, us
         list_ (list): 
     
     '''
-    # import sys
-    # sys.path.insert(1, '/path/to/crdentials.py')
-    import credentials
-    import requests
-    from requests.auth import HTTPBasicAuth
-    import requests
-    from pyproj import Transformer
+    from jki_datacube.client import client
+    from jki_datacube.crs import transform_coords
+    from jki_datacube.decode import parse_csv
+    from jki_datacube.query import WCSQuery
     try:
                 
-        if epsg == 4326:
-            y=northing
-            x=easting
-        else:
-            transformer = Transformer.from_crs("epsg:"+str(epsg), "epsg:4326")
-            y,x = transformer.transform(easting,northing)
+        x,y = transform_coords(float(easting), float(northing), epsg, 4326)
 
 
-        url = host
-        service = '?&SERVICE=WCS'
-        version = '&VERSION=2.0.1'
-        request = '&REQUEST=GetCoverage'
-        coverage_id = '&COVERAGEID=' + layer
-        subset_time = '&SUBSET=ansi("' + startdate + '","' + enddate + '")'
-        subset_lat = '&SUBSET=Lon(' + str(float(x)) + ')'
-        subset_long = '&SUBSET=Lat(' + str(float(y)) + ')'
-        encode_format = '&FORMAT=text/csv'
-        
-        query = url + service + version + request + coverage_id + subset_time + subset_lat + subset_long + encode_format         
+        query = WCSQuery(layer).subset('ansi', startdate, enddate).subset('Lon', float(x)).subset('Lat', float(y)).format('text/csv')
         if get_query == True:
-            print(query)
+            print(query.url(host))
         
         # run querry
-        img = requests.get(query, auth=HTTPBasicAuth(user, passwd))
+        img = client.send(query, host, auth=(user, passwd))
         
         if img.status_code == 200:
             if printout==True:
                 print('request was sucessfull! Request Status: {}'.format(img.status_code))
-            float_map = map(float, str(img.content).split("'")[1].split(','))
-            float_list = list(float_map)
+            float_list = parse_csv(img.content).ravel().tolist()
             
             if float_list[0] != -9999:
                 return float_list
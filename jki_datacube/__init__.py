@@ -0,0 +1,106 @@
+'''
+jki_datacube - query the JKI DataCube (rasdaman WCS/WCPS) from Python
+
+The functions are organised in submodules:
+
+    phase       PHASE data cube (phenological stages)
+    s2          Sentinel-2 data cube (restricted access)
+    dwd         precipitation data cube
+    misc        additional functions used in the notebook
+    decode      decoding of WCS responses (csv, netCDF)
+    cache       persistent on-disk cache for WCS responses
+    query       immutable WCS query builder (WCSQuery)
+    client      shared HTTP client (connection pool, retries with backoff, timeouts)
+    throttle    per-host rate limit and adaptive concurrency
+    instrument  per-stage timings and counters (Prometheus, OpenTelemetry)
+    crs         cached coordinate transformations
+    catalog     disk-cached metadata catalog of a data cube service
+    index       vegetation/water indices
+    store       memory-mapped local store of downloaded time series
+    incremental daily updates of stored time series (watermark + lookback)
+    aggregate   per-field statistics tables
+    aio         asyncio counterparts of the fetchers (httpx)
+    pipeline    overlapping fetch and compute stages with bounded queues
+    batch       resumable batch processing of whole field layers
+    tiling      tiled requests for neighbouring fields
+
+Importing the package is cheap: submodules are imported on first access, e.g. jki_datacube.get_phases_from_point
+imports jki_datacube.phase, and heavy dependencies (rasterio/GDAL, geopandas, pyproj, netCDF4, pyarrow, xmltodict)
+are loaded only when a function actually needs them.
+'''
+import importlib
+
+_SUBMODULES = ('phase', 's2', 'dwd', 'misc', 'decode', 'query', 'cache', 'client', 'throttle', 'instrument', 'crs', 'catalog', 'index', 'store', 'incremental', 'aggregate', 'aio', 'pipeline', 'batch', 'tiling')
+
+# public name -> submodule
+_EXPORTS = {
+    'PHASE_LAYERS': 'phase',
+    'get_phases_from_point': 'phase',
+    'get_phases_from_points': 'phase',
+    'PhaseTable': 'phase',
+    'build_phase_table': 'phase',
+    'add_phase_table': 'phase',
+    'get_S2_imagery': 's2',
+    'get_S2_imagery_range': 's2',
+    'get_S2_stack': 's2',
+    'unpack_S2_stack': 's2',
+    'get_S2_timeseries': 's2',
+    'get_S2_acquisition_dates': 's2',
+    'build_valid_pixel_wcps': 's2',
+    'get_S2_valid_pixel_portion': 's2',
+    'get_S2_available_dates': 's2',
+    'build_index_wcps': 's2',
+    'get_S2_index': 's2',
+    'get_S2_index_statistics': 's2',
+    'get_S2_tile': 's2',
+    'get_precipitation_from_point': 'dwd',
+    'get_precipitation_from_points': 'dwd',
+    'get_coverages': 'misc',
+    'get_metadata_from_datacube': 'misc',
+    'calculate_savi': 'misc',
+    'get_map': 'misc',
+    'get_all_dates': 'misc',
+    'decode_netcdf': 'decode',
+    'decode_ansi_dates': 'decode',
+    'parse_csv': 'decode',
+    'parse_csv_response': 'decode',
+    'WCSQuery': 'query',
+    'get_crs_url': 'query',
+    'WCSCache': 'cache',
+    'set_cache': 'cache',
+    'get_cache': 'cache',
+    'DatacubeClient': 'client',
+    'set_throttle': 'throttle',
+    'get_metrics': 'throttle',
+    'transform_coords': 'crs',
+    'CoverageInfo': 'catalog',
+    'DatacubeCatalog': 'catalog',
+    'get_catalog': 'catalog',
+    'calculate_index': 'index',
+    'get_valid_pixel_portion': 'index',
+    'FieldStore': 'store',
+    'update_S2_field': 'incremental',
+    'update_precipitation': 'incremental',
+    'FieldStatsTable': 'aggregate',
+    'AsyncDatacubeClient': 'aio',
+    'get_S2_savi_range': 'pipeline',
+    'process_fields': 'batch',
+    'plan_tiles': 'tiling',
+    'get_S2_imagery_tiles': 'tiling'
+}
+
+__all__ = list(_EXPORTS)
+
+
+def __getattr__(name):
+    if name in _SUBMODULES:
+        return importlib.import_module('.' + name, __name__)
+    if name in _EXPORTS:
+        value = getattr(importlib.import_module('.' + _EXPORTS[name], __name__), name)
+        globals()[name] = value # later lookups do not pass through __getattr__
+        return value
+    raise AttributeError("module %r has no attribute %r" % (__name__, name))
+
+
+def __dir__():
+    return sorted(set(globals()) | set(_EXPORTS) | set(_SUBMODULES))
@@ -0,0 +1,60 @@
+'''
+lazy module imports
+
+Heavy dependencies (rasterio/GDAL, geopandas, pyproj, netCDF4, pyarrow, xmltodict, requests, ipyleaflet) are bound at
+module level, but imported only when one of their attributes is used for the first time. Importing the package, building
+queries or parsing CSV responses thus does not load them, and functions called in loops do not repeat import statements.
+'''
+import importlib
+import sys
+
+
+class LazyModule:
+    '''
+    placeholder of a module, which is imported on first attribute access
+
+    PARAMETERS:
+        name (str): absolute module name, e.g. 'rasterio.mask'
+    '''
+
+    def __init__(self, name):
+        self.__dict__['_name'] = name
+        self.__dict__['_module'] = None
+
+    def _load(self):
+        module = self.__dict__['_module']
+        if module is None:
+            # importlib serializes concurrent imports of the same module
+            module = importlib.import_module(self.__dict__['_name'])
+            self.__dict__['_module'] = module
+        return module
+
+    def __getattr__(self, attr):
+        value = getattr(self._load(), attr)
+        # later lookups of the attribute no longer pass through __getattr__
+        self.__dict__[attr] = value
+        return value
+
+    def __setattr__(self, attr, value):
+        setattr(self._load(), attr, value)
+
+    def __repr__(self):
+        state = 'loaded' if self.__dict__['_module'] is not None else 'not loaded'
+        return "<lazy module '%s' (%s)>" % (self.__dict__['_name'], state)
+
+
+def lazy_import(name):
+    '''
+    bind a module without importing it, the import happens on first attribute access.
+    Modules, which are imported already, are returned directly.
+
+    PARAMETERS:
+        name (str): absolute module name, e.g. 'geopandas' or 'pyarrow.parquet'
+
+    RETURNS:
+        module (module or LazyModule): the module or a placeholder, which imports it on first use
+    '''
+    module = sys.modules.get(name)
+    if module is not None:
+        return module
+    return LazyModule(name)
@@ -0,0 +1,175 @@
+import warnings
+from datetime import date
+
+import numpy as np
+
+from ._lazy import lazy_import
+from .misc import calculate_savi
+
+pa = lazy_import('pyarrow')
+pq = lazy_import('pyarrow.parquet')
+
+
+DEFAULT_STATISTICS = ('mean', 'median', 'p10', 'p90', 'count')
+
+
+def get_statistics(image, statistics=DEFAULT_STATISTICS):
+    '''
+    reduce an index image (NaN = no data) or a stack of images to summary statistics of the valid pixels
+
+    PARAMETERS:
+        image (numpy.ndarray): index with shape (y, x) or a time series with shape (time, y, x)
+        statistics (tuple(opt)): any of mean, median, std, min, max, count (valid pixels) and percentiles pXX (e.g. p10).
+            Defaults to DEFAULT_STATISTICS.
+
+    RETURNS:
+        values (dict): statistic -> value (single image) or numpy array with one value per time slice
+
+    '''
+    data = np.asarray(image).reshape(image.shape[:-2] + (-1,))
+    percentiles = [s for s in statistics if s.startswith('p')]
+    values = {}
+    with warnings.catch_warnings():
+        # images without valid pixels give NaN, which is the expected result
+        warnings.simplefilter('ignore', category=RuntimeWarning)
+        for s in statistics:
+            if s == 'mean':
+                values[s] = np.nanmean(data, axis=-1)
+            elif s == 'median':
+                values[s] = np.nanmedian(data, axis=-1)
+            elif s == 'std':
+                values[s] = np.nanstd(data, axis=-1)
+            elif s == 'min':
+                values[s] = np.nanmin(data, axis=-1)
+            elif s == 'max':
+                values[s] = np.nanmax(data, axis=-1)
+            elif s == 'count':
+                values[s] = np.count_nonzero(~np.isnan(data), axis=-1)
+            elif s not in percentiles:
+                raise ValueError('unknown statistic {}'.format(s))
+        if len(percentiles) > 0:
+            q = np.nanpercentile(data, [float(s[1:]) for s in percentiles], axis=-1)
+            for s, v in zip(percentiles, q):
+                values[s] = v
+    return values
+
+
+class FieldStatsTable:
+    '''
+    columnar table (Apache Parquet) of per-field, per-date index statistics, which is written in row groups,
+    so memory stays constant regardless of season length or number of fields
+
+    PARAMETERS:
+        path (str): path of the parquet file
+        statistics (tuple(opt)): statistics of every image, see get_statistics. Defaults to DEFAULT_STATISTICS.
+        batch_size (int(opt)): number of rows buffered before a row group is written. Defaults to 10000.
+
+    Usage:
+        with FieldStatsTable('savi_2020.parquet') as table:
+            for date, img in get_S2_imagery_range(...):
+                index = calculate_savi(img)
+                if isinstance(index, list):
+                    table.add('field_1', date, index[0])
+    '''
+
+    def __init__(self, path, statistics=DEFAULT_STATISTICS, batch_size=10000):
+        self.path = path
+        self.statistics = tuple(statistics)
+        self.batch_size = batch_size
+        self._writer = None
+        self._rows = 0
+        self._columns = {name: [] for name in ('field_id', 'date') + self.statistics}
+
+    def _schema(self):
+        fields = [pa.field('field_id', pa.string()), pa.field('date', pa.date32())]
+        for s in self.statistics:
+            fields.append(pa.field(s, pa.int64() if s == 'count' else pa.float32()))
+        return pa.schema(fields)
+
+    def add(self, field_id, date, image):
+        '''
+        reduce one index image of a field to its statistics and append them to the table
+
+        PARAMETERS:
+            field_id (str): field ID
+            date (str): acquisition date YYYY-MM-DD
+            image (numpy.ndarray): index with shape (y, x), NaN = no data
+        '''
+        self.add_rows([field_id], [date], get_statistics(image, self.statistics))
+
+    def add_stack(self, field_id, dates, stack):
+        '''
+        reduce a time series of index images of a field and append one row per date
+
+        PARAMETERS:
+            field_id (str): field ID
+            dates (list): acquisition dates YYYY-MM-DD
+            stack (numpy.ndarray): index with shape (time, y, x), NaN = no data
+        '''
+        self.add_rows([field_id] * len(dates), dates, get_statistics(stack, self.statistics))
+
+    def add_rows(self, field_ids, dates, values):
+        '''
+        append already reduced rows, values maps every statistic to a value or an array of values
+        '''
+        self._columns['field_id'].extend(str(f) for f in field_ids)
+        self._columns['date'].extend(d if isinstance(d, date) else date.fromisoformat(d) for d in dates)
+        for s in self.statistics:
+            self._columns[s].extend(np.atleast_1d(values[s]).tolist())
+        self._rows += len(field_ids)
+        if self._rows >= self.batch_size:
+            self.flush()
+
+    def flush(self):
+        '''
+        write the buffered rows as row group
+        '''
+        if self._rows == 0:
+            return
+        schema = self._schema()
+        if self._writer is None:
+            self._writer = pq.ParquetWriter(self.path, schema)
+        self._writer.write_table(pa.table(self._columns, schema=schema))
+        self._columns = {name: [] for name in self._columns}
+        self._rows = 0
+
+    def close(self):
+        '''
+        write the remaining rows and close the file
+        '''
+        self.flush()
+        if self._writer is not None:
+            self._writer.close()
+            self._writer = None
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc_value, traceback):
+        self.close()
+
+
+def aggregate_S2_imagery(field_id, results, table, valid_pixel_portion=50, noData=0):
+    '''
+    pipeline stage: calculate the SAVI of every incoming Sentinel-2 image and keep only its statistics
+
+    PARAMETERS:
+        field_id (str): field ID
+        results (iterable): (date, response) tuples, e.g. from get_S2_imagery_range
+        table (FieldStatsTable): table, which receives one row per valid image
+        valid_pixel_portion (float(opt)): minimum portion of valid pixels [in %]. Defaults to 50.
+        noData (int(opt)): no data value of the bands. Defaults to 0.
+
+    RETURNS:
+        n (int): number of images added to the table
+
+    '''
+    n = 0
+    for date, img in results:
+        if img is None or img.status_code != 200:
+            continue
+        index = calculate_savi(img, valid_pixel_portion=valid_pixel_portion, noData=noData)
+        if isinstance(index, list):
+            table.add(field_id, date, index[0])
+            n += 1
+    return n
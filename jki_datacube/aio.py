@@ -0,0 +1,357 @@
+'''
+asyncio counterparts of the data cube fetchers (requires httpx)
+
+All coroutines send their requests through the module-level `aclient`, which keeps one httpx.AsyncClient
+connection pool per event loop, limits the number of concurrent requests per host with semaphores and retries
+429 and 5xx responses with bounded exponential backoff and jitter. Answers are taken from and stored in the same
+response cache as the synchronous fetchers (see jki_datacube.cache), the cache is read and written in a worker
+thread, so its disk I/O does not block the event loop.
+
+    import asyncio
+    from jki_datacube import aio
+
+    async def main(points):
+        return await asyncio.gather(*[aio.get_phases_from_point('2020', 'winterwheat', x, y, host) for x, y in points])
+
+Every coroutine can be cancelled (task.cancel(), asyncio.wait_for, asyncio.TaskGroup): the request is aborted
+and its connection and semaphore slot are released immediately.
+'''
+import asyncio
+import random
+import time
+
+from . import instrument
+from ._lazy import lazy_import
+from .cache import get_cache
+from .catalog import get_catalog, capabilities_document, description_document, parse_capabilities
+from .decode import parse_csv
+from .dwd import _get_point_query as _get_precipitation_query, _parse_precipitation
+from .phase import PHASE_LAYERS, _get_point_query as _get_phase_query
+from .s2 import _get_imagery_query
+from .throttle import get_throttle, _get_netloc
+
+httpx = lazy_import('httpx')
+xmltodict = lazy_import('xmltodict')
+
+
+class AsyncDatacubeClient:
+    '''
+    pooled asyncio HTTP client with per-host concurrency limits and retry/backoff for WCS and WCPS requests
+
+    PARAMETERS:
+        max_connections (int(opt)): connections of the pool over all hosts. Defaults to 256.
+        max_per_host (int(opt)): concurrent requests per host, further requests wait for a free slot. Defaults to 32.
+        retries (int(opt)): maximum number of retries of a failed request. Defaults to 5.
+        backoff_factor (float(opt)): base of the exponential backoff in seconds (factor * 2**retry). Defaults to 0.5.
+        backoff_max (float(opt)): upper bound of a single backoff in seconds. Defaults to 30.
+        backoff_jitter (float(opt)): random jitter in seconds added to every backoff. Defaults to 0.5.
+        timeout (float or tuple(opt)): (connect, read) timeout in seconds of every request. Defaults to (10, 300).
+        status_forcelist (tuple(opt)): status codes, which are retried. Defaults to 429, 500, 502, 503, 504.
+    '''
+
+    def __init__(self, max_connections=256, max_per_host=32, retries=5, backoff_factor=0.5, backoff_max=30, backoff_jitter=0.5,
+                 timeout=(10, 300), status_forcelist=(429, 500, 502, 503, 504)):
+        self.max_connections = max_connections
+        self.max_per_host = max_per_host
+        self.retries = retries
+        self.backoff_factor = backoff_factor
+        self.backoff_max = backoff_max
+        self.backoff_jitter = backoff_jitter
+        self.timeout = timeout
+        self.status_forcelist = status_forcelist
+        self._auth = {}
+        self._limits = {}
+        self._session = None
+        self._semaphores = {}
+        self._loop = None
+
+    def _bind(self):
+        # connections and semaphores belong to one event loop, a new loop (e.g. a second asyncio.run) gets new ones
+        loop = asyncio.get_running_loop()
+        if loop is not self._loop:
+            self._loop = loop
+            self._session = None
+            self._semaphores = {}
+
+    @property
+    def session(self):
+        '''
+        the pooled httpx.AsyncClient of the running event loop, created on first use
+        '''
+        self._bind()
+        if self._session is None:
+            timeout = self.timeout
+            if isinstance(timeout, tuple):
+                timeout = httpx.Timeout(timeout[1], connect=timeout[0])
+            limits = httpx.Limits(max_connections=self.max_connections, max_keepalive_connections=self.max_connections)
+            self._session = httpx.AsyncClient(limits=limits, timeout=timeout)
+        return self._session
+
+    def set_auth(self, host, user, pw):
+        '''
+        configure basic auth credentials for all requests to a host
+
+        PARAMETERS:
+            host (str): host adress of the data cube service (only scheme and network location are used)
+            user (str): credentials username
+            pw (str): credentials password
+        '''
+        self._auth[_get_netloc(host)] = (user, pw)
+
+    def set_limit(self, host, max_per_host):
+        '''
+        set the number of concurrent requests to a host, e.g. lower for hosts with little capacity
+        '''
+        self._limits[_get_netloc(host)] = max_per_host
+        self._semaphores.pop(_get_netloc(host), None)
+
+    def _semaphore(self, netloc):
+        self._bind()
+        if netloc not in self._semaphores:
+            self._semaphores[netloc] = asyncio.Semaphore(self._limits.get(netloc, self.max_per_host))
+        return self._semaphores[netloc]
+
+    def _backoff(self, retry, response=None):
+        if response is not None:
+            retry_after = response.headers.get('Retry-After', '')
+            if retry_after.isdigit():
+                return min(float(retry_after), self.backoff_max)
+        return min(self.backoff_factor * 2 ** retry, self.backoff_max) + random.uniform(0, self.backoff_jitter)
+
+    async def request(self, method, url, data=None, auth=None, timeout=None, use_cache=True):
+        '''
+        send a request, answer it from the response cache if possible
+
+        PARAMETERS:
+            method (str): GET or POST
+            url (str): request URL
+            data (dict or list(opt)): POST parameters as dict or list of (name, value) tuples. Defaults to None.
+            auth (tuple(opt)): (user, pw) for basic auth, defaults to the credentials configured with set_auth for this host.
+            timeout (float(opt)): request timeout, defaults to the timeout of the client.
+            use_cache (bool(opt)): If False, the response cache is bypassed. Defaults to True.
+
+        RETURNS:
+            response (httpx.Response or requests.models.Response): response object (status_code, content, text, url),
+                a requests.models.Response if it was answered from the cache
+        '''
+        netloc = _get_netloc(url)
+        cache = get_cache() if use_cache else None
+        if cache is not None:
+            response = await asyncio.to_thread(cache.get_response, url, data)
+            if response is not None:
+                instrument.count('cache_hits', host=netloc)
+                return response
+            instrument.count('cache_misses', host=netloc)
+
+        if auth is None or auth == ('', ''):
+            # no (or empty) credentials given -> use the credentials configured for this host
+            auth = self._auth.get(netloc)
+        kwargs = {} if timeout is None else {'timeout': timeout}
+        form = data
+        if data is not None and not isinstance(data, dict):
+            # httpx takes repeated form fields (e.g. SUBSET) as lists
+            form = {}
+            for name, value in data:
+                form.setdefault(name, []).append(value)
+
+        throttle = get_throttle(url)
+        retry = 0
+        while True:
+            response = None
+            try:
+                # rate limit and adaptive concurrency of the host (see jki_datacube.throttle), max_per_host is a hard limit
+                wait = time.monotonic()
+                async with throttle.slot_async(), self._semaphore(netloc):
+                    start = time.monotonic()
+                    instrument.record('throttle', start - wait, host=netloc)
+                    times = {}
+                    try:
+                        response = await self.session.request(method, url, data=form, auth=auth, extensions={'trace': _get_trace(times)}, **kwargs)
+                    except httpx.TransportError:
+                        throttle.record(time.monotonic() - start)
+                        raise
+                    end = time.monotonic()
+                    throttle.record(end - start, response.status_code)
+                _instrument_response(response, netloc, times, end)
+            except httpx.TransportError:
+                instrument.count('errors', host=netloc)
+                if retry >= self.retries:
+                    raise
+            else:
+                if response.status_code not in self.status_forcelist or retry >= self.retries:
+                    break
+            # the slot is released while waiting, so other requests to the host are not blocked
+            await asyncio.sleep(self._backoff(retry, response))
+            retry += 1
+            instrument.count('retries', host=netloc)
+
+        if cache is not None and response.status_code == 200:
+            await asyncio.to_thread(cache.put_response, url, data, response)
+        return response
+
+    async def get(self, url, auth=None, **kwargs):
+        '''
+        send a GET request, see request
+        '''
+        return await self.request('GET', url, auth=auth, **kwargs)
+
+    async def post(self, url, data=None, auth=None, **kwargs):
+        '''
+        send a POST request, see request
+        '''
+        return await self.request('POST', url, data=data, auth=auth, **kwargs)
+
+    async def send(self, query, host, auth=None, **kwargs):
+        '''
+        send a WCSQuery, as GET request or as POST request with a form body if the URL is too long (see jki_datacube.query)
+        '''
+        with instrument.stage('build'):
+            method, url, data = query.to_request(host)
+        return await self.request(method, url, data=data, auth=auth, **kwargs)
+
+    async def aclose(self):
+        '''
+        close all pooled connections
+        '''
+        if self._session is not None:
+            await self._session.aclose()
+            self._session = None
+
+    async def __aenter__(self):
+        return self
+
+    async def __aexit__(self, *exc):
+        await self.aclose()
+
+
+def _get_trace(times):
+    # httpx/httpcore trace callback, which stores the time of every connection and HTTP event
+    async def trace(event_name, info):
+        times[event_name.split('.', 1)[-1]] = time.monotonic()
+    return trace
+
+
+def _instrument_response(response, netloc, times, end):
+    instrument.count('requests', host=netloc, status=response.status_code)
+    instrument.count('bytes', len(response.content), host=netloc)
+    connect_start = times.get('connect_tcp.started')
+    connect_end = times.get('start_tls.complete', times.get('connect_tcp.complete'))
+    if connect_start is not None and connect_end is not None:
+        # DNS lookup, TCP and TLS handshake of a new connection
+        instrument.record('connect', connect_end - connect_start, host=netloc)
+    sent = times.get('send_request_headers.started')
+    headers = times.get('receive_response_headers.complete')
+    if sent is not None and headers is not None:
+        instrument.record('ttfb', headers - sent, host=netloc)
+    if headers is not None:
+        instrument.record('download', end - headers, host=netloc)
+
+
+# the client used by all coroutines
+aclient = AsyncDatacubeClient()
+
+
+def _check_response(response, printout):
+    # same reporting as the synchronous fetchers, True if the request was successful
+    if response.status_code == 200:
+        if printout==True:
+            print('request was sucessfull! Request Status: {}'.format(response.status_code))
+        return True
+    if printout==True:
+        print('something went wrong. Request was answered with request code: {}. URL: {}'.format(response.status_code, response.url))
+        print('response content: ', response.text)
+    return False
+
+
+async def get_phases_from_point(year, crop, easting, northing, host, epsg=32632, printout=False, get_query=False):
+    '''
+    get PHASE data from JKI DataCube, see jki_datacube.phase.get_phases_from_point
+
+    RETURNS:
+        list_ (list): A list of the potential starting dates of the phenological stages,
+            the response object if the request failed
+    '''
+    if crop not in PHASE_LAYERS:
+        print('wrong name for crop name!')
+        return None
+    query = _get_phase_query(PHASE_LAYERS[crop], year, easting, northing, epsg)
+    if get_query == True:
+        print(query.url(host))
+
+    response = await aclient.send(query, host)
+    if _check_response(response, printout):
+        return parse_csv(response.content).ravel().tolist()
+    return response
+
+
+async def get_precipitation_from_point(startdate, enddate, layer, easting, northing, host, user='', pw='', epsg=32632, printout=False,
+                                       get_query=False, use_credentials=False):
+    '''
+    get precipitation data from JKI DataCube, see jki_datacube.dwd.get_precipitation_from_point
+
+    RETURNS:
+        float_list (list): list of daily sums of precipitation in mm as float numbers, the response object if the request failed
+    '''
+    query = _get_precipitation_query(startdate, enddate, layer, easting, northing, epsg)
+    if get_query == True:
+        print(query.url(host))
+
+    response = await aclient.send(query, host, auth=(user, pw) if use_credentials == True else None)
+    if _check_response(response, printout):
+        return _parse_precipitation(response.content)
+    return response
+
+
+async def get_S2_imagery(polygon, layer, date, user, pw, host, epsg=32632, band1='NIR10', band2='R', band3='G', band_subset=True,
+                         printout=False, get_query=False):
+    '''
+    get a clipped Sentinel-2 image from JKI-CODE-DE DataCube, see jki_datacube.s2.get_S2_imagery
+
+    RETURNS:
+        response (httpx.Response or requests.models.Response): response object, in which the cropped S2-image is stored as GeoTIFF
+    '''
+    query = _get_imagery_query(polygon, layer, date, epsg, band1, band2, band3, band_subset)
+    if get_query == True:
+        print(query.url(host))
+
+    response = await aclient.send(query, host, auth=(user, pw))
+    _check_response(response, printout)
+    return response
+
+
+async def _fetch_document(catalog, name, query):
+    # async version of DatacubeCatalog._fetch, sharing its disk cache (read and written in a worker thread)
+    content = await asyncio.to_thread(catalog._read_cached, name)
+    if content is not None:
+        return content
+    response = await aclient.get(catalog.host + query, auth=catalog.auth)
+    if response.status_code != 200:
+        raise RuntimeError('request was answered with request code: {}. URL: {}'.format(response.status_code, response.url))
+    await asyncio.to_thread(catalog._write_cached, name, response.content)
+    return response.content
+
+
+async def get_coverages(host, user='', pw='', use_credentials=False):
+    '''
+    get a list of all available data cubes, see jki_datacube.misc.get_coverages
+    '''
+    catalog = get_catalog(host, user=user, pw=pw, use_credentials=use_credentials)
+    name, query = capabilities_document()
+    coverages = catalog._recall(name)
+    if coverages is None:
+        coverages = parse_capabilities(await _fetch_document(catalog, name, query))
+        await asyncio.to_thread(catalog._remember, name, name, coverages)
+    return list(coverages)
+
+
+async def get_metadata_from_datacube(layer, host, user='', pw='', use_credentials=False):
+    '''
+    get the metadata (DescribeCoverage) of a data cube as dictionary, see jki_datacube.misc.get_metadata_from_datacube
+    '''
+    catalog = get_catalog(host, user=user, pw=pw, use_credentials=use_credentials)
+    name, query = description_document(layer)
+    metadata = catalog._recall(name)
+    if metadata is None:
+        metadata = xmltodict.parse(await _fetch_document(catalog, name, query))
+        await asyncio.to_thread(catalog._remember, name, name, metadata)
+    return metadata
@@ -0,0 +1,166 @@
+import os
+import uuid
+from concurrent.futures import ProcessPoolExecutor, FIRST_COMPLETED, wait
+
+from ._lazy import lazy_import
+from .aggregate import get_statistics, FieldStatsTable, DEFAULT_STATISTICS
+from .client import client
+from .misc import get_polygon_wkt
+from .pipeline import get_S2_savi_range
+from .s2 import get_S2_available_dates
+
+gpd = lazy_import('geopandas')
+
+
+def process_field(task):
+    '''
+    worker function of process_fields: fetch all Sentinel-2 images of one field, calculate the SAVI 
+    and reduce every image to its statistics
+    
+    PARAMETERS:
+        task (dict): field_id, polygon (WKT) and the request parameters of process_fields
+        
+    RETURNS:
+        field_id (str): field ID
+        rows (dict): 'date' (list) and one list per statistic, None if the field failed
+        error (str): error message, None if the field was processed
+    
+    '''
+    try:
+        dates = None
+        if task['available_dates'] == True:
+            dates = get_S2_available_dates(task['polygon'], task['layer'], task['startdate'], task['enddate'], task['user'], task['pw'], task['host'],
+                                           epsg=task['epsg'], valid_pixel_portion=task['valid_pixel_portion'])
+        rows = {name: [] for name in ('date',) + tuple(task['statistics'])}
+        # downloads overlap with decoding, the fields are already spread over the processes -> one compute thread
+        results = get_S2_savi_range(task['polygon'], task['layer'], task['startdate'], task['enddate'], task['user'], task['pw'], task['host'],
+                                    epsg=task['epsg'], valid_pixel_portion=task['valid_pixel_portion'], dates=dates,
+                                    fetch_workers=task['max_requests'], compute_workers=1)
+        for date, index in results:
+            if index is not None:
+                rows['date'].append(date)
+                for s, v in get_statistics(index[0], task['statistics']).items():
+                    rows[s].append(float(v))
+        return task['field_id'], rows, None
+    except Exception as e:
+        return task['field_id'], None, '{}: {}'.format(type(e).__name__, e)
+
+
+def _init_worker():
+    # connections must not be shared with the parent process
+    client.close()
+
+
+def _read_checkpoint(path):
+    if not os.path.exists(path):
+        return set()
+    with open(path) as f:
+        return set(line.strip() for line in f if line.strip() != '')
+
+
+def process_fields(fields, layer, startdate, enddate, user, pw, host, output, id_column=None, checkpoint=None, epsg=32632, valid_pixel_portion=50, 
+                   statistics=None, available_dates=False, max_workers=4, max_requests=4, checkpoint_every=100, printout=True):
+    '''
+    calculate SAVI statistics of all Sentinel-2 acquisitions for every field of a shapefile/GeoDataFrame
+    
+    The fields are distributed over a process pool, every worker builds the WKT, fetches and reduces the images 
+    of one field at a time (see process_field). At most max_workers * max_requests requests are in flight.
+    Results are written as parquet files (one per checkpoint) into the output directory, finished field IDs are 
+    appended to the checkpoint file, so an interrupted run continues where it stopped.
+    
+    PARAMETERS:
+        fields (str or geopandas.GeoDataFrame): path of a vector file or GeoDataFrame with the field polygons
+        layer (str): layer name of the data cube (coverage ID)
+        startdate (str): YYYY-MM-DD
+        enddate (str): YYYY-MM-DD (included)
+        user (str): credentials username
+        pw (str): credentials password
+        host (str): host adress of data cube service
+        output (str): output directory of the parquet files
+        id_column (str(opt)): column with unique field IDs. Defaults to None (row index).
+        checkpoint (str(opt)): path of the checkpoint file. Defaults to None (output/_done.txt).
+        epsg (int(opt)): CRS of the requests, the fields are reprojected. Defaults to 32632.
+        valid_pixel_portion (float(opt)): minimum portion of valid pixels [in %]. Defaults to 50.
+        statistics (tuple(opt)): statistics of every image, see jki_datacube.aggregate.get_statistics. Defaults to jki_datacube.aggregate.DEFAULT_STATISTICS.
+        available_dates (bool(opt)): If True, only dates passing the valid pixel portion on the server are downloaded (see get_S2_available_dates). Defaults to False.
+        max_workers (int(opt)): number of worker processes. Defaults to 4.
+        max_requests (int(opt)): number of concurrent requests per worker. Defaults to 4.
+        checkpoint_every (int(opt)): number of finished fields per parquet file/checkpoint. Defaults to 100.
+        printout (bool(opt)): If True, a progress bar and failed fields are printed. Defaults to True.
+        
+    RETURNS:
+        failed (dict): field ID -> error message of all fields, which could not be processed
+    
+    '''
+    statistics = DEFAULT_STATISTICS if statistics is None else tuple(statistics)
+    os.makedirs(output, exist_ok=True)
+    checkpoint = os.path.join(output, '_done.txt') if checkpoint is None else checkpoint
+    done = _read_checkpoint(checkpoint)
+
+    if isinstance(fields, str):
+        fields = gpd.read_file(fields)
+    fields = fields.to_crs('EPSG:' + str(epsg))
+    ids = fields.index if id_column is None else fields[id_column]
+
+    def tasks():
+        for field_id, geometry in zip(ids, fields.geometry):
+            if str(field_id) in done or geometry is None:
+                continue
+            yield {
+                'field_id': str(field_id), 'polygon': get_polygon_wkt(geometry), 'layer': layer, 'startdate': startdate, 'enddate': enddate,
+                'user': user, 'pw': pw, 'host': host, 'epsg': epsg, 'valid_pixel_portion': valid_pixel_portion, 'statistics': statistics,
+                'available_dates': available_dates, 'max_requests': max_requests
+            }
+
+    pending_ids = []
+    pending_rows = []
+    failed = {}
+
+    def write_checkpoint():
+        if len(pending_ids) == 0:
+            return
+        with FieldStatsTable(os.path.join(output, 'part-' + uuid.uuid4().hex + '.parquet'), statistics) as table:
+            for field_id, rows in pending_rows:
+                table.add_rows([field_id] * len(rows['date']), rows['date'], rows)
+        # the results are on disk before the fields are marked as done
+        with open(checkpoint, 'a') as f:
+            f.write(''.join(field_id + '\n' for field_id in pending_ids))
+        pending_ids.clear()
+        pending_rows.clear()
+
+    progress = None
+    if printout == True:
+        from tqdm import tqdm
+        progress = tqdm(total=len(fields) - len(done))
+
+    todo = tasks()
+    with ProcessPoolExecutor(max_workers=max_workers, initializer=_init_worker) as executor:
+        # keep only a few fields per worker in flight
+        futures = set()
+        for task in todo:
+            futures.add(executor.submit(process_field, task))
+            if len(futures) >= 2 * max_workers:
+                break
+        while len(futures) > 0:
+            finished, futures = wait(futures, return_when=FIRST_COMPLETED)
+            for future in finished:
+                field_id, rows, error = future.result()
+                if error is None:
+                    pending_ids.append(field_id)
+                    pending_rows.append((field_id, rows))
+                else:
+                    failed[field_id] = error
+                    if printout == True:
+                        print('field {} failed: {}'.format(field_id, error))
+                if progress is not None:
+                    progress.update(1)
+                task = next(todo, None)
+                if task is not None:
+                    futures.add(executor.submit(process_field, task))
+            if len(pending_ids) >= checkpoint_every:
+                write_checkpoint()
+    write_checkpoint()
+
+    if progress is not None:
+        progress.close()
+    return failed
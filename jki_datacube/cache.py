@@ -0,0 +1,266 @@
+'''
+persistent on-disk cache for WCS/WCPS responses
+
+The cache is disabled by default. Enable it once per session, e.g.:
+
+    from jki_datacube.cache import set_cache
+    set_cache('~/.cache/jki_datacube/wcs.sqlite', max_size=2*1024**3)
+
+Afterwards the shared client of jki_datacube.client, which is used by every fetcher (get_phases_from_point,
+get_precipitation_from_point, get_S2_imagery, ...), answers identical queries from disk. 
+Credentials are never part of the cache key.
+'''
+import hashlib
+import json
+import os
+import re
+import sqlite3
+import threading
+import time
+from datetime import date
+from urllib.parse import urlsplit, parse_qsl
+
+from ._lazy import lazy_import
+
+requests = lazy_import('requests')
+
+
+# parameters, which never change the response and are dropped from the cache key
+_IGNORED_PARAMETERS = ('user', 'username', 'pw', 'password', 'passwd', 'token', 'access_token')
+
+
+class WCSCache:
+    '''
+    content-addressed SQLite cache for raw response bodies with size limit, LRU eviction and TTLs per layer
+
+    PARAMETERS:
+        path (str): path of the SQLite file
+        max_size (int(opt)): maximum size of all stored bodies in bytes, least recently used entries are evicted first. Defaults to 1 GB.
+        default_ttl (float(opt)): time to live in seconds of an entry, None means forever. Defaults to 1 day.
+        layer_ttl (dict(opt)): layer name prefix -> time to live in seconds (None means forever), e.g. {'PHASE_': None}.
+            The longest matching prefix wins and takes precedence over historical_forever. Defaults to {'PHASE_': None}.
+        historical_forever (bool(opt)): If True, responses of queries of layers without layer_ttl, whose time subset ends before the
+            current year, never expire. Defaults to True.
+    '''
+
+    def __init__(self, path, max_size=1024**3, default_ttl=86400, layer_ttl=None, historical_forever=True):
+        self.path = os.path.expanduser(path)
+        self.max_size = max_size
+        self.default_ttl = default_ttl
+        self.layer_ttl = {'PHASE_': None} if layer_ttl is None else dict(layer_ttl)
+        self.historical_forever = historical_forever
+        self._lock = threading.Lock()
+        self._connection = None
+        self._pid = None
+
+    def _connect(self):
+        # a connection must not be shared with forked worker processes
+        if self._connection is None or self._pid != os.getpid():
+            directory = os.path.dirname(self.path)
+            if directory != '':
+                os.makedirs(directory, exist_ok=True)
+            self._connection = sqlite3.connect(self.path, check_same_thread=False, isolation_level=None)
+            self._connection.execute('PRAGMA journal_mode=WAL')
+            self._connection.execute(
+                'CREATE TABLE IF NOT EXISTS responses ('
+                'key TEXT PRIMARY KEY, layer TEXT, url TEXT, content_type TEXT, body BLOB, size INTEGER, '
+                'created REAL, expires REAL, last_access REAL)'
+            )
+            self._connection.execute('CREATE INDEX IF NOT EXISTS responses_last_access ON responses (last_access)')
+            # running total of all body sizes, so an insert does not have to sum the whole table
+            self._connection.execute('CREATE TABLE IF NOT EXISTS cache_size (id INTEGER PRIMARY KEY CHECK (id = 0), total INTEGER)')
+            self._connection.execute('INSERT OR IGNORE INTO cache_size SELECT 0, COALESCE(SUM(size), 0) FROM responses')
+            self._pid = os.getpid()
+        return self._connection
+
+    def get(self, key):
+        '''
+        return (url, content_type, body) of a cached response or None, if the key is unknown or expired
+        '''
+        now = time.time()
+        with self._lock:
+            connection = self._connect()
+            row = connection.execute('SELECT url, content_type, body, expires, size FROM responses WHERE key=?', (key,)).fetchone()
+            if row is None:
+                return None
+            if row[3] is not None and row[3] < now:
+                connection.execute('BEGIN IMMEDIATE')
+                try:
+                    if connection.execute('DELETE FROM responses WHERE key=?', (key,)).rowcount > 0:
+                        connection.execute('UPDATE cache_size SET total = total - ? WHERE id = 0', (row[4],))
+                    connection.execute('COMMIT')
+                except BaseException:
+                    connection.execute('ROLLBACK')
+                    raise
+                return None
+            connection.execute('UPDATE responses SET last_access=? WHERE key=?', (now, key))
+        return row[0], row[1], row[2]
+
+    def put(self, key, layer, url, content_type, body, ttl):
+        '''
+        store a response body and evict the least recently used entries if max_size is exceeded
+        '''
+        now = time.time()
+        expires = None if ttl is None else now + ttl
+        with self._lock:
+            connection = self._connect()
+            # the running total is updated in the same transaction, it stays correct with several processes
+            connection.execute('BEGIN IMMEDIATE')
+            try:
+                old = connection.execute('SELECT size FROM responses WHERE key=?', (key,)).fetchone()
+                connection.execute(
+                    'INSERT OR REPLACE INTO responses VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?)',
+                    (key, layer, url, content_type, body, len(body), now, expires, now)
+                )
+                connection.execute('UPDATE cache_size SET total = total + ? WHERE id = 0', (len(body) - (0 if old is None else old[0]),))
+                total = connection.execute('SELECT total FROM cache_size WHERE id = 0').fetchone()[0]
+                if total > self.max_size:
+                    # walk from the least recently used entry until enough space is freed
+                    freed = 0
+                    keys = []
+                    for old_key, size in connection.execute('SELECT key, size FROM responses ORDER BY last_access'):
+                        if total - freed <= self.max_size:
+                            break
+                        keys.append((old_key,))
+                        freed += size
+                    connection.executemany('DELETE FROM responses WHERE key=?', keys)
+                    connection.execute('UPDATE cache_size SET total = total - ? WHERE id = 0', (freed,))
+                connection.execute('COMMIT')
+            except BaseException:
+                connection.execute('ROLLBACK')
+                raise
+
+    def get_response(self, url, data=None):
+        '''
+        return the cached response of a query as requests.models.Response or None
+        '''
+        hit = self.get(make_key(*normalize_query(url, data)))
+        if hit is not None:
+            return _build_response(*hit)
+        return None
+
+    def put_response(self, url, data, response):
+        '''
+        store the body of a successful response of a query
+        '''
+        endpoint, params = normalize_query(url, data)
+        layer = get_layer(params)
+        self.put(make_key(endpoint, params), layer, str(response.url), response.headers.get('Content-Type'), response.content, self.ttl(layer, params))
+
+    def clear(self, layer=None):
+        '''
+        remove all entries (of one layer)
+        '''
+        with self._lock:
+            connection = self._connect()
+            connection.execute('BEGIN IMMEDIATE')
+            try:
+                if layer is None:
+                    connection.execute('DELETE FROM responses')
+                else:
+                    connection.execute('DELETE FROM responses WHERE layer=?', (layer,))
+                connection.execute('UPDATE cache_size SET total = (SELECT COALESCE(SUM(size), 0) FROM responses) WHERE id = 0')
+                connection.execute('COMMIT')
+            except BaseException:
+                connection.execute('ROLLBACK')
+                raise
+
+    def ttl(self, layer, params):
+        '''
+        time to live in seconds of a response of the given layer and normalized query parameters
+        '''
+        # an explicit TTL of the layer wins, e.g. for reprocessed historical archives
+        prefixes = [p for p in self.layer_ttl if layer is not None and layer.startswith(p)]
+        if len(prefixes) > 0:
+            return self.layer_ttl[max(prefixes, key=len)]
+        if self.historical_forever:
+            years = [int(y) for name, value in params if name in ('subset', 'query') and 'ansi' in value.lower()
+                     for y in re.findall(r'(\d{4})-\d{2}-\d{2}', value)]
+            if len(years) > 0 and max(years) < date.today().year:
+                return None
+        return self.default_ttl
+
+
+def normalize_query(url, data=None):
+    '''
+    normalize a WCS query (GET URL and/or POST parameters) to a canonical form
+
+    PARAMETERS:
+        url (str): request URL including the query string
+        data (dict or list(opt)): POST parameters as dict or list of (name, value) tuples. Defaults to None.
+
+    RETURNS:
+        endpoint (str): scheme, host and path of the URL without credentials
+        params (list): sorted list of (lower case name, value) tuples without credential parameters
+
+    '''
+    parts = urlsplit(url)
+    netloc = parts.netloc.rsplit('@', 1)[-1]
+    params = parse_qsl(parts.query, keep_blank_values=True)
+    if data is not None:
+        params += list(data.items()) if isinstance(data, dict) else list(data)
+    params = sorted(
+        (name.lower(), str(value).strip()) for name, value in params
+        if name != '' and name.lower() not in _IGNORED_PARAMETERS
+    )
+    return parts.scheme + '://' + netloc.lower() + parts.path, params
+
+
+def get_layer(params):
+    '''
+    layer name (coverage ID) of normalized query parameters, also for WCPS queries
+    '''
+    for name, value in params:
+        if name == 'coverageid':
+            return value
+        if name == 'query':
+            match = re.search(r'for\s+\$\w+\s+in\s*\(\s*([\w.-]+)', value)
+            if match is not None:
+                return match.group(1)
+    return None
+
+
+def make_key(endpoint, params):
+    '''
+    content address (sha256) of a normalized query
+    '''
+    return hashlib.sha256(json.dumps([endpoint, params]).encode('utf-8')).hexdigest()
+
+
+_CACHE = None
+
+def set_cache(path=None, **kwargs):
+    '''
+    enable (or disable) the response cache for all fetchers
+
+    PARAMETERS:
+        path (str or WCSCache): path of the SQLite file or a WCSCache object, None disables the cache
+        kwargs: further arguments of WCSCache (max_size, default_ttl, layer_ttl, historical_forever)
+
+    RETURNS:
+        cache (WCSCache): the active cache or None
+
+    '''
+    global _CACHE
+    if path is None or isinstance(path, WCSCache):
+        _CACHE = path
+    else:
+        _CACHE = WCSCache(path, **kwargs)
+    return _CACHE
+
+
+def get_cache():
+    '''
+    return the active WCSCache or None, if caching is disabled
+    '''
+    return _CACHE
+
+
+def _build_response(url, content_type, body):
+    response = requests.models.Response()
+    response.status_code = 200
+    response.url = url
+    response._content = body
+    response.headers['Content-Type'] = content_type or ''
+    response.encoding = 'utf-8'
+    return response
@@ -0,0 +1,375 @@
+'''
+metadata catalog of a data cube service
+
+GetCapabilities is requested once and cached on disk with a TTL, DescribeCoverage is requested and parsed
+lazily per coverage into a CoverageInfo. The parsed documents are kept in memory with the same TTL, so long
+running processes see new coverages and time slices. The fetchers use the catalog of their host to validate
+queries and to pick axis labels without extra round trips.
+
+    from jki_datacube.catalog import get_catalog
+    catalog = get_catalog(credentials.ras_host)
+    catalog.coverages
+    catalog.describe('DWD_Niederschlag').time_extent
+'''
+import hashlib
+import os
+import threading
+import time
+from datetime import date, timedelta
+from typing import NamedTuple, Optional, Tuple
+
+from ._lazy import lazy_import
+from .client import client
+from .query import WCSQuery
+
+xmltodict = lazy_import('xmltodict')
+
+
+class CoverageInfo(NamedTuple):
+    '''
+    parsed DescribeCoverage metadata of one coverage
+    '''
+    coverage_id: str
+    axes: Tuple[str, ...] # axis labels in CRS order, e.g. ('ansi', 'E', 'N')
+    crs: str # (compound) CRS URL of the coverage
+    lower_corner: Tuple[str, ...] # per axis, dates as strings
+    upper_corner: Tuple[str, ...]
+    resolution: Tuple[Optional[float], ...] # per axis, None for irregular axes
+    bands: Tuple[str, ...]
+    nodata: Tuple[Optional[float], ...] # per band
+    dates: Tuple[str, ...] # YYYY-MM-DD of all time slices of an irregular time axis, empty otherwise
+
+    @property
+    def time_axis(self):
+        '''
+        label of the time axis or None
+        '''
+        return next((a for a in self.axes if a.lower() in ('ansi', 'time', 't', 'date', 'unix')), None)
+
+    @property
+    def time_extent(self):
+        '''
+        (first, last) date of the time axis as YYYY-MM-DD or None
+        '''
+        if self.time_axis is None:
+            return None
+        i = self.axes.index(self.time_axis)
+        return self.lower_corner[i].strip('"')[:10], self.upper_corner[i].strip('"')[:10]
+
+    @property
+    def xy_axes(self):
+        '''
+        (easting, northing) axis labels, e.g. ('E', 'N') or ('Lon', 'Lat')
+        '''
+        x = next((a for a in self.axes if a in ('E', 'Lon', 'Long', 'x', 'X')), None)
+        y = next((a for a in self.axes if a in ('N', 'Lat', 'y', 'Y')), None)
+        return x, y
+
+
+def _find_key(metadata, key_suffix, condition=None):
+    '''
+    search a nested xmltodict dictionary for the first value, whose key ends with key_suffix
+    '''
+    if isinstance(metadata, dict):
+        for key, value in metadata.items():
+            if key.endswith(key_suffix) and (condition is None or condition(value)):
+                return value
+            found = _find_key(value, key_suffix, condition)
+            if found is not None:
+                return found
+    elif isinstance(metadata, list):
+        for value in metadata:
+            found = _find_key(value, key_suffix, condition)
+            if found is not None:
+                return found
+    return None
+
+
+def _find_all(metadata, key_suffix):
+    '''
+    all values of a nested xmltodict dictionary, whose keys end with key_suffix
+    '''
+    if isinstance(metadata, dict):
+        for key, value in metadata.items():
+            if key.endswith(key_suffix):
+                yield from _as_list(value)
+            else:
+                yield from _find_all(value, key_suffix)
+    elif isinstance(metadata, list):
+        for value in metadata:
+            yield from _find_all(value, key_suffix)
+
+
+def _as_list(value):
+    if value is None:
+        return []
+    return value if isinstance(value, list) else [value]
+
+
+def _to_float(value):
+    try:
+        return float(value)
+    except (TypeError, ValueError):
+        return None
+
+
+def parse_coverage_description(metadata):
+    '''
+    parse the DescribeCoverage dictionary (xmltodict) of one coverage
+
+    PARAMETERS:
+        metadata (dict): DescribeCoverage response parsed with xmltodict, see get_metadata_from_datacube
+
+    RETURNS:
+        info (CoverageInfo): parsed metadata
+
+    '''
+    description = _find_key(metadata, 'CoverageDescription')
+    coverage_id = description.get('wcs:CoverageId', '') if isinstance(description, dict) else ''
+    envelope = _find_key(metadata, 'Envelope', lambda v: isinstance(v, dict) and '@axisLabels' in v) \
+        or _find_key(metadata, 'EnvelopeWithTimePeriod') or {}
+    axes = tuple(envelope.get('@axisLabels', '').split())
+    lower = tuple(envelope.get('gml:lowerCorner', '').split())
+    upper = tuple(envelope.get('gml:upperCorner', '').split())
+
+    # regular axes have an offset vector, which is not 0 only for its own axis
+    resolution = [None] * len(axes)
+    for vector in _find_all(metadata, 'offsetVector'):
+        text = vector['#text'] if isinstance(vector, dict) else vector
+        values = [_to_float(v) for v in text.split()]
+        if len(values) == len(axes) and None not in values:
+            for i, v in enumerate(values):
+                if v != 0:
+                    resolution[i] = abs(v)
+
+    record = _find_key(metadata, 'DataRecord', lambda v: isinstance(v, dict)) or {}
+    fields = _as_list(record.get('swe:field'))
+    bands = tuple(f.get('@name', '') for f in fields)
+    nodata = []
+    for f in fields:
+        nil = _as_list(_find_key(f, 'nilValue'))
+        nil = nil[0] if len(nil) > 0 else None
+        nodata.append(_to_float(nil.get('#text') if isinstance(nil, dict) else nil))
+
+    dates = []
+    time_axis = next((a for a in axes if a.lower() in ('ansi', 'time', 't', 'date', 'unix')), None)
+    axis = _find_key(metadata, 'GeneralGridAxis', lambda v: isinstance(v, dict) and v.get('gmlrgrid:gridAxesSpanned') == time_axis)
+    if axis is not None:
+        coefficients = axis.get('gmlrgrid:coefficients') or ''
+        if '"' in coefficients:
+            dates = [c[:10] for c in coefficients.replace('"', ' ').split()]
+        elif coefficients.strip() != '':
+            # numeric coefficients are offsets in days relative to the time axis origin
+            origin = _find_key(metadata, 'gmlrgrid:origin')
+            origin = date.fromisoformat(str(origin).split('"')[1][:10])
+            dates = [(origin + timedelta(days=float(c))).strftime('%Y-%m-%d') for c in coefficients.split()]
+        if time_axis in axes:
+            resolution[axes.index(time_axis)] = None
+
+    return CoverageInfo(
+        coverage_id=coverage_id,
+        axes=axes,
+        crs=envelope.get('@srsName', ''),
+        lower_corner=lower,
+        upper_corner=upper,
+        resolution=tuple(resolution),
+        bands=bands,
+        nodata=tuple(nodata),
+        dates=tuple(sorted(set(dates)))
+    )
+
+
+def capabilities_document():
+    '''
+    (cache name, query string) of the GetCapabilities document
+    '''
+    return 'GetCapabilities', '?SERVICE=WCS&version=2.0.1&request=GetCapabilities'
+
+
+def description_document(layer):
+    '''
+    (cache name, query string) of the DescribeCoverage document of a coverage
+    '''
+    return 'DescribeCoverage:' + layer, WCSQuery(layer, request='DescribeCoverage').url('')
+
+
+def parse_capabilities(content):
+    '''
+    list of all coverage IDs of a GetCapabilities document
+    '''
+    dict_data = xmltodict.parse(content)
+    summaries = _as_list(dict_data['wcs:Capabilities']['wcs:Contents']['wcs:CoverageSummary'])
+    return [s['wcs:CoverageId'] for s in summaries]
+
+
+class DatacubeCatalog:
+    '''
+    lazily loaded and disk-cached metadata catalog of one data cube service
+
+    PARAMETERS:
+        host (str): host adress of data cube service
+        user (str(opt)): credentials username
+        pw (str(opt)): credentials password
+        use_credentials (bool(opt)): If True: personal credentials for datacube service will be used. Defaults to False.
+        cache_dir (str(opt)): directory of the cached documents, None disables the disk cache. Defaults to ~/.cache/jki_datacube/catalog.
+        ttl (float(opt)): time to live of the cached documents (on disk and in memory) in seconds. Defaults to 1 day.
+    '''
+
+    def __init__(self, host, user='', pw='', use_credentials=False, cache_dir='~/.cache/jki_datacube/catalog', ttl=86400):
+        self.host = host
+        self.user = user
+        self.pw = pw
+        self.use_credentials = use_credentials
+        self.cache_dir = None if cache_dir is None else os.path.expanduser(cache_dir)
+        self.ttl = ttl
+        # parsed documents: key -> (time of the document, value)
+        self._memory = {}
+        self._lock = threading.Lock()
+
+    def _path(self, name):
+        return os.path.join(self.cache_dir, hashlib.sha256((self.host + '|' + name).encode('utf-8')).hexdigest()[:32] + '.xml')
+
+    def _read_cached(self, name):
+        '''
+        cached XML document, None if it is missing or older than ttl
+        '''
+        if self.cache_dir is not None:
+            path = self._path(name)
+            if os.path.exists(path) and time.time() - os.path.getmtime(path) < self.ttl:
+                with open(path, 'rb') as f:
+                    return f.read()
+        return None
+
+    def _write_cached(self, name, content):
+        if self.cache_dir is not None:
+            path = self._path(name)
+            os.makedirs(self.cache_dir, exist_ok=True)
+            # write to a temporary file first, so other processes never read a partial document
+            tmp = path + '.' + str(os.getpid())
+            with open(tmp, 'wb') as f:
+                f.write(content)
+            os.replace(tmp, path)
+
+    def _recall(self, key):
+        '''
+        parsed document kept in memory, None if it is missing or older than ttl
+        '''
+        entry = self._memory.get(key)
+        if entry is None or time.time() - entry[0] >= self.ttl:
+            return None
+        return entry[1]
+
+    def _remember(self, key, name, value):
+        '''
+        keep a parsed document in memory, its age is the age of the XML document (name) in the disk cache
+        '''
+        fetched = time.time()
+        if self.cache_dir is not None:
+            try:
+                fetched = min(fetched, os.path.getmtime(self._path(name)))
+            except OSError:
+                pass
+        with self._lock:
+            self._memory[key] = (fetched, value)
+        return value
+
+    @property
+    def auth(self):
+        '''
+        basic auth credentials of the catalog requests or None
+        '''
+        return (self.user, self.pw) if self.use_credentials == True else None
+
+    def _fetch(self, name, query):
+        '''
+        fetch an XML document or read it from the disk cache, if it is younger than ttl
+        '''
+        content = self._read_cached(name)
+        if content is not None:
+            return content
+
+        response = client.get(self.host + query, auth=self.auth)
+        if response.status_code != 200:
+            raise RuntimeError('request was answered with request code: {}. URL: {}'.format(response.status_code, response.url))
+        self._write_cached(name, response.content)
+        return response.content
+
+    @property
+    def coverages(self):
+        '''
+        list of all coverage IDs of the host (GetCapabilities)
+        '''
+        name, query = capabilities_document()
+        coverages = self._recall(name)
+        if coverages is None:
+            coverages = self._remember(name, name, parse_capabilities(self._fetch(name, query)))
+        return coverages
+
+    def get_metadata(self, layer):
+        '''
+        raw DescribeCoverage dictionary (xmltodict) of a coverage
+        '''
+        name, query = description_document(layer)
+        metadata = self._recall(name)
+        if metadata is None:
+            metadata = self._remember(name, name, xmltodict.parse(self._fetch(name, query)))
+        return metadata
+
+    def describe(self, layer):
+        '''
+        parsed DescribeCoverage metadata (CoverageInfo) of a coverage, requested on first use
+        '''
+        name = description_document(layer)[0]
+        info = self._recall('info:' + name)
+        if info is None:
+            # the document is fetched without the lock, so lookups of other coverages do not wait for it
+            info = self._remember('info:' + name, name, parse_coverage_description(self.get_metadata(layer)))
+        return info
+
+    def validate(self, layer, axes=None, bands=None):
+        '''
+        check a query against the catalog, raises ValueError for unknown coverages, axes or bands
+
+        PARAMETERS:
+            layer (str): coverage ID
+            axes (list(opt)): axis labels used in the query. Defaults to None.
+            bands (list(opt)): band names used in the query. Defaults to None.
+
+        RETURNS:
+            info (CoverageInfo): parsed metadata of the coverage
+        '''
+        if layer not in self.coverages:
+            raise ValueError('coverage {} is not available on {}'.format(layer, self.host))
+        info = self.describe(layer)
+        unknown = [a for a in (axes or []) if a not in info.axes]
+        if len(unknown) > 0:
+            raise ValueError('coverage {} has no axis {}, available axes: {}'.format(layer, ', '.join(unknown), ', '.join(info.axes)))
+        unknown = [b for b in (bands or []) if b not in info.bands]
+        if len(unknown) > 0:
+            raise ValueError('coverage {} has no band {}, available bands: {}'.format(layer, ', '.join(unknown), ', '.join(info.bands)))
+        return info
+
+
+_CATALOGS = {}
+
+def get_catalog(host, user='', pw='', use_credentials=False, **kwargs):
+    '''
+    get the shared catalog of a host, it is created on first use
+
+    PARAMETERS:
+        host (str): host adress of data cube service
+        user (str(opt)): credentials username
+        pw (str(opt)): credentials password
+        use_credentials (bool(opt)): If True: personal credentials for datacube service will be used. Defaults to False.
+        kwargs: further arguments of DatacubeCatalog (cache_dir, ttl)
+
+    RETURNS:
+        catalog (DatacubeCatalog): catalog of the host
+    '''
+    if host not in _CATALOGS:
+        _CATALOGS[host] = DatacubeCatalog(host, user=user, pw=pw, use_credentials=use_credentials, **kwargs)
+    elif use_credentials == True and not _CATALOGS[host].use_credentials:
+        # credentials are only needed for restricted coverages, keep them once given
+        catalog = _CATALOGS[host]
+        catalog.user, catalog.pw, catalog.use_credentials = user, pw, True
+    return _CATALOGS[host]
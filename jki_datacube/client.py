@@ -0,0 +1,210 @@
+'''
+shared HTTP client for all data cube requests
+
+All fetchers send their requests through the module-level `client`, which keeps one pooled
+requests.Session (keep-alive), retries 429 and 5xx responses with bounded exponential backoff and jitter,
+applies a timeout to every request and answers repeated queries from the response cache (see jki_datacube.cache).
+Requests to a host are rate limited and their concurrency is adapted to its capacity (see jki_datacube.throttle).
+Every attempt, also a retried one, is reported to the throttle of its host, and its slot is released during the backoff.
+
+Credentials can be configured once per host instead of passing them to every function:
+
+    from jki_datacube.client import client
+    client.set_auth(credentials.ras_cde_host, credentials.ras_cde_user, credentials.ras_cde_pw)
+'''
+import random
+import threading
+import time
+
+from ._lazy import lazy_import
+from . import instrument
+from .cache import get_cache
+from .throttle import get_throttle, _get_netloc
+
+requests = lazy_import('requests')
+
+
+class DatacubeClient:
+    '''
+    pooled HTTP client with retry/backoff for WCS and WCPS requests
+
+    PARAMETERS:
+        max_connections (int(opt)): connections kept alive per host, should be >= the number of concurrent requests. Defaults to 16.
+        retries (int(opt)): maximum number of retries of a failed request. Defaults to 5.
+        backoff_factor (float(opt)): base of the exponential backoff in seconds (factor * 2**retry). Defaults to 0.5.
+        backoff_max (float(opt)): upper bound of a single backoff in seconds. Defaults to 30.
+        backoff_jitter (float(opt)): random jitter in seconds added to every backoff. Defaults to 0.5.
+        timeout (float or tuple(opt)): (connect, read) timeout in seconds of every request. Defaults to (10, 300).
+        status_forcelist (tuple(opt)): status codes, which are retried. Defaults to 429, 500, 502, 503, 504.
+    '''
+
+    def __init__(self, max_connections=16, retries=5, backoff_factor=0.5, backoff_max=30, backoff_jitter=0.5, timeout=(10, 300),
+                 status_forcelist=(429, 500, 502, 503, 504)):
+        self.max_connections = max_connections
+        self.retries = retries
+        self.backoff_factor = backoff_factor
+        self.backoff_max = backoff_max
+        self.backoff_jitter = backoff_jitter
+        self.timeout = timeout
+        self.status_forcelist = status_forcelist
+        self._auth = {}
+        self._lock = threading.Lock()
+        self._session = None
+
+    def _backoff(self, retry, response=None):
+        if response is not None:
+            retry_after = response.headers.get('Retry-After', '')
+            if retry_after.isdigit():
+                return min(float(retry_after), self.backoff_max)
+        return min(self.backoff_factor * 2 ** retry, self.backoff_max) + random.uniform(0, self.backoff_jitter)
+
+    @property
+    def session(self):
+        '''
+        the pooled requests.Session, created on first use
+        '''
+        if self._session is None:
+            with self._lock:
+                if self._session is None:
+                    session = requests.Session()
+                    # retries are done by request, so the throttle sees every attempt
+                    adapter = requests.adapters.HTTPAdapter(pool_connections=4, pool_maxsize=self.max_connections, max_retries=0)
+                    session.mount('https://', adapter)
+                    session.mount('http://', adapter)
+                    self._session = session
+        return self._session
+
+    def set_auth(self, host, user, pw):
+        '''
+        configure basic auth credentials for all requests to a host
+
+        PARAMETERS:
+            host (str): host adress of the data cube service (only scheme and network location are used)
+            user (str): credentials username
+            pw (str): credentials password
+        '''
+        self._auth[_get_netloc(host)] = (user, pw)
+
+    def request(self, method, url, data=None, auth=None, timeout=None, use_cache=True, stream=False):
+        '''
+        send a request, answer it from the response cache if possible
+
+        PARAMETERS:
+            method (str): GET or POST
+            url (str): request URL
+            data (dict or list(opt)): POST parameters as dict or list of (name, value) tuples. Defaults to None.
+            auth (tuple or requests.auth.AuthBase(opt)): (user, pw) for basic auth or another authentication, defaults to the credentials configured with set_auth for this host.
+            timeout (float or tuple(opt)): request timeout, defaults to the timeout of the client.
+            use_cache (bool(opt)): If False, the response cache is bypassed. Defaults to True.
+            stream (bool(opt)): If True, the body is not downloaded immediately (see jki_datacube.decode.parse_csv_response). 
+                Streamed responses are not stored in the response cache. Defaults to False.
+
+        RETURNS:
+            response (requests.models.Response): response object
+        '''
+        netloc = _get_netloc(url)
+        cache = get_cache() if use_cache else None
+        if cache is not None:
+            response = cache.get_response(url, data)
+            if response is not None:
+                instrument.count('cache_hits', host=netloc)
+                return response
+            instrument.count('cache_misses', host=netloc)
+
+        if auth is None or auth == ('', '') or (getattr(auth, 'username', None) == '' and getattr(auth, 'password', None) == ''):
+            # no (or empty) credentials given -> use the credentials configured for this host
+            auth = self._auth.get(netloc)
+        # per-host rate limit and adaptive concurrency, see jki_datacube.throttle
+        throttle = get_throttle(url)
+        retry = 0
+        while True:
+            response = None
+            try:
+                wait = time.monotonic()
+                with throttle.slot():
+                    start = time.monotonic()
+                    instrument.record('throttle', start - wait, host=netloc)
+                    try:
+                        response = self.session.request(method, url, data=data, auth=auth, timeout=self.timeout if timeout is None else timeout, stream=stream)
+                    except requests.exceptions.RequestException:
+                        throttle.record(time.monotonic() - start)
+                        raise
+                    duration = time.monotonic() - start
+                    # every attempt is recorded, so 429/5xx answers, which are retried, make the controller back off
+                    throttle.record(duration, response.status_code)
+                _instrument_response(response, netloc, duration, stream)
+            except (requests.exceptions.ConnectionError, requests.exceptions.Timeout):
+                instrument.count('errors', host=netloc)
+                if retry >= self.retries:
+                    raise
+            except requests.exceptions.RequestException:
+                instrument.count('errors', host=netloc)
+                raise
+            else:
+                if response.status_code not in self.status_forcelist or retry >= self.retries:
+                    break
+                # release the connection of a streamed answer, which is not used
+                response.close()
+            # the slot is released while waiting, so other requests to the host are not blocked
+            time.sleep(self._backoff(retry, response))
+            retry += 1
+            instrument.count('retries', host=netloc)
+
+        if cache is not None and response.status_code == 200 and not stream:
+            cache.put_response(url, data, response)
+        return response
+
+    def get(self, url, auth=None, **kwargs):
+        '''
+        send a GET request, see request
+        '''
+        return self.request('GET', url, auth=auth, **kwargs)
+
+    def post(self, url, data=None, auth=None, **kwargs):
+        '''
+        send a POST request, see request
+        '''
+        return self.request('POST', url, data=data, auth=auth, **kwargs)
+
+    def send(self, query, host, auth=None, max_url_length=None, **kwargs):
+        '''
+        send a WCSQuery, as GET request or as POST request with a form body if the URL is too long (see jki_datacube.query)
+
+        PARAMETERS:
+            query (WCSQuery): query
+            host (str): endpoint of the data cube service
+            auth (tuple or requests.auth.AuthBase(opt)): authentication, see request
+            max_url_length (int(opt)): longest URL sent as GET. Defaults to None (jki_datacube.query.MAX_URL_LENGTH).
+            **kwargs: see request
+
+        RETURNS:
+            response (requests.models.Response): response object
+        '''
+        with instrument.stage('build'):
+            if max_url_length is None:
+                method, url, data = query.to_request(host)
+            else:
+                method, url, data = query.to_request(host, max_url_length=max_url_length)
+        return self.request(method, url, data=data, auth=auth, **kwargs)
+
+    def close(self):
+        '''
+        close all pooled connections
+        '''
+        if self._session is not None:
+            self._session.close()
+            self._session = None
+
+
+def _instrument_response(response, netloc, duration, stream):
+    # response.elapsed ends when the headers are parsed (time to first byte incl. connect of the last attempt)
+    ttfb = response.elapsed.total_seconds()
+    instrument.count('requests', host=netloc, status=response.status_code)
+    instrument.record('ttfb', ttfb, host=netloc)
+    if not stream:
+        instrument.record('download', max(0.0, duration - ttfb), host=netloc)
+        instrument.count('bytes', len(response.content), host=netloc)
+
+
+# the client used by all fetchers
+client = DatacubeClient()
@@ -0,0 +1,45 @@
+import functools
+
+import numpy as np
+
+from ._lazy import lazy_import
+
+pyproj = lazy_import('pyproj')
+
+
+@functools.lru_cache(maxsize=None)
+def get_transformer(epsg_from, epsg_to):
+    '''
+    get a cached pyproj transformer between two coordinate reference systems. 
+    Building a transformer parses the PROJ definitions, so it is done only once per (source, target) pair.
+    
+    PARAMETERS:
+        epsg_from (int): EPSG code of the input coordinates
+        epsg_to (int): EPSG code of the output coordinates
+        
+    RETURNS:
+        transformer (pyproj.Transformer): transformer with easting/longitude first (always_xy=True)
+    
+    '''
+    return pyproj.Transformer.from_crs("epsg:"+str(int(epsg_from)), "epsg:"+str(int(epsg_to)), always_xy=True)
+
+
+def transform_coords(xs, ys, epsg_from, epsg_to):
+    '''
+    transform coordinates (single values or arrays) from one coordinate reference system to another
+    
+    PARAMETERS:
+        xs (float or array-like): easting/longitude coordinates
+        ys (float or array-like): northing/latitude coordinates
+        epsg_from (int): EPSG code of the input coordinates
+        epsg_to (int): EPSG code of the output coordinates
+        
+    RETURNS:
+        xs, ys (float or numpy.ndarray): transformed easting/longitude and northing/latitude coordinates
+    
+    '''
+    if int(epsg_from) == int(epsg_to):
+        return xs, ys
+    if isinstance(xs, (int, float)) and isinstance(ys, (int, float)):
+        return get_transformer(epsg_from, epsg_to).transform(xs, ys)
+    return get_transformer(epsg_from, epsg_to).transform(np.asarray(xs, dtype=np.float64), np.asarray(ys, dtype=np.float64))
@@ -0,0 +1,203 @@
+import re
+from datetime import date, timedelta
+
+import numpy as np
+
+from . import instrument
+from ._lazy import lazy_import
+
+netCDF4 = lazy_import('netCDF4')
+
+
+@instrument.timed('decode')
+def decode_netcdf(content):
+    '''
+    decode a netCDF encoded WCS response (FORMAT=application/netcdf) in memory
+    
+    PARAMETERS:
+        content (bytes): response body, e.g. response.content
+        
+    RETURNS:
+        axes (dict): axis label -> 1-D numpy array of axis coordinates (e.g. 'ansi', 'E', 'N')
+        bands (dict): band name -> (dims, array), dims (tuple) are the axis labels of the array dimensions.
+            Scalar variables and grid mappings (e.g. crs) are no bands.
+    
+    '''
+    with netCDF4.Dataset('coverage.nc', mode='r', memory=content) as ds:
+        axes = {}
+        bands = {}
+        grid_mappings = set(getattr(var, 'grid_mapping', None) for var in ds.variables.values())
+        for name, var in ds.variables.items():
+            if len(var.dimensions) == 0 or name in grid_mappings:
+                continue
+            if var.dimensions == (name,):
+                values = var[:]
+                units = getattr(var, 'units', '')
+                if 'since' in units:
+                    # CF-style time axis -> convert to ANSI day numbers, see decode_ansi_dates
+                    values = netCDF4.date2num(netCDF4.num2date(values, units), 'days since 1600-12-31')
+                axes[name] = np.asarray(values)
+            else:
+                var.set_auto_mask(False)
+                bands[name] = (var.dimensions, np.asarray(var[:]))
+    return axes, bands
+
+
+def decode_ansi_dates(values):
+    '''
+    convert rasdaman ANSI date numbers (days since 1600-12-31) to dates
+    
+    PARAMETERS:
+        values (array-like): ANSI day numbers
+        
+    RETURNS:
+        dates (list): list of dates as YYYY-MM-DD strings
+    
+    '''
+    origin = date(1600, 12, 31)
+    return [(origin + timedelta(days=float(v))).strftime('%Y-%m-%d') for v in values]
+
+
+class CSVStreamParser:
+    '''
+    incremental parser for the rasdaman text/csv encoding, e.g. 1,2,3 or {"1 2 3"} or {{1,2},{3,4}}
+    
+    Chunks of the response body are fed one after another. Numbers are converted in bulk by numpy, 
+    the nesting of the braces is tracked on the fly, so the shape of the array can be restored in the end.
+    
+    PARAMETERS:
+        dtype (numpy.dtype(opt)): data type of the result. Defaults to float64.
+    '''
+    # separators of the csv encoding, braces and quotes only define the structure
+    _TABLE = bytes.maketrans(b'{}",;\n\r\t', b'        ')
+
+    def __init__(self, dtype=None):
+        self.dtype = np.float64 if dtype is None else dtype
+        self._arrays = []
+        self._carry = b''
+        self._depth = None
+        self._head = b''
+        self._bands = None
+        self._quoted = b''
+        self._run = 0
+        self._runs = {}
+
+    def feed(self, chunk):
+        '''
+        parse the next chunk (bytes) of the response body
+        '''
+        if len(chunk) == 0:
+            return
+        if self._depth is None:
+            # leading braces give the nesting depth, they may be spread over several chunks
+            self._head += chunk
+            head = self._head.lstrip()
+            if len(head.lstrip(b'{')) > 0:
+                self._depth = len(head) - len(head.lstrip(b'{'))
+                self._head = b''
+        if self._bands is None and (self._quoted or b'"' in chunk):
+            # number of values in the first quoted group gives the number of bands
+            self._quoted += chunk
+            if self._quoted.count(b'"') >= 2:
+                self._bands = len(self._quoted.split(b'"')[1].split())
+                self._quoted = b''
+
+        # closing brace runs, a run may continue from the previous chunk
+        runs = [len(m) for m in re.findall(rb'\}+', chunk)]
+        if len(runs) > 0:
+            if self._run > 0 and chunk[:1] == b'}':
+                runs[0] += self._run
+            elif self._run > 0:
+                self._add_run(self._run)
+            for run in runs[:-1]:
+                self._add_run(run)
+            self._run = runs[-1] if chunk[-1:] == b'}' else 0
+            if self._run == 0:
+                self._add_run(runs[-1])
+        elif self._run > 0:
+            self._add_run(self._run)
+            self._run = 0
+
+        # numbers must not be split at the chunk boundary -> keep the incomplete last token
+        buffer = self._carry + chunk
+        text = buffer.translate(self._TABLE)
+        cut = text.rfind(b' ') + 1
+        self._carry = buffer[cut:]
+        if cut > 0 and not text[:cut].isspace():
+            self._arrays.append(np.fromstring(text[:cut], dtype=self.dtype, sep=' '))
+
+    def _add_run(self, run):
+        self._runs[run] = self._runs.get(run, 0) + 1
+
+    def result(self):
+        '''
+        finish parsing and return the values as numpy array in the shape of the nested csv encoding, 
+        the last axis holds the bands of multi-band coverages
+        '''
+        if self._carry.strip(b'{}", \n\r\t') != b'':
+            self.feed(b' ')
+        if self._run > 0:
+            self._add_run(self._run)
+            self._run = 0
+        values = np.concatenate(self._arrays) if len(self._arrays) > 0 else np.empty(0, dtype=self.dtype)
+
+        bands = self._bands or 1
+        depth = self._depth or 0
+        # number of groups closed at nesting level m (counted from the inside): runs of at least m braces
+        groups = [sum(n for run, n in self._runs.items() if run >= m) for m in range(1, depth + 1)]
+        shape = []
+        if depth > 0 and groups[-1] > 0:
+            if groups[-1] > 1:
+                shape.append(groups[-1]) # top level groups are only separated by commas
+            for m in range(depth - 1, 0, -1):
+                shape.append(groups[m - 1] // groups[m])
+            shape.append(values.size // bands // groups[0])
+        else:
+            shape.append(values.size // bands)
+        if bands > 1:
+            shape.append(bands)
+
+        if int(np.prod(shape)) != values.size:
+            # irregular nesting -> flat array
+            return values
+        return values.reshape(shape)
+
+
+@instrument.timed('decode')
+def parse_csv(content, dtype=None):
+    '''
+    parse a rasdaman text/csv response body into a typed numpy array
+    
+    PARAMETERS:
+        content (bytes): response body, e.g. response.content
+        dtype (numpy.dtype(opt)): data type of the result. Defaults to float64.
+        
+    RETURNS:
+        values (numpy.ndarray): values in the shape of the nested csv encoding, multi-band values in the last axis
+    
+    '''
+    parser = CSVStreamParser(dtype)
+    parser.feed(content)
+    return parser.result()
+
+
+def parse_csv_response(response, dtype=None, chunk_size=1024*1024):
+    '''
+    parse the text/csv body of a response, streamed requests (stream=True) are parsed chunk by chunk 
+    without holding the whole body in memory
+    
+    PARAMETERS:
+        response (requests.models.Response): response object
+        dtype (numpy.dtype(opt)): data type of the result. Defaults to float64.
+        chunk_size (int(opt)): size of the chunks in bytes. Defaults to 1 MB.
+        
+    RETURNS:
+        values (numpy.ndarray): see parse_csv
+    
+    '''
+    if getattr(response, '_content_consumed', True):
+        return parse_csv(response.content, dtype)
+    parser = CSVStreamParser(dtype)
+    for chunk in response.iter_content(chunk_size=chunk_size):
+        parser.feed(chunk)
+    return parser.result()
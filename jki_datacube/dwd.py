@@ -0,0 +1,197 @@
+import datetime
+from concurrent.futures import ThreadPoolExecutor
+
+import numpy as np
+
+from .catalog import get_catalog
+from .client import client
+from .crs import transform_coords
+from .decode import parse_csv, decode_netcdf
+from .misc import get_point_clusters
+from .query import WCSQuery
+
+
+def get_precipitation_from_point(startdate, enddate, layer, easting, northing, host, user='', pw='', epsg=32632, printout=False, get_query=False, use_credentials=False):
+    '''
+    get precipitation data from JKI DataCube
+    
+    PARAMETERS:
+        startdate (str): YYYY-MM-DD
+        enddate (str): YYYY-MM-DD
+        layer (str): layer name of the data cube (coverage ID) 
+        easting (float): longitude coordinate
+        northing (float): latitude coordinate
+        host (str): the host adress of the Data Cube
+        epsg (int): defines coordinate reference system (CRS) of the input (easting and northing) and output coordinates. Defaults to 32632.
+        user (str): credentials username
+        pw (str): credentials password
+        printout (bool(opt)): If True, some information will be printed about the success of request. Defaults to False.
+        get_query (bool(opt)): If True, final WCS URL will be printed. Defaults to False. 
+        use_credentials (bool(opt)): If True: personal credentials for datacube service will be used. Defaults to False.
+        
+    RETURNS:
+        float_list (list): list of daily sums of precipitation in mm as float numbers
+    
+    '''
+    try:
+        query = _get_point_query(startdate, enddate, layer, easting, northing, epsg)
+        if get_query == True:
+            print(query.url(host))
+        
+        # run querry
+        if use_credentials == True:
+            response = client.send(query, host, auth=(user,pw))
+        else:
+            response = client.send(query, host)
+        
+        # check if query successful
+        if response.status_code == 200: # status code 200 means request wasd successful
+            if printout==True:
+                print('request was sucessfull! Request Status: {}'.format(response.status_code))
+            return _parse_precipitation(response.content)
+            
+        elif response.status_code == 404: # status code 404 means bad request
+            if printout==True:
+                print('bad request! Request Status: {}'.format(response.status_code))
+                print('response content: ', response.text)
+            return response
+        else:
+            if printout==True:
+                print('something went wrong. Request was answered with request code: {}. URL: {}'.format(response.status_code, response.url))
+                print('response content: ', response.text)
+            else:
+                pass
+            return response
+   
+
+    except Exception as e:
+        print(e)
+
+
+def _get_point_query(startdate, enddate, layer, easting, northing, epsg):
+    # DWD data cube are stored in EPSG 31467 - 
+    x,y = transform_coords(float(easting), float(northing), epsg, 31467)
+    return WCSQuery(layer).subset('ansi', startdate, enddate).subset('E', float(x)).subset('N', float(y)).format('text/csv')
+
+
+def _parse_precipitation(content):
+    # text/csv time series of a point -> daily sums in mm, no data (-9999) gives zeros
+    values = parse_csv(content).ravel()
+    float_list = values.tolist()
+    
+    if float_list[0] != -9999 and len(float_list)>1:
+        values[values == -9999] = 0.0
+        values /= 10
+        return values.tolist()
+    elif float_list[0] == -9999:
+        print('No precipitation data, returning a list of zeros...')
+        float_list = [0] * len(float_list)
+        return float_list
+
+
+def get_precipitation_from_points(startdate, enddate, layer, eastings, northings, host, user='', pw='', epsg=32632, max_extent=50000, buffer=1000, max_workers=4, printout=False, get_query=False, use_credentials=False):
+    '''
+    get precipitation data for many points from JKI DataCube
+    
+    All coordinates are reprojected at once. Nearby points are grouped into clusters of at most max_extent x max_extent, 
+    for every cluster the enclosing 3-D block (time, E, N) is requested once as netCDF and sampled locally.
+    
+    PARAMETERS:
+        startdate (str): YYYY-MM-DD
+        enddate (str): YYYY-MM-DD
+        layer (str): layer name of the data cube (coverage ID) 
+        eastings (array-like): longitude coordinates
+        northings (array-like): latitude coordinates
+        host (str): the host adress of the Data Cube
+        user (str): credentials username
+        pw (str): credentials password
+        epsg (int): defines coordinate reference system (CRS) of the input coordinates. Defaults to 32632.
+        max_extent (float(opt)): maximum width and height of a cluster in meters (EPSG 31467). Defaults to 50000.
+        buffer (float(opt)): buffer around the bounding box of a cluster in meters, has to be at least one pixel. Defaults to 1000.
+        max_workers (int(opt)): maximum number of concurrent requests. Defaults to 4.
+        printout (bool(opt)): If True, some information will be printed about the success of request. Defaults to False.
+        get_query (bool(opt)): If True, final WCS URLs will be printed. Defaults to False. 
+        use_credentials (bool(opt)): If True: personal credentials for datacube service will be used. Defaults to False.
+        
+    RETURNS:
+        precipitation (numpy.ndarray): float32 array of shape (n_points, n_days) with daily sums of precipitation in mm, 
+            n_days are the days from startdate to enddate (inclusive), NaN if a point or day could not be sampled
+    
+    '''
+    # axis labels of the layer (E/N), the catalog raises an error for unknown layers
+    try:
+        x_axis, y_axis = get_catalog(host, user=user, pw=pw, use_credentials=use_credentials).validate(layer).xy_axes
+    except ValueError:
+        raise
+    except Exception as e:
+        # catalog not available -> axis labels of the DWD data cubes
+        if printout==True:
+            print('catalog not available, using the axes E and N: {}'.format(e))
+        x_axis, y_axis = 'E', 'N'
+
+    # DWD data cube are stored in EPSG 31467
+    xs, ys = transform_coords(np.asarray(eastings, dtype=np.float64), np.asarray(northings, dtype=np.float64), epsg, 31467)
+    auth = (user, pw) if use_credentials == True else None
+    base = WCSQuery(layer).subset('ansi', startdate, enddate).format('application/netcdf')
+
+    def fetch(members):
+        query = base.bbox(xs[members].min() - buffer, ys[members].min() - buffer, xs[members].max() + buffer, ys[members].max() + buffer,
+                          axes=(x_axis, y_axis))
+        if get_query == True:
+            print(query.url(host))
+        try:
+            response = client.send(query, host, auth=auth)
+            if response.status_code != 200:
+                if printout==True:
+                    print('something went wrong. Request was answered with request code: {}. URL: {}'.format(response.status_code, response.url))
+                return members, None, None
+            axes, bands = decode_netcdf(response.content)
+        except Exception as e:
+            # a failed cluster (timeout, connection error, broken netCDF) only leaves its rows NaN
+            if printout==True:
+                print('something went wrong: {}'.format(e))
+            return members, None, None
+        dims, block = next(iter(bands.values()))
+        # index of the nearest pixel center of every point along E and N
+        e = _nearest_index(axes[x_axis], xs[members])
+        n = _nearest_index(axes[y_axis], ys[members])
+        time_axis = next((d for d in dims if d not in (x_axis, y_axis)), None)
+        block = np.transpose(block, [dims.index(d) for d in dims if d not in (x_axis, y_axis)] + [dims.index(x_axis), dims.index(y_axis)])
+        values = block[..., e, n].T.reshape(len(members), -1)
+        if time_axis in axes:
+            # column of every returned day: ANSI day number - ANSI day number of startdate
+            columns = np.floor(np.asarray(axes[time_axis], dtype=np.float64) - start).astype(np.int64)
+        else:
+            columns = np.arange(values.shape[1])
+        return members, columns, values
+
+    # the result exists before the first request, so failed requests only leave NaN rows
+    start = (datetime.date.fromisoformat(startdate) - datetime.date(1600, 12, 31)).days
+    n_days = (datetime.date.fromisoformat(enddate) - datetime.date.fromisoformat(startdate)).days + 1
+    precipitation = np.full((len(xs), max(n_days, 0)), np.nan, dtype=np.float32)
+    clusters = get_point_clusters(xs, ys, max_extent)
+    with ThreadPoolExecutor(max_workers=max_workers) as executor:
+        for members, columns, values in executor.map(fetch, clusters):
+            if values is None:
+                continue
+            # days outside startdate - enddate are dropped, missing days stay NaN
+            inside = (columns >= 0) & (columns < n_days)
+            precipitation[np.ix_(members, columns[inside])] = values[:, inside]
+
+    # no data (-9999) -> no precipitation, values are stored in 1/10 mm
+    np.place(precipitation, precipitation == -9999, 0)
+    precipitation /= 10
+    if printout==True:
+        print('{} points sampled with {} requests'.format(len(xs), len(clusters)))
+    return precipitation
+
+
+def _nearest_index(coords, values):
+    '''
+    index of the nearest coordinate in a regular, monotonic axis for every value
+    '''
+    coords = np.asarray(coords, dtype=np.float64)
+    if coords.size == 1:
+        return np.zeros(len(values), dtype=np.int64)
+    step = (coords[-1] - coords[0]) / (coords.size - 1)
+    return np.clip(np.rint((np.asarray(values) - coords[0]) / step), 0, coords.size - 1).astype(np.int64)
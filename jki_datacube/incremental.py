@@ -0,0 +1,147 @@
+'''
+incremental daily updates of stored field time series
+
+A daily job does not need to request the whole season again. Every field of a FieldStore keeps a watermark, the
+last date up to which its time series is complete. An update only requests the dates after the watermark, plus a
+lookback window before it, so late-arriving or reprocessed slices of the last days are picked up and overwritten:
+
+    from jki_datacube.store import FieldStore
+    from jki_datacube.incremental import update_S2_field, update_precipitation
+
+    s2 = FieldStore('~/data/s2_2020')
+    rain = FieldStore('~/data/precipitation_2020')
+    today = datetime.date.today().isoformat()
+    update_S2_field(s2, 'field_1', polygon, layer, sowing_date, today, user, pw, host)
+    update_precipitation(rain, 'field_1', easting, northing, 'DWD_Niederschlag', '2020-01-01', today, host)
+    dates, bands, precipitation = rain.read('field_1')   # precipitation[:, 0, 0, 0] in mm
+
+Failed requests (connection errors, 429/5xx after all retries) keep the watermark before their date, so they are
+requested again by the next run. Slices, which arrive later than the lookback window, are not detected. Updates bypass
+the response cache, since a cached answer of a date, which was requested before its slice arrived, would hide it.
+'''
+import datetime
+
+import numpy as np
+
+from .client import client
+from .decode import parse_csv
+from .dwd import _get_point_query
+from .s2 import _get_dates, get_S2_imagery_range
+
+
+def _get_update_range(store, field_id, startdate, enddate, lookback):
+    # first date of an update: the last lookback days up to the watermark are requested again, not before startdate
+    watermark = store.watermark(field_id)
+    if watermark is None:
+        return startdate
+    start = datetime.date.fromisoformat(watermark) - datetime.timedelta(days=lookback - 1)
+    return max(startdate, start.isoformat())
+
+
+def _day_before(date):
+    return (datetime.date.fromisoformat(date) - datetime.timedelta(days=1)).isoformat()
+
+
+def update_S2_field(store, field_id, polygon, layer, startdate, enddate, user, pw, host, lookback=10, epsg=32632, band1='NIR10', band2='R', band3='G',
+                    max_workers=8, noData=0, printout=False):
+    '''
+    request the Sentinel-2 images of a field since its last update and write them to the store
+
+    PARAMETERS:
+        store (FieldStore): store of the raw time series
+        field_id (str): field ID
+        polygon (str): polygon boundaries as WKT string
+        layer (str): layer name of the data cube (coverage ID)
+        startdate (str): YYYY-MM-DD, first date of the season (used for the first update)
+        enddate (str): YYYY-MM-DD, last date (inclusive), e.g. today
+        user (str): credentials username
+        pw (str): credentials password
+        host (str): host adress of data cube service
+        lookback (int(opt)): days up to the watermark, which are requested again (late or reprocessed slices). Defaults to 10.
+        epsg (int): coordinate reference system of the polygon and the images. Defaults to 32632.
+        band1 (str): band name (default: NIR10)
+        band2 (str): band name (default: R)
+        band3 (str): band name (default: G)
+        max_workers (int(opt)): maximum number of concurrent requests. Defaults to 8.
+        noData (int(opt)): no data value of the images. Defaults to 0.
+        printout (bool(opt)): If True, the requested range and the written dates are printed. Defaults to False.
+
+    RETURNS:
+        dates (list): dates, which were written (new or replaced)
+    '''
+    start = _get_update_range(store, field_id, startdate, enddate, lookback)
+    if start > enddate:
+        return []
+    failed = []
+
+    def successful():
+        # responses are passed on to write_responses as they arrive, which writes them in batches
+        for date, response in get_S2_imagery_range(polygon, layer, start, enddate, user, pw, host, epsg=epsg, band1=band1, band2=band2, band3=band3,
+                                                   max_workers=max_workers, use_cache=False):
+            if response is not None and response.status_code == 200:
+                yield date, response
+            elif response is None or response.status_code == 429 or response.status_code >= 500:
+                failed.append(date)
+            # other answers (e.g. 404 for days without acquisition) are final
+
+    dates = store.write_responses(field_id, successful(), bands=(band1, band2, band3), noData=noData)
+    # failed is complete, after write_responses has consumed all responses
+    store.set_watermark(field_id, enddate if len(failed) == 0 else _day_before(min(failed)))
+    if printout == True:
+        print('{}: requested {} - {}, {} dates written, {} failed, watermark {}'.format(field_id, start, enddate, len(dates), len(failed),
+                                                                                      store.watermark(field_id)))
+    return dates
+
+
+def update_precipitation(store, field_id, easting, northing, layer, startdate, enddate, host, user='', pw='', lookback=7, epsg=32632,
+                         use_credentials=False, printout=False):
+    '''
+    request the daily precipitation of a point since its last update and append it to the store
+    (one band 'precipitation' in mm with the shape (time, 1, 1, 1))
+
+    PARAMETERS:
+        store (FieldStore): store of the precipitation time series
+        field_id (str): field ID
+        easting (float): longitude coordinate
+        northing (float): latitude coordinate
+        layer (str): layer name of the data cube (coverage ID), e.g. DWD_Niederschlag
+        startdate (str): YYYY-MM-DD, first date (used for the first update)
+        enddate (str): YYYY-MM-DD, last date (inclusive), e.g. today
+        host (str): the host adress of the Data Cube
+        user (str): credentials username
+        pw (str): credentials password
+        lookback (int(opt)): days up to the watermark, which are requested again (corrected values). Defaults to 7.
+        epsg (int): coordinate reference system of easting and northing. Defaults to 32632.
+        use_credentials (bool(opt)): If True: personal credentials for datacube service will be used. Defaults to False.
+        printout (bool(opt)): If True, the requested range and the written dates are printed. Defaults to False.
+
+    RETURNS:
+        dates (list): dates, which were written (new or replaced)
+    '''
+    start = _get_update_range(store, field_id, startdate, enddate, lookback)
+    if start > enddate:
+        return []
+    query = _get_point_query(start, enddate, layer, easting, northing, epsg)
+    if use_credentials == True:
+        response = client.send(query, host, auth=(user, pw), use_cache=False)
+    else:
+        response = client.send(query, host, use_cache=False)
+    if response.status_code != 200:
+        if printout == True:
+            print('something went wrong. Request was answered with request code: {}. URL: {}'.format(response.status_code, response.url))
+        return []
+
+    values = parse_csv(response.content, dtype=np.float32).ravel()
+    days = _get_dates(start, enddate)[:len(values)]
+    # the latest days may not be available yet (no data), they are requested again by the next update
+    available = np.flatnonzero(values != -9999)
+    n = 0 if len(available) == 0 else int(available[-1]) + 1
+    values = values[:n]
+    values[values == -9999] = 0.0
+    values /= 10 # 1/10 mm -> mm
+    if n > 0:
+        store.write(field_id, days[:n], ['precipitation'], values.reshape(n, 1, 1, 1), nodata=None)
+        store.set_watermark(field_id, days[n - 1])
+    if printout == True:
+        print('{}: requested {} - {}, {} days written, watermark {}'.format(field_id, start, enddate, n, store.watermark(field_id)))
+    return days[:n]
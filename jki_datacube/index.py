@@ -0,0 +1,128 @@
+import numpy as np
+
+from . import instrument
+
+
+# band order of the default get_S2_imagery request (band1='NIR10', band2='R', band3='G')
+DEFAULT_BANDS = {'nir': 0, 'red': 1, 'green': 2}
+
+# bands needed by every vegetation/water index
+INDEX_BANDS = {
+    'savi': ('nir', 'red'),
+    'ndvi': ('nir', 'red'),
+    'evi': ('nir', 'red', 'blue'),
+    'ndwi': ('green', 'nir')
+}
+
+
+def get_valid_mask(stack, bands=None, nodata=0):
+    '''
+    get an explicit mask of valid pixels, a pixel is valid if none of the given bands holds the no data value
+
+    PARAMETERS:
+        stack (numpy.ndarray): raw bands with shape (band, y, x) or (time, band, y, x)
+        bands (list(opt)): indices of the bands to check. Defaults to None (all bands).
+        nodata (int(opt)): no data value of the raw bands. Defaults to 0.
+
+    RETURNS:
+        valid (numpy.ndarray): boolean array with shape (y, x) or (time, y, x)
+
+    '''
+    if bands is None:
+        bands = range(stack.shape[-3])
+    valid = None
+    for b in bands:
+        band_valid = stack[..., b, :, :] != nodata
+        if valid is None:
+            valid = band_valid
+        else:
+            np.logical_and(valid, band_valid, out=valid)
+    return valid
+
+
+def get_valid_pixel_portion(stack, band=0, nodata=0):
+    '''
+    get the portion of valid pixels [in %] of one band, for a time series for every time slice at once
+
+    PARAMETERS:
+        stack (numpy.ndarray): raw bands with shape (band, y, x) or (time, band, y, x)
+        band (int(opt)): index of the band to check. Defaults to 0 (NIR).
+        nodata (int(opt)): no data value of the raw bands. Defaults to 0.
+
+    RETURNS:
+        portion (float or numpy.ndarray): valid pixel portion [in %] (per time slice)
+
+    '''
+    b = stack[..., band, :, :]
+    return np.count_nonzero(b != nodata, axis=(-2, -1)) / (b.shape[-2] * b.shape[-1]) * 100
+
+
+@instrument.timed('index')
+def calculate_index(stack, index='savi', bands=None, nodata=0, scale=10000, L=0.5, valid=None, out=None):
+    '''
+    calculate a vegetation/water index from raw (scaled integer) Sentinel-2 bands in float32
+
+    The index is computed directly on the raw digital numbers (the reflectance scale is folded into the
+    constants), so no float64 reflectance copies are created. Pixels with no data in one of the used bands
+    are set to NaN, real index values of 0 are kept.
+
+    PARAMETERS:
+        stack (numpy.ndarray): raw bands with shape (band, y, x) or a whole time series with shape (time, band, y, x)
+        index (str(opt)): one of savi, ndvi, evi, ndwi. Defaults to savi.
+        bands (dict(opt)): band name (nir, red, green, blue) -> index in the band axis. Defaults to DEFAULT_BANDS.
+        nodata (int(opt)): no data value of the raw bands. Defaults to 0.
+        scale (float(opt)): scale factor of the raw bands (reflectance = raw / scale). Defaults to 10000.
+        L (float(opt)): soil brightness correction factor of the SAVI. Defaults to 0.5.
+        valid (numpy.ndarray(opt)): boolean mask of valid pixels with shape (y, x) or (time, y, x), e.g. a field mask.
+            Defaults to None (derived from the no data value).
+        out (numpy.ndarray(opt)): float32 array with shape (y, x) or (time, y, x), which receives the result. Defaults to None.
+
+    RETURNS:
+        index (numpy.ndarray): float32 array with shape (y, x) or (time, y, x)
+
+    '''
+    index = index.lower()
+    if index not in INDEX_BANDS:
+        raise ValueError('unknown index {}, choose one of {}'.format(index, ', '.join(INDEX_BANDS)))
+    bands = DEFAULT_BANDS if bands is None else bands
+    missing = [b for b in INDEX_BANDS[index] if b not in bands]
+    if len(missing) > 0:
+        raise ValueError('index {} needs the band(s) {}'.format(index, ', '.join(missing)))
+
+    # views on the raw bands, nothing is copied here
+    used = [bands[b] for b in INDEX_BANDS[index]]
+    b = {name: stack[..., bands[name], :, :] for name in INDEX_BANDS[index]}
+    shape = stack.shape[:-3] + stack.shape[-2:]
+    if out is None:
+        out = np.empty(shape, dtype=np.float32)
+
+    if index in ('savi', 'ndvi'):
+        # SAVI = (1 + L) * (NIR - RED) / (NIR + RED + L), with raw values L is scaled as well
+        np.subtract(b['nir'], b['red'], out=out, dtype=np.float32)
+        denominator = np.add(b['nir'], b['red'], dtype=np.float32)
+        if index == 'savi':
+            denominator += L * scale
+            out *= 1 + L
+    elif index == 'evi':
+        # EVI = 2.5 * (NIR - RED) / (NIR + 6 * RED - 7.5 * BLUE + 1)
+        np.subtract(b['nir'], b['red'], out=out, dtype=np.float32)
+        out *= 2.5
+        denominator = np.multiply(b['red'], 6, dtype=np.float32)
+        denominator += b['nir']
+        denominator -= np.multiply(b['blue'], 7.5, dtype=np.float32)
+        denominator += scale
+    else:
+        # NDWI = (GREEN - NIR) / (GREEN + NIR)
+        np.subtract(b['green'], b['nir'], out=out, dtype=np.float32)
+        denominator = np.add(b['green'], b['nir'], dtype=np.float32)
+
+    nonzero = denominator != 0
+    np.divide(out, denominator, out=out, where=nonzero)
+    del denominator
+
+    if valid is None:
+        valid = get_valid_mask(stack, used, nodata)
+    np.logical_and(nonzero, valid, out=nonzero)
+    np.logical_not(nonzero, out=nonzero)
+    out[nonzero] = np.nan
+    return out
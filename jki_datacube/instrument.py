@@ -0,0 +1,247 @@
+'''
+instrumentation of the hot paths (request, decode, compute)
+
+The clients, decoders and index functions record per-stage timings and counters here:
+
+    stages (seconds)    build (query/URL), throttle (waiting for the rate limit/slot), connect (DNS + TCP + TLS, asyncio
+                        client only), ttfb (request sent -> response headers), download (body), decode, index
+    counters            requests, cache_hits, cache_misses, retries, bytes, errors
+
+A slow run can then be attributed to the server (ttfb), the network (connect, download) or the CPU (decode, index):
+
+    from jki_datacube import instrument
+    ...
+    print(instrument.to_prometheus())   # Prometheus text format, e.g. for a textfile collector or a /metrics endpoint
+    instrument.snapshot()               # the same as dictionary
+    instrument.add_hook(print)          # every Event is passed to the callback
+    instrument.enable_opentelemetry()   # every stage becomes an OpenTelemetry span (requires opentelemetry-api)
+'''
+import functools
+import threading
+import time
+from contextlib import contextmanager
+from typing import NamedTuple
+
+from .throttle import get_metrics as get_throttle_metrics
+
+
+class Event(NamedTuple):
+    '''
+    a measurement passed to the hooks
+    '''
+    kind: str        # 'stage' or 'count'
+    name: str        # stage or counter name
+    value: float     # duration in seconds or counter increment
+    labels: tuple    # sorted (name, value) pairs, e.g. (('host', 'example.com'),)
+    start: float     # time.time() at the start of the stage (the time of the count for counters)
+
+
+_LOCK = threading.Lock()
+_TIMINGS = {}   # (name, labels) -> [count, sum, max]
+_COUNTERS = {}  # (name, labels) -> value
+_HOOKS = []
+_ENABLED = True
+
+
+def set_enabled(enabled):
+    '''
+    switch the instrumentation on or off (it is on by default)
+    '''
+    global _ENABLED
+    _ENABLED = bool(enabled)
+
+
+def add_hook(callback):
+    '''
+    register a callback, which is called with every Event (from the thread or task, which recorded it)
+    '''
+    with _LOCK:
+        _HOOKS.append(callback)
+
+
+def remove_hook(callback):
+    '''
+    unregister a callback
+    '''
+    with _LOCK:
+        if callback in _HOOKS:
+            _HOOKS.remove(callback)
+
+
+def _emit(event):
+    for callback in list(_HOOKS):
+        callback(event)
+
+
+def record(name, duration, start=None, **labels):
+    '''
+    record the duration of a stage, which was measured elsewhere (e.g. response.elapsed)
+
+    PARAMETERS:
+        name (str): stage name
+        duration (float): duration in seconds
+        start (float(opt)): time.time() at the start of the stage. Defaults to now - duration.
+        labels: labels of the measurement, e.g. host='example.com'
+    '''
+    if not _ENABLED:
+        return
+    key = (name, tuple(sorted(labels.items())))
+    with _LOCK:
+        timing = _TIMINGS.get(key)
+        if timing is None:
+            _TIMINGS[key] = [1, duration, duration]
+        else:
+            timing[0] += 1
+            timing[1] += duration
+            if duration > timing[2]:
+                timing[2] = duration
+    if len(_HOOKS) > 0:
+        _emit(Event('stage', name, duration, key[1], time.time() - duration if start is None else start))
+
+
+def count(name, value=1, **labels):
+    '''
+    increase a counter
+
+    PARAMETERS:
+        name (str): counter name
+        value (float(opt)): increment. Defaults to 1.
+        labels: labels of the counter, e.g. host='example.com'
+    '''
+    if not _ENABLED:
+        return
+    key = (name, tuple(sorted(labels.items())))
+    with _LOCK:
+        _COUNTERS[key] = _COUNTERS.get(key, 0) + value
+    if len(_HOOKS) > 0:
+        _emit(Event('count', name, value, key[1], time.time()))
+
+
+@contextmanager
+def stage(name, **labels):
+    '''
+    context manager, which records the duration of a stage
+
+        with stage('decode'):
+            ...
+    '''
+    if not _ENABLED:
+        yield
+        return
+    start = time.time()
+    t0 = time.perf_counter()
+    try:
+        yield
+    finally:
+        record(name, time.perf_counter() - t0, start=start, **labels)
+
+
+def timed(name):
+    '''
+    decorator, which records the duration of every call of a function as stage
+    '''
+    def decorator(function):
+        @functools.wraps(function)
+        def wrapper(*args, **kwargs):
+            if not _ENABLED:
+                return function(*args, **kwargs)
+            start = time.time()
+            t0 = time.perf_counter()
+            try:
+                return function(*args, **kwargs)
+            finally:
+                record(name, time.perf_counter() - t0, start=start)
+        return wrapper
+    return decorator
+
+
+def snapshot():
+    '''
+    current state of all timings and counters
+
+    RETURNS:
+        metrics (dict): {'stages': {(name, labels): {'count', 'sum', 'max', 'mean'}}, 'counters': {(name, labels): value},
+            'throttles': host -> throttle metrics}
+    '''
+    with _LOCK:
+        stages = {key: {'count': c, 'sum': s, 'max': m, 'mean': s / c} for key, (c, s, m) in _TIMINGS.items()}
+        counters = dict(_COUNTERS)
+    return {'stages': stages, 'counters': counters, 'throttles': get_throttle_metrics()}
+
+
+def reset():
+    '''
+    set all timings and counters back to zero
+    '''
+    with _LOCK:
+        _TIMINGS.clear()
+        _COUNTERS.clear()
+
+
+def _format_labels(labels):
+    if len(labels) == 0:
+        return ''
+    return '{' + ','.join('{}="{}"'.format(k, str(v).replace('\\', '\\\\').replace('"', '\\"')) for k, v in labels) + '}'
+
+
+def to_prometheus(prefix='jki_datacube'):
+    '''
+    all timings, counters and throttle states in the Prometheus text exposition format
+
+    PARAMETERS:
+        prefix (str(opt)): prefix of the metric names. Defaults to jki_datacube.
+
+    RETURNS:
+        text (str): metrics, one sample per line
+    '''
+    metrics = snapshot()
+    lines = []
+    if len(metrics['stages']) > 0:
+        lines.append('# HELP {}_stage_seconds duration of the request, decode and compute stages'.format(prefix))
+        lines.append('# TYPE {}_stage_seconds summary'.format(prefix))
+        for (name, labels), timing in sorted(metrics['stages'].items()):
+            labels = _format_labels((('stage', name),) + labels)
+            lines.append('{}_stage_seconds_sum{} {!r}'.format(prefix, labels, timing['sum']))
+            lines.append('{}_stage_seconds_count{} {}'.format(prefix, labels, timing['count']))
+        lines.append('# TYPE {}_stage_seconds_max gauge'.format(prefix))
+        for (name, labels), timing in sorted(metrics['stages'].items()):
+            lines.append('{}_stage_seconds_max{} {!r}'.format(prefix, _format_labels((('stage', name),) + labels), timing['max']))
+    for name in sorted(set(name for name, labels in metrics['counters'])):
+        lines.append('# TYPE {}_{}_total counter'.format(prefix, name))
+        for (n, labels), value in sorted(metrics['counters'].items()):
+            if n == name:
+                lines.append('{}_{}_total{} {}'.format(prefix, name, _format_labels(labels), value))
+    gauges = ('limit', 'in_flight', 'latency', 'baseline_latency', 'tokens')
+    for name in gauges:
+        samples = [(host, m[name]) for host, m in sorted(metrics['throttles'].items()) if m[name] is not None and m[name] != float('inf')]
+        if len(samples) > 0:
+            lines.append('# TYPE {}_throttle_{} gauge'.format(prefix, name))
+            for host, value in samples:
+                lines.append('{}_throttle_{}{{host="{}"}} {}'.format(prefix, name, host, value))
+    return '\n'.join(lines) + '\n'
+
+
+def enable_opentelemetry(tracer=None):
+    '''
+    export every stage as OpenTelemetry span (counters become span-less events and are ignored)
+
+    PARAMETERS:
+        tracer (opentelemetry.trace.Tracer(opt)): tracer of the spans. Defaults to the tracer 'jki_datacube' of the global provider.
+
+    RETURNS:
+        hook (callable): the registered hook, pass it to remove_hook to stop the export
+    '''
+    from opentelemetry import trace # optional dependency
+
+    if tracer is None:
+        tracer = trace.get_tracer('jki_datacube')
+
+    def hook(event):
+        if event.kind != 'stage':
+            return
+        start = int(event.start * 1e9)
+        span = tracer.start_span(event.name, start_time=start, attributes=dict(event.labels))
+        span.end(end_time=start + int(event.value * 1e9))
+
+    add_hook(hook)
+    return hook
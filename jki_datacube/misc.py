@@ -0,0 +1,240 @@
+import io
+from datetime import date, timedelta
+
+import numpy as np
+
+from . import instrument
+from ._lazy import lazy_import
+from .catalog import get_catalog
+from .index import calculate_index, get_valid_pixel_portion
+
+ipyleaflet = lazy_import('ipyleaflet')
+rasterio = lazy_import('rasterio')
+gpd = lazy_import('geopandas')
+
+
+def get_coverages(host, user='', pw='', use_credentials=False):
+    '''
+    get a list of all available data cubes
+    
+    PARAMETERS:
+        host (str): host adress of data cube service
+        user (str): credentials username
+        pw (str): credentials password
+        use_credentials (bool(opt)): If True: personal credentials for datacube service will be used. Defaults to False.
+        
+    RETURNS:
+        coverages (list): list of all available data cubes on given host
+    '''
+    return list(get_catalog(host, user=user, pw=pw, use_credentials=use_credentials).coverages)
+
+def get_metadata_from_datacube(layer, host, user='', pw='', use_credentials=False):
+    '''
+    get a list of all available data cubes
+    
+    PARAMETERS:
+        layer (str): coverage name of the data cube
+        host (str): host adress of data cube service
+        user (str): credentials username
+        pw (str): credentials password
+        use_credentials (bool(opt)): If True: personal credentials for datacube service will be used. Defaults to False.
+        
+    RETURNS:
+         metadata (dict): list of all available data cubes on given host
+    '''
+    metadata = get_catalog(host, user=user, pw=pw, use_credentials=use_credentials).get_metadata(layer)
+    
+    return  metadata
+
+def calculate_savi(img, valid_pixel_portion=50, noData=0):
+    '''
+    calculate the SAVI of a Sentinel-2 image requested with get_S2_imagery (band1: NIR, band2: red)
+    
+    PARAMETERS:
+        img (requests.models.Response): response object returned by get_S2_imagery
+        valid_pixel_portion (float(opt)): minimum portion of valid pixels [in %]. Defaults to 50.
+        noData (int(opt)): no data value of the bands. Defaults to 0.
+        
+    RETURNS:
+        [savi, meta] (list): float32 SAVI array (NaN for no data) and the raster metadata, 
+            None if the valid pixel portion is not satisfied
+    
+    '''
+    try:
+        with instrument.stage('decode'), rasterio.open(io.BytesIO(img.content), nodata=noData) as src:
+            bands = src.read([1, 2]) # NIR, red
+            meta = src.meta
+            meta.update({
+                'dtype': rasterio.float32,
+                'count': 1
+            })
+        
+        vp = get_valid_pixel_portion(bands, band=0, nodata=noData)
+        
+        if vp > valid_pixel_portion:
+            savi = calculate_index(bands, 'savi', bands={'nir': 0, 'red': 1}, nodata=noData)
+            return [savi, meta]
+
+    except Exception as e:
+        print(e)
+
+        
+        
+def get_map_coords(geometry):
+    if isinstance(geometry, list) and len(geometry) == 2:
+        return [(geometry[1],geometry[0]),[]]
+    
+    elif isinstance(geometry, list) and len(geometry) > 2:
+        lon = []
+        lat = []
+        for x,y in geometry:
+            lon.append(x)
+            lat.append(y)
+        polygon = []
+        for i in range(len(lon)):
+            polygon.append((lat[i],lon[i]))
+    
+        return [(sum(lat)/len(lat), sum(lon)/len(lon)), polygon]
+    
+    elif (isinstance(geometry, str) and geometry.endswith('.geojson')) or (isinstance(geometry, str) and geometry.endswith('.shp')):
+        location = gpd.read_file(geometry).to_crs('EPSG:4326')
+        polygones = location['geometry']
+        
+        if len(polygones) == 1:
+            coords = list(polygones[0].exterior.coords)
+            center = (polygones[0].centroid.coords.xy[1][0], polygones[0].centroid.coords.xy[0][0])
+            
+            lon = []
+            lat = []
+            for x,y in coords:
+                lon.append(x)
+                lat.append(y)
+            polygon = []
+            for i in range(len(lon)):
+                polygon.append((lat[i],lon[i]))
+            
+            return  [center, polygon]
+        
+        elif len(polygones) > 1:
+            
+            all_polygones = []
+            
+            for polygon in polygones:
+                coords_ = list(polygon.exterior.coords)
+                center = (polygon.centroid.coords.xy[1][0], polygon.centroid.coords.xy[0][0])
+
+                lon = []
+                lat = []
+                for x,y in coords_:
+                    lon.append(x)
+                    lat.append(y)
+                polygon_ = []
+                for i in range(len(lon)):
+                    polygon_.append((lat[i],lon[i]))
+                
+                all_polygones.append([center, polygon_])
+                
+            return  all_polygones
+    
+    else:
+        print('Something went wrong with geometry input. Pleace insert point as list of tuples or polygone(s) as geojson file!')
+            
+
+def get_map(geometry, zoom=8):
+    '''
+    get PHASE data from JKI DataCube
+    
+    PARAMETERS:
+        year (str): 
+        
+    RETURNS:
+        list_ (list): 
+    
+    '''
+    if len(get_map_coords(geometry)) == 2 and isinstance(get_map_coords(geometry)[0], tuple):
+        center = get_map_coords(geometry)[0]  # lat , lon
+        polygon = ipyleaflet.Polygon(locations=[get_map_coords(geometry)[1]], color="green", fill_color="green")
+        m = ipyleaflet.Map(center=center, zoom=zoom)
+        marker = ipyleaflet.Marker(location=center, draggable=True)
+        m.add_layer(marker);
+        m.add_layer(polygon);
+        display(m)
+
+    else:
+        center = get_map_coords(geometry)[0][0]
+        m = ipyleaflet.Map(center=center, zoom=zoom)
+
+        get_map_coords(geometry)[1]
+        for area in get_map_coords(geometry):
+            marker = ipyleaflet.Marker(location=area[0], draggable=True)
+            m.add_layer(marker);
+            polygon = ipyleaflet.Polygon(locations=[area[1]], color="green", fill_color="green")
+            m.add_layer(polygon);
+
+        display(m)        
+
+def get_all_dates(year):
+    """This function returns a list of all days of the given year.
+
+    Args:
+        year (str): year YYYY
+
+    Returns:
+        list: List of days of teh given year
+    """
+    try:
+        start = date(int(year),1,1)
+        end = date(int(year),12,31)
+
+
+        delta = end - start
+
+        days = []
+
+        for i in range(delta.days + 1):
+            day = start + timedelta(days=i)
+            day  = day.strftime('%Y-%m-%d')
+            days.append(day)
+
+        
+        
+        return days
+    except Exception as e:
+        print('Error in get_all_dates function: {}'.format(e))
+
+
+def get_point_clusters(xs, ys, max_extent):
+    '''
+    group points into clusters, whose bounding boxes are at most max_extent wide and high, using a regular grid
+    
+    PARAMETERS:
+        xs (array-like): easting coordinates
+        ys (array-like): northing coordinates
+        max_extent (float): size of a grid cell in CRS units
+        
+    RETURNS:
+        clusters (list): list of numpy arrays with the indices of the points of every cluster
+    '''
+    xs = np.asarray(xs, dtype=np.float64)
+    ys = np.asarray(ys, dtype=np.float64)
+    if xs.size == 0:
+        return []
+    cells = np.stack([np.floor(xs / max_extent), np.floor(ys / max_extent)], axis=1)
+    _, labels = np.unique(cells, axis=0, return_inverse=True)
+    labels = labels.ravel()
+    order = np.argsort(labels, kind='stable')
+    splits = np.flatnonzero(np.diff(labels[order])) + 1
+    return np.split(order, splits)
+
+
+def get_polygon_wkt(geometry):
+    '''
+    get the WKT string of a (shapely) polygon in the form expected by the CLIP parameter of rasdaman
+    
+    PARAMETERS:
+        geometry (shapely.geometry.Polygon): polygon, e.g. one entry of GeoDataFrame.geometry
+        
+    RETURNS:
+        polygon (str): WKT string, e.g. POLYGON((x1 y1, x2 y2, ...))
+    '''
+    return str(geometry).replace(' (', '(')
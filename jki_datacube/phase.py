@@ -0,0 +1,374 @@
+import datetime
+import io
+from concurrent.futures import ThreadPoolExecutor
+
+import numpy as np
+
+from ._lazy import lazy_import
+from .catalog import get_catalog
+from .client import client
+from .decode import parse_csv
+from .misc import get_point_clusters
+from .query import WCSQuery
+
+rasterio = lazy_import('rasterio')
+
+
+# available crop types and their PHASE layers (coverage IDs) on the JKI DataCube
+PHASE_LAYERS = {
+    'corn': 'PHASE_215_Mais',
+    'grassland': 'PHASE_201_Dauergruenland',
+    'winterwheat': 'PHASE_202_Winterweizen',
+    'winterrye': 'PHASE_203_Winterroggen',
+    'winterbarley': 'PHASE_204_Wintergerste',
+    'winterrape': 'PHASE_205_Winterraps',
+    'winteroat': 'PHASE_208_Hafer',
+    'fodderbeet': 'PHASE_252_Futter_Ruebe',
+    'sugarbeet': 'PHASE_253_ZuckerRuebe',
+    'apple': 'PHASE_311_Apfel'
+}
+
+
+def get_phases_from_point(year, crop, easting, northing, host, epsg=32632, printout=False, get_query=False, use_table=False):
+    '''
+    get PHASE data from JKI DataCube 
+    (more info: https://sf.julius-kuehn.de/openapi/phase/)
+    
+    PARAMETERS:
+        year (str): year YYYY
+        crop (str): choose one of the available crops on JKI DataCube
+        easting (float): longitude coordinate
+        northing (float): latitude coordinate
+        host (str): the host adress of the Data Cube
+        epsg (int): defines coordinate reference system (CRS) of the input (easting and northing) and output coordinates. Defaults to 32632.
+        printout (bool(opt)): If True, some information will be printed about the success of request. Defaults to False.
+        get_query (bool(opt)): If True, final WCS URL will be printed. Defaults to False.
+        use_table (bool(opt)): If True, points inside a table registered with add_phase_table are answered without a request.
+            Table values are whole DOYs (uint16) and no data (0) is returned as NaN, unlike the values of the data cube.
+            Defaults to False.
+        
+    RETURNS:
+        list_ (list): A list of the potential starting dates of the phenological stages.
+    
+    '''
+    try:
+        # available crop types
+        if crop in PHASE_LAYERS:
+            rasdaman_layer = PHASE_LAYERS[crop]
+        else:
+            print('wrong name for crop name!')
+
+        # points inside a registered lookup table need no request
+        if use_table == True:
+            list_ = _lookup_phase_tables(year, crop, easting, northing, epsg)
+            if list_ is not None:
+                return list_
+        
+        query = _get_point_query(rasdaman_layer, year, easting, northing, epsg)
+        if get_query == True:
+            print(query.url(host))
+
+        # run query
+        response = client.send(query, host)
+        
+        
+        # check if query successful
+        if response.status_code == 200: # status code 200 means request wasd successful
+            if printout==True:
+                print('request was sucessfull! Request Status: {}'.format(response.status_code))
+            # transform binary result to python-like list
+            list_ = parse_csv(response.content).ravel().tolist()
+            return list_
+        elif response.status_code == 404: # status code 404 means bad request
+            if printout==True:
+                print('bad request! Request Status: {}'.format(response.status_code))
+                print('response content: ', response.text)
+            return response
+        else:
+            if printout==True:
+                print('something went wrong. Request was answered with request code: {}. URL: {}'.format(response.status_code, response.url))
+                print('response content: ', response.text)
+            else:
+                pass
+            return response
+        
+    except Exception as e:
+        print('something went wrong: {}'.format(e))
+
+
+def _get_point_query(rasdaman_layer, year, easting, northing, epsg):
+    date = str(year)+'-01-01' # multiband layers of the whole year are always stored at the 1st of january
+    return (WCSQuery(rasdaman_layer).subset('ansi', date).crs(epsg)
+            .subset('E', easting, easting).subset('N', northing, northing).format('text/csv'))
+
+
+def get_phases_from_points(year, crop, xs, ys, host, epsg=32632, max_extent=50000, buffer=1000, max_workers=4, printout=False, get_query=False):
+    '''
+    get PHASE data for many points (e.g. all field centroids of a region) from JKI DataCube 
+    (more info: https://sf.julius-kuehn.de/openapi/phase/)
+    
+    Nearby points are grouped into clusters of at most max_extent x max_extent. For every cluster one 
+    bounding box is requested as GeoTIFF and all points of the cluster are sampled locally.
+    
+    PARAMETERS:
+        year (str): year YYYY
+        crop (str): choose one of the available crops on JKI DataCube (see PHASE_LAYERS)
+        xs (array-like): easting coordinates
+        ys (array-like): northing coordinates
+        host (str): the host adress of the Data Cube
+        epsg (int): defines coordinate reference system (CRS) of the input coordinates. Defaults to 32632.
+        max_extent (float(opt)): maximum width and height of a cluster in CRS units. Defaults to 50000.
+        buffer (float(opt)): buffer around the bounding box of a cluster in CRS units, has to be at least one PHASE pixel. Defaults to 1000.
+        max_workers (int(opt)): maximum number of concurrent requests. Defaults to 4.
+        printout (bool(opt)): If True, some information will be printed about the success of request. Defaults to False.
+        get_query (bool(opt)): If True, final WCS URLs will be printed. Defaults to False.
+        
+    RETURNS:
+        phases (numpy.ndarray): array of shape (n_points, n_phases) with the potential starting dates (DOY) of the 
+            phenological stages, NaN if a point could not be sampled (also if all requests failed). n_phases is the
+            number of bands of the layer (DescribeCoverage, else of the first decoded GeoTIFF, 0 if there is none).
+            None if the crop name is unknown.
+    
+    '''
+    xs = np.asarray(xs, dtype=np.float64)
+    ys = np.asarray(ys, dtype=np.float64)
+    if crop not in PHASE_LAYERS:
+        print('wrong name for crop name!')
+        return None
+    date = str(year)+'-01-01' # multiband layers of the whole year are always stored at the 1st of january
+    base = WCSQuery(PHASE_LAYERS[crop]).subset('ansi', date).crs(epsg).format('image/tiff')
+
+    def fetch(members):
+        xmin = xs[members].min() - buffer
+        xmax = xs[members].max() + buffer
+        ymin = ys[members].min() - buffer
+        ymax = ys[members].max() + buffer
+        query = base.bbox(xmin, ymin, xmax, ymax)
+        if get_query == True:
+            print(query.url(host))
+        try:
+            response = client.send(query, host)
+            if response.status_code != 200:
+                if printout==True:
+                    print('something went wrong. Request was answered with request code: {}. URL: {}'.format(response.status_code, response.url))
+                return members, None
+            with rasterio.open(io.BytesIO(response.content)) as src:
+                data = src.read().astype(np.float32)
+                if src.nodata is not None:
+                    data[data == src.nodata] = np.nan
+                # vectorized world -> pixel coordinates of all points of the cluster
+                cols, rows = ~src.transform * (xs[members], ys[members])
+        except Exception as e:
+            # a failed cluster (timeout, connection error, broken GeoTIFF) only leaves its rows NaN
+            if printout==True:
+                print('something went wrong: {}'.format(e))
+            return members, None
+        rows = np.floor(rows).astype(np.int64)
+        cols = np.floor(cols).astype(np.int64)
+        inside = (rows >= 0) & (rows < data.shape[1]) & (cols >= 0) & (cols < data.shape[2])
+        values = np.full((len(members), data.shape[0]), np.nan, dtype=np.float32)
+        values[inside] = data[:, rows[inside], cols[inside]].T
+        return members, values
+
+    # the result exists before the first request, so failed requests only leave NaN rows
+    try:
+        phases = np.full((len(xs), len(get_catalog(host).describe(PHASE_LAYERS[crop]).bands)), np.nan, dtype=np.float32)
+    except Exception as e:
+        # without DescribeCoverage the band count of the first decoded GeoTIFF is used
+        if printout==True:
+            print('number of phases unknown, DescribeCoverage failed: {}'.format(e))
+        phases = None
+    clusters = get_point_clusters(xs, ys, max_extent)
+    with ThreadPoolExecutor(max_workers=max_workers) as executor:
+        for members, values in executor.map(fetch, clusters):
+            if values is None:
+                continue
+            if phases is None:
+                phases = np.full((len(xs), values.shape[1]), np.nan, dtype=np.float32)
+            values = values[:, :phases.shape[1]]
+            phases[members, :values.shape[1]] = values
+    if phases is None:
+        phases = np.full((len(xs), 0), np.nan, dtype=np.float32)
+    if printout==True:
+        print('{} points sampled with {} requests'.format(len(xs), len(clusters)))
+    return phases
+
+
+class PhaseTable:
+    '''
+    phenology lookup table of one PHASE layer, year and region: the starting dates (DOY) of all phases as
+    uint16 raster of shape (rows, cols, phases), 0 for no data. A coordinate is mapped to its cell in O(1),
+    so repeated queries need no requests (see build_phase_table, add_phase_table).
+
+    PARAMETERS:
+        data (numpy.ndarray): DOYs with shape (rows, cols, phases), 0 for no data
+        transform (tuple): (x of the left edge, pixel width, y of the upper edge, pixel height) in CRS units
+        year (str): year YYYY
+        crop (str): crop name (see PHASE_LAYERS)
+        epsg (int(opt)): coordinate reference system of the raster. Defaults to 32632.
+    '''
+
+    def __init__(self, data, transform, year, crop, epsg=32632):
+        self.data = np.ascontiguousarray(data, dtype=np.uint16)
+        self.x0, self.xres, self.y0, self.yres = (float(v) for v in transform)
+        self.year = str(year)
+        self.crop = crop
+        self.epsg = int(epsg)
+        self.rows, self.cols = self.data.shape[:2]
+
+    @property
+    def bounds(self):
+        '''
+        (xmin, ymin, xmax, ymax) of the raster
+        '''
+        return self.x0, self.y0 - self.rows * self.yres, self.x0 + self.cols * self.xres, self.y0
+
+    def _cell(self, easting, northing):
+        col = int((easting - self.x0) // self.xres)
+        row = int((self.y0 - northing) // self.yres)
+        if 0 <= row < self.rows and 0 <= col < self.cols:
+            return row, col
+        return None
+
+    def covers(self, easting, northing):
+        '''
+        True if the point lies inside the raster
+        '''
+        return self._cell(easting, northing) is not None
+
+    def lookup(self, easting, northing):
+        '''
+        starting dates of the phases at a point, as returned by get_phases_from_point(..., use_table=True)
+
+        PARAMETERS:
+            easting (float): easting coordinate in the CRS of the table
+            northing (float): northing coordinate in the CRS of the table
+
+        RETURNS:
+            list_ (list): DOYs as float (NaN for no data), None if the point lies outside the table
+        '''
+        cell = self._cell(easting, northing)
+        if cell is None:
+            return None
+        return [float(v) if v != 0 else np.nan for v in self.data[cell].tolist()]
+
+    def lookup_dates(self, easting, northing):
+        '''
+        starting dates of the phases at a point as YYYY-MM-DD (None for no data), instead of indexing get_all_dates
+        '''
+        cell = self._cell(easting, northing)
+        if cell is None:
+            return None
+        start = datetime.date(int(self.year), 1, 1)
+        return [(start + datetime.timedelta(days=v - 1)).isoformat() if v != 0 else None for v in self.data[cell].tolist()]
+
+    def lookup_points(self, xs, ys):
+        '''
+        vectorized lookup of many points, as returned by get_phases_from_points
+
+        RETURNS:
+            phases (numpy.ndarray): float32 DOYs with shape (n_points, n_phases), NaN for no data and points outside the table
+        '''
+        xs = np.asarray(xs, dtype=np.float64)
+        ys = np.asarray(ys, dtype=np.float64)
+        cols = np.floor((xs - self.x0) / self.xres).astype(np.int64)
+        rows = np.floor((self.y0 - ys) / self.yres).astype(np.int64)
+        inside = (rows >= 0) & (rows < self.rows) & (cols >= 0) & (cols < self.cols)
+        phases = np.full((len(xs), self.data.shape[2]), np.nan, dtype=np.float32)
+        phases[inside] = self.data[rows[inside], cols[inside]]
+        phases[phases == 0] = np.nan
+        return phases
+
+    def save(self, path):
+        '''
+        write the table to a compressed .npz file
+        '''
+        np.savez_compressed(path, data=self.data, transform=np.array([self.x0, self.xres, self.y0, self.yres]),
+                            year=np.array(self.year), crop=np.array(self.crop), epsg=np.array(self.epsg))
+
+    @classmethod
+    def load(cls, path):
+        '''
+        read a table written with save
+        '''
+        with np.load(path, allow_pickle=False) as f:
+            return cls(f['data'], f['transform'], str(f['year']), str(f['crop']), int(f['epsg']))
+
+
+def build_phase_table(year, crop, bbox, host, epsg=32632, tile_size=100000, max_workers=4, printout=False):
+    '''
+    download a PHASE layer for a region and year in tiles (GeoTIFF) and convert it into a PhaseTable
+
+    PARAMETERS:
+        year (str): year YYYY
+        crop (str): choose one of the available crops on JKI DataCube (see PHASE_LAYERS)
+        bbox (tuple): (xmin, ymin, xmax, ymax) of the region
+        host (str): the host adress of the Data Cube
+        epsg (int): coordinate reference system of bbox and the table. Defaults to 32632.
+        tile_size (float(opt)): width and height of a requested tile in CRS units. Defaults to 100000.
+        max_workers (int(opt)): maximum number of concurrent requests. Defaults to 4.
+        printout (bool(opt)): If True, failed requests are printed. Defaults to False.
+
+    RETURNS:
+        table (PhaseTable): lookup table of the region, None if no tile could be downloaded
+    '''
+    if crop not in PHASE_LAYERS:
+        print('wrong name for crop name!')
+        return None
+    date = str(year)+'-01-01' # multiband layers of the whole year are always stored at the 1st of january
+    base = WCSQuery(PHASE_LAYERS[crop]).subset('ansi', date).crs(epsg).format('image/tiff')
+    xmin, ymin, xmax, ymax = bbox
+    tiles = [(x, y, min(x + tile_size, xmax), min(y + tile_size, ymax))
+             for x in np.arange(xmin, xmax, tile_size) for y in np.arange(ymin, ymax, tile_size)]
+
+    def fetch(tile):
+        response = client.send(base.bbox(*tile), host)
+        if response.status_code != 200:
+            if printout==True:
+                print('something went wrong. Request was answered with request code: {}. URL: {}'.format(response.status_code, response.url))
+            return None
+        with rasterio.open(io.BytesIO(response.content)) as src:
+            data = src.read()
+            valid = np.isfinite(data) & (data > 0)
+            if src.nodata is not None:
+                valid &= data != src.nodata
+            doys = np.where(valid, np.rint(np.clip(np.nan_to_num(data), 0, 366)), 0).astype(np.uint16)
+            return doys, src.transform
+
+    with ThreadPoolExecutor(max_workers=max_workers) as executor:
+        results = [r for r in executor.map(fetch, tiles) if r is not None]
+    if len(results) == 0:
+        return None
+
+    # the tiles share the grid of the data cube, they are placed into one raster by their upper left corners
+    xres = results[0][1].a
+    yres = -results[0][1].e
+    x0 = min(t.c for d, t in results)
+    y0 = max(t.f for d, t in results)
+    cols = max(int(round((t.c - x0) / xres)) + d.shape[2] for d, t in results)
+    rows = max(int(round((y0 - t.f) / yres)) + d.shape[1] for d, t in results)
+    data = np.zeros((rows, cols, results[0][0].shape[0]), dtype=np.uint16)
+    for doys, t in results:
+        col = int(round((t.c - x0) / xres))
+        row = int(round((y0 - t.f) / yres))
+        data[row:row + doys.shape[1], col:col + doys.shape[2]] = doys.transpose(1, 2, 0)
+    return PhaseTable(data, (x0, xres, y0, yres), year, crop, epsg)
+
+
+# tables of add_phase_table: (year, crop, epsg) -> list of tables
+_PHASE_TABLES = {}
+
+
+def add_phase_table(table):
+    '''
+    register a PhaseTable, get_phases_from_point(..., use_table=True) answers points inside it locally without a request
+    '''
+    _PHASE_TABLES.setdefault((table.year, table.crop, table.epsg), []).append(table)
+
+
+def _lookup_phase_tables(year, crop, easting, northing, epsg):
+    for table in _PHASE_TABLES.get((str(year), crop, int(epsg)), ()):
+        values = table.lookup(easting, northing)
+        if values is not None:
+            return values
+    return None
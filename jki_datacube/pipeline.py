@@ -0,0 +1,201 @@
+'''
+pipelined fetch -> compute -> sink execution
+
+The notebook loop fetches an image and then computes its index, so the CPU is idle during the download and the
+network is idle during the decoding. A pipeline runs both stages at the same time, connected by bounded queues:
+
+    fetch       I/O threads (fetch_workers), e.g. get_S2_imagery
+    compute     threads (compute_workers) or, with processes=True, a process pool, e.g. calculate_savi.
+                GDAL decoding and the numpy index math release the GIL, so threads are usually sufficient.
+    sink        the loop of the caller, which receives (item, result) as soon as they are computed
+
+If the sink or the compute stage is slower, the queues fill up and the fetch threads wait (backpressure), so at most
+fetch_workers + compute_workers + 2 * queue_size items are held in memory. The throughput approaches
+max(network, CPU) instead of their sum:
+
+    from jki_datacube.pipeline import get_S2_savi_range
+    for date, savi in get_S2_savi_range(polygon, layer, '2020-03-01', '2020-10-31', user, pw, host):
+        ...
+'''
+import functools
+import os
+import queue
+import threading
+from concurrent.futures import ProcessPoolExecutor
+
+from .misc import calculate_savi
+from .s2 import _get_dates, get_S2_imagery
+
+# marks the end of a queue
+_DONE = object()
+
+
+class _Failure:
+    # exception of a stage, which is raised in the loop of the caller
+    def __init__(self, error):
+        self.error = error
+
+
+def _put(q, value, stop):
+    # blocking put, which gives up when the pipeline is stopped
+    while not stop.is_set():
+        try:
+            q.put(value, timeout=0.1)
+            return True
+        except queue.Full:
+            pass
+    return False
+
+
+def _get(q, stop):
+    while not stop.is_set():
+        try:
+            return q.get(timeout=0.1)
+        except queue.Empty:
+            pass
+    return _DONE
+
+
+def pipeline(items, fetch, compute, fetch_workers=8, compute_workers=None, queue_size=None, processes=False):
+    '''
+    run fetch(item) and compute(data) for all items in two overlapping stages with bounded queues
+
+    PARAMETERS:
+        items (iterable): inputs of fetch, e.g. dates. It is consumed lazily.
+        fetch (callable): I/O stage, fetch(item) -> data. Items, for which it returns None, are passed on to
+            the sink with the result None (the fetchers of this package return None for failed requests).
+        compute (callable): CPU stage, compute(data) -> result. With processes=True it has to be picklable
+            (a module level function or functools.partial of it), as well as data.
+        fetch_workers (int(opt)): concurrent fetches (I/O threads). Defaults to 8.
+        compute_workers (int(opt)): concurrent computations. Defaults to the number of CPUs.
+        queue_size (int(opt)): capacity of the queues between the stages. Defaults to 2 * compute_workers.
+        processes (bool(opt)): If True, compute runs in a process pool, for computations, which hold the GIL.
+            Defaults to False.
+
+    YIELDS:
+        (item, result) (tuple): item and the result of compute, in the order of completion
+    '''
+    compute_workers = compute_workers or os.cpu_count() or 1
+    queue_size = queue_size or 2 * compute_workers
+    fetched = queue.Queue(maxsize=queue_size)
+    computed = queue.Queue(maxsize=queue_size)
+    stop = threading.Event()
+    items = iter(items)
+    lock = threading.Lock()
+    executor = ProcessPoolExecutor(max_workers=compute_workers) if processes == True else None
+
+    def next_item():
+        with lock:
+            return next(items, _DONE)
+
+    def fetch_worker():
+        try:
+            while not stop.is_set():
+                item = next_item()
+                if item is _DONE:
+                    break
+                if not _put(fetched, (item, fetch(item)), stop):
+                    break
+        except BaseException as e:
+            _put(computed, _Failure(e), stop)
+
+    def compute_worker():
+        try:
+            while not stop.is_set():
+                value = _get(fetched, stop)
+                if value is _DONE:
+                    break
+                item, data = value
+                if data is None:
+                    result = None
+                elif executor is not None:
+                    result = executor.submit(compute, data).result()
+                else:
+                    result = compute(data)
+                if not _put(computed, (item, result), stop):
+                    break
+        except BaseException as e:
+            _put(computed, _Failure(e), stop)
+        finally:
+            _put(computed, _DONE, stop)
+
+    fetchers = [threading.Thread(target=fetch_worker, daemon=True) for i in range(fetch_workers)]
+    computers = [threading.Thread(target=compute_worker, daemon=True) for i in range(compute_workers)]
+    for thread in fetchers + computers:
+        thread.start()
+
+    def close_fetched():
+        # after the last fetch every compute thread receives a _DONE, and each of them passes one on to the sink
+        for thread in fetchers:
+            thread.join()
+        for i in range(compute_workers):
+            _put(fetched, _DONE, stop)
+    closer = threading.Thread(target=close_fetched, daemon=True)
+    closer.start()
+
+    try:
+        running = compute_workers
+        while running > 0:
+            value = computed.get()
+            if value is _DONE:
+                running -= 1
+            elif isinstance(value, _Failure):
+                raise value.error
+            else:
+                yield value
+    finally:
+        # also reached if the caller leaves the loop early: wake up and end all threads
+        stop.set()
+        for thread in fetchers + computers + [closer]:
+            thread.join()
+        if executor is not None:
+            executor.shutdown(cancel_futures=True)
+
+
+def _fetch_S2_imagery(day, polygon, layer, user, pw, host, epsg, band1, band2):
+    response = get_S2_imagery(polygon, layer, day, user, pw, host, epsg=epsg, band1=band1, band2=band2)
+    if response is None or response.status_code != 200:
+        return None
+    return response
+
+
+def _calculate_savi(response, valid_pixel_portion, noData):
+    index = calculate_savi(response, valid_pixel_portion=valid_pixel_portion, noData=noData)
+    return index if isinstance(index, list) else None
+
+
+def get_S2_savi_range(polygon, layer, startdate, enddate, user, pw, host, epsg=32632, band1='NIR10', band2='R', valid_pixel_portion=50, noData=0,
+                      dates=None, fetch_workers=8, compute_workers=None, processes=False):
+    '''
+    pipelined counterpart of the notebook loop get_S2_imagery + calculate_savi for a range of dates:
+    the images are downloaded while earlier images are decoded and their SAVI is calculated
+
+    PARAMETERS:
+        polygon (str): polygon boundaries as WKT string
+        layer (str): layer name of the data cube (coverage ID)
+        startdate (str): YYYY-MM-DD, first date
+        enddate (str): YYYY-MM-DD, last date (inclusive)
+        user (str): credentials username
+        pw (str): credentials password
+        host (str): host adress of data cube service
+        epsg (int): coordinate reference system of the polygon and the images. Defaults to 32632.
+        band1 (str): NIR band name (default: NIR10)
+        band2 (str): red band name (default: R)
+        valid_pixel_portion (float(opt)): minimum portion of valid pixels [in %]. Defaults to 50.
+        noData (int(opt)): no data value of the bands. Defaults to 0.
+        dates (list(opt)): If given, only these dates between startdate and enddate are requested. Defaults to None (every day).
+        fetch_workers (int(opt)): concurrent requests. Defaults to 8.
+        compute_workers (int(opt)): concurrent SAVI calculations. Defaults to the number of CPUs.
+        processes (bool(opt)): If True, the SAVI is calculated in a process pool. Defaults to False.
+
+    YIELDS:
+        (date, savi) (tuple): date as YYYY-MM-DD and [savi, meta] as returned by calculate_savi, None if the
+            request failed or the valid pixel portion is not satisfied. Dates arrive in the order of completion.
+    '''
+    days = _get_dates(startdate, enddate)
+    if dates is not None:
+        dates = set(dates)
+        days = [day for day in days if day in dates]
+    fetch = functools.partial(_fetch_S2_imagery, polygon=polygon, layer=layer, user=user, pw=pw, host=host, epsg=epsg, band1=band1, band2=band2)
+    compute = functools.partial(_calculate_savi, valid_pixel_portion=valid_pixel_portion, noData=noData)
+    return pipeline(days, fetch, compute, fetch_workers=fetch_workers, compute_workers=compute_workers, processes=processes)
@@ -0,0 +1,215 @@
+'''
+immutable WCS 2.0.1 query builder
+
+A WCSQuery holds the KVP parameters of a request. Every method returns a new query and leaves the original untouched,
+so a base query (coverage, CRS, format) can be built once and reused for millions of subsets:
+
+    from jki_datacube.query import WCSQuery
+    base = WCSQuery('PHASE_202_Winterweizen').crs(32632).format('text/csv')
+    query = base.subset('ansi', '2020-01-01').subset('E', 600000).subset('N', 5800000)
+    response = client.send(query, host)
+
+Values are percent-encoded, and queries with long URLs (e.g. CLIP with complex parcel polygons) are sent as POST
+with the same parameters in a form body.
+'''
+from urllib.parse import quote
+
+# rasdaman's URL of an EPSG code
+CRS_URL = 'http://ows.rasdaman.org/def/crs/EPSG/0/'
+
+# longer GET URLs are sent as POST (many proxies and servers reject URLs longer than 8 kB, some already above 2 kB)
+MAX_URL_LENGTH = 2000
+
+# characters, which keep their meaning in subsets and CRS URLs and need no escaping in a query string
+_SAFE = "(),:/*'"
+
+
+def get_crs_url(epsg):
+    '''
+    URL of a coordinate reference system, which rasdaman understands
+
+    PARAMETERS:
+        epsg (int or str): EPSG code or a complete CRS URL
+
+    RETURNS:
+        url (str): CRS URL
+    '''
+    if isinstance(epsg, str) and '/' in epsg:
+        return epsg
+    return CRS_URL + str(int(epsg))
+
+
+def _format_coordinate(value):
+    # dates and other strings are quoted, numbers and '*' (open interval) are used as they are
+    if isinstance(value, str):
+        if value == '*' or value.startswith('"'):
+            return value
+        return '"' + value + '"'
+    return str(value)
+
+
+def _encode(name, value):
+    return name + '=' + quote(value, safe=_SAFE)
+
+
+class WCSQuery:
+    '''
+    immutable WCS 2.0.1 KVP query
+
+    PARAMETERS:
+        coverage_id (str(opt)): layer name of the data cube (coverage ID). Defaults to None.
+        request (str(opt)): WCS request. Defaults to GetCoverage.
+        version (str(opt)): WCS version. Defaults to 2.0.1.
+    '''
+    __slots__ = ('_params', '_encoded')
+
+    def __init__(self, coverage_id=None, request='GetCoverage', version='2.0.1'):
+        params = [('SERVICE', 'WCS'), ('VERSION', version), ('REQUEST', request)]
+        if coverage_id is not None:
+            params.append(('COVERAGEID', coverage_id))
+        self._params = tuple(params)
+        self._encoded = tuple(_encode(name, value) for name, value in params)
+
+    @classmethod
+    def _from_params(cls, params, encoded):
+        query = cls.__new__(cls)
+        query._params = params
+        query._encoded = encoded
+        return query
+
+    def set(self, name, value, key=None):
+        '''
+        set a parameter, an existing parameter of the same name (and key) is replaced
+
+        PARAMETERS:
+            name (str): parameter name, e.g. FORMAT
+            value (str): parameter value (not encoded)
+            key (str(opt)): for repeated parameters (SUBSET), the prefix of the value, which identifies it (e.g. 'E(').
+                Defaults to None.
+
+        RETURNS:
+            query (WCSQuery): new query
+        '''
+        value = str(value)
+        keep = [i for i, (n, v) in enumerate(self._params)
+                if n != name or (key is not None and not v.startswith(key))]
+        if len(keep) == len(self._params):
+            params = self._params + ((name, value),)
+            encoded = self._encoded + (_encode(name, value),)
+        else:
+            params = tuple(self._params[i] for i in keep) + ((name, value),)
+            encoded = tuple(self._encoded[i] for i in keep) + (_encode(name, value),)
+        return self._from_params(params, encoded)
+
+    def subset(self, axis, low, high=None):
+        '''
+        trim (low, high) or slice (low) an axis, e.g. subset('ansi', '2020-01-01', '2020-12-31') or subset('E', 600000)
+
+        PARAMETERS:
+            axis (str): axis label, e.g. ansi, E, N, Lat, Lon
+            low (str or float): lower bound or slice point, dates are quoted automatically
+            high (str or float(opt)): upper bound. Defaults to None (slice).
+
+        RETURNS:
+            query (WCSQuery): new query
+        '''
+        value = _format_coordinate(low) if high is None else _format_coordinate(low) + ',' + _format_coordinate(high)
+        return self.set('SUBSET', axis + '(' + value + ')', key=axis + '(')
+
+    def bbox(self, xmin, ymin, xmax, ymax, axes=('E', 'N')):
+        '''
+        trim both horizontal axes, see subset
+        '''
+        return self.subset(axes[0], xmin, xmax).subset(axes[1], ymin, ymax)
+
+    def crs(self, epsg, subsetting=True, output=True):
+        '''
+        set the CRS of the subsets (subsettingCrs) and/or of the result (outputCrs)
+
+        PARAMETERS:
+            epsg (int or str): EPSG code or CRS URL
+            subsetting (bool(opt)): If True, subsettingCrs is set. Defaults to True.
+            output (bool(opt)): If True, outputCrs is set. Defaults to True.
+
+        RETURNS:
+            query (WCSQuery): new query
+        '''
+        query = self
+        if subsetting == True:
+            query = query.set('subsettingCrs', get_crs_url(epsg))
+        if output == True:
+            query = query.set('outputCrs', get_crs_url(epsg))
+        return query
+
+    def clip(self, wkt):
+        '''
+        clip the result to a polygon (WKT string in subsettingCrs)
+        '''
+        return self.set('CLIP', wkt)
+
+    def range_subset(self, *bands):
+        '''
+        request only the given bands
+        '''
+        return self.set('RANGESUBSET', ','.join(bands))
+
+    def format(self, mime_type):
+        '''
+        set the encoding of the result, e.g. image/tiff, text/csv or application/netcdf
+        '''
+        return self.set('FORMAT', mime_type)
+
+    @property
+    def params(self):
+        '''
+        list of (name, value) tuples, suitable as POST form body of requests
+        '''
+        return list(self._params)
+
+    def get(self, name, default=None):
+        '''
+        value of the last parameter with the given name
+        '''
+        for n, v in reversed(self._params):
+            if n == name:
+                return v
+        return default
+
+    def url(self, host):
+        '''
+        GET URL of the query
+
+        PARAMETERS:
+            host (str): endpoint of the data cube service, e.g. https://.../rasdaman/ows
+
+        RETURNS:
+            url (str): percent-encoded request URL
+        '''
+        return host + '?' + '&'.join(self._encoded)
+
+    def to_request(self, host, max_url_length=MAX_URL_LENGTH):
+        '''
+        HTTP method, URL and body of the query, queries with long URLs are sent as POST with a form body
+
+        PARAMETERS:
+            host (str): endpoint of the data cube service
+            max_url_length (int(opt)): longest URL sent as GET. Defaults to MAX_URL_LENGTH.
+
+        RETURNS:
+            method (str): GET or POST
+            url (str): request URL
+            data (list): POST form body as (name, value) tuples, None for GET requests
+        '''
+        url = self.url(host)
+        if max_url_length is None or len(url) <= max_url_length:
+            return 'GET', url, None
+        return 'POST', host, self.params
+
+    def __eq__(self, other):
+        return isinstance(other, WCSQuery) and self._params == other._params
+
+    def __hash__(self):
+        return hash(self._params)
+
+    def __repr__(self):
+        return 'WCSQuery(%s)' % ', '.join(name + '=' + value for name, value in self._params)
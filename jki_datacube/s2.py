@@ -0,0 +1,665 @@
+import functools
+import re
+from concurrent.futures import ThreadPoolExecutor, FIRST_COMPLETED, wait
+from datetime import date, timedelta
+
+import numpy as np
+
+from .catalog import get_catalog
+from .client import client
+from .decode import decode_netcdf, decode_ansi_dates, parse_csv
+from .index import INDEX_BANDS
+from .query import WCSQuery, get_crs_url
+
+
+def get_S2_imagery(polygon, layer, date, user, pw, host, epsg = 32632, band1='NIR10', band2='R', band3='G', band_subset=True, printout=False , get_query=False, use_cache=True):
+    '''
+    get analysis-ready Copernicus Sentinel-2 reflectance data (cloud masked, bottom-of-atmosphere) from JKI-CODE-DE DataCube
+    
+    PARAMETERS:
+        polygon (str): polygon boundaries as WKT string (https://en.wikipedia.org/wiki/Well-known_text_representation_of_geometry)
+        layer (str): layer name of the data cube (coverage ID)
+        date (str): YYYY-MM-DD
+        user (str): credentials username
+        pw (str): credentials password
+        host (str): host adress of data cube service
+        epsg (int): defines coordinate reference system (CRS) of the input (easting and northing) and output coordinates. Defaults to 32632.
+        band1 (str): band name (default: NIR10)
+        band2 (str): band name (default: R)
+        band3 (str): band name (default: G)
+        band_subset (bool(opt)): If True, request only returns given bands (band1 - band3). Defaults to True.
+        printout (bool(opt)): If True, some information will be printed about the success of request. Defaults to False.
+        get_query (bool(opt)): If True, final WCS URL will be printed. Defaults to False. 
+        use_cache (bool(opt)): If False, the response cache is bypassed (e.g. to pick up reprocessed slices). Defaults to True.
+        
+        
+    RETURNS:
+        response (requests.models.Response): binary response object, in which the cropped S2-image is stored (https://requests.readthedocs.io/en/latest/)
+    
+    '''
+    try:
+        query = _get_imagery_query(polygon, layer, date, epsg, band1, band2, band3, band_subset)
+        if get_query == True:
+            print(query.url(host))
+
+        # run WCS query, sent as POST if the clip polygon makes the URL too long
+        response = client.send(query, host, auth=(user, pw), use_cache=use_cache)
+
+        # check if query successful
+        if response.status_code == 200: # status code 200 means request wasd successful
+            if printout==True:
+                print('request was sucessfull! Request Status: {}'.format(response.status_code))
+            return response
+        elif response.status_code == 404: # status code 404 means bad request
+            if printout==True:
+                print('bad request! Request Status: {}'.format(response.status_code))
+                print('response content: ', response.text)
+            return response
+        else:
+            if printout==True:
+                print('something went wrong. Request was answered with request code: {}. URL: {}'.format(response.status_code, response.url))
+                print('response content: ', response.text)
+            else:
+                pass
+            return response
+
+    except Exception as e:
+        print('something went wrong: {}'.format(e))
+
+def _get_imagery_query(polygon, layer, date, epsg, band1, band2, band3, band_subset):
+    # set WCS query parameters
+    query = WCSQuery(layer).subset('ansi', date).crs(epsg).clip(polygon).format('image/tiff')
+    if band_subset == True:
+        query = query.range_subset(band1, band2, band3)
+    return query
+
+
+def _get_dates(startdate, enddate):
+    '''
+    list all calendar days between startdate and enddate (both included) as YYYY-MM-DD strings
+    '''
+    start = date.fromisoformat(startdate)
+    end = date.fromisoformat(enddate)
+    return [(start + timedelta(days=i)).strftime('%Y-%m-%d') for i in range((end - start).days + 1)]
+
+
+def get_S2_imagery_range(polygon, layer, startdate, enddate, user, pw, host, epsg = 32632, band1='NIR10', band2='R', band3='G', band_subset=True, max_workers=8, dates=None, printout=False, get_query=False, use_cache=True):
+    '''
+    get Sentinel-2 imagery for every day of a date range from JKI-CODE-DE DataCube using concurrent WCS requests
+    
+    The daily GetCoverage requests of get_S2_imagery are executed on a bounded thread pool, so at most max_workers
+    requests are in flight at the same time. Results are yielded as soon as they arrive, i.e. not in date order.
+    
+    PARAMETERS:
+        polygon (str): polygon boundaries as WKT string (https://en.wikipedia.org/wiki/Well-known_text_representation_of_geometry)
+        layer (str): layer name of the data cube (coverage ID)
+        startdate (str): YYYY-MM-DD
+        enddate (str): YYYY-MM-DD (included)
+        user (str): credentials username
+        pw (str): credentials password
+        host (str): host adress of data cube service
+        epsg (int): defines coordinate reference system (CRS) of the input (easting and northing) and output coordinates. Defaults to 32632.
+        band1 (str): band name (default: NIR10)
+        band2 (str): band name (default: R)
+        band3 (str): band name (default: G)
+        band_subset (bool(opt)): If True, request only returns given bands (band1 - band3). Defaults to True.
+        max_workers (int(opt)): maximum number of concurrent requests. Defaults to 8.
+        dates (list(opt)): If given, only these dates (YYYY-MM-DD) between startdate and enddate are requested, e.g. from get_S2_available_dates. Defaults to None (every day).
+        printout (bool(opt)): If True, some information will be printed about the success of request. Defaults to False.
+        get_query (bool(opt)): If True, final WCS URL will be printed. Defaults to False. 
+        use_cache (bool(opt)): If False, the response cache is bypassed. Defaults to True.
+        
+    YIELDS:
+        (date, response) (tuple): date as YYYY-MM-DD and the response object returned by get_S2_imagery for this date
+    
+    '''
+    days = _get_dates(startdate, enddate)
+    if dates is not None:
+        dates = set(dates)
+        days = [day for day in days if day in dates]
+    fetch = functools.partial(get_S2_imagery, polygon=polygon, layer=layer, user=user, pw=pw, host=host, epsg=epsg, band1=band1, band2=band2,
+                              band3=band3, band_subset=band_subset, printout=printout, get_query=get_query, use_cache=use_cache)
+    todo = iter(days)
+    with ThreadPoolExecutor(max_workers=max_workers) as executor:
+        # keep only a few requests per worker in flight, yielded responses are released by the executor
+        futures = {}
+        try:
+            for day in todo:
+                futures[executor.submit(fetch, date=day)] = day
+                if len(futures) >= 2 * max_workers:
+                    break
+            while len(futures) > 0:
+                finished, _ = wait(futures, return_when=FIRST_COMPLETED)
+                for future in finished:
+                    day = futures.pop(future)
+                    yield day, future.result()
+                    day = next(todo, None)
+                    if day is not None:
+                        futures[executor.submit(fetch, date=day)] = day
+                del finished, future
+        finally:
+            # stop pending requests if the caller leaves the loop early
+            for future in futures:
+                future.cancel()
+
+
+def get_S2_stack(polygon, layer, startdate, enddate, user, pw, host, epsg = 32632, band1='NIR10', band2='R', band3='G', band_subset=True, encode_format='application/netcdf', printout=False, get_query=False):
+    '''
+    get all Sentinel-2 acquisitions of a date range as one multi-temporal (3-D) coverage from JKI-CODE-DE DataCube
+    
+    PARAMETERS:
+        polygon (str): polygon boundaries as WKT string (https://en.wikipedia.org/wiki/Well-known_text_representation_of_geometry)
+        layer (str): layer name of the data cube (coverage ID)
+        startdate (str): YYYY-MM-DD
+        enddate (str): YYYY-MM-DD (included)
+        user (str): credentials username
+        pw (str): credentials password
+        host (str): host adress of data cube service
+        epsg (int): defines coordinate reference system (CRS) of the input (easting and northing) and output coordinates. Defaults to 32632.
+        band1 (str): band name (default: NIR10)
+        band2 (str): band name (default: R)
+        band3 (str): band name (default: G)
+        band_subset (bool(opt)): If True, request only returns given bands (band1 - band3). Defaults to True.
+        encode_format (str(opt)): output format, has to support 3-D coverages. Defaults to application/netcdf.
+        printout (bool(opt)): If True, some information will be printed about the success of request. Defaults to False.
+        get_query (bool(opt)): If True, final WCS URL will be printed. Defaults to False. 
+        
+    RETURNS:
+        response (requests.models.Response): binary response object, in which the cropped S2 time series is stored
+    
+    '''
+    try:
+        # set WCS query parameters
+        query = WCSQuery(layer).subset('ansi', startdate, enddate).crs(epsg).clip(polygon).format(encode_format)
+        if band_subset == True:
+            query = query.range_subset(band1, band2, band3)
+        if get_query == True:
+            print(query.url(host))
+
+        # run WCS query, sent as POST if the clip polygon makes the URL too long
+        response = client.send(query, host, auth=(user, pw))
+
+        # check if query successful
+        if response.status_code == 200: # status code 200 means request wasd successful
+            if printout==True:
+                print('request was sucessfull! Request Status: {}'.format(response.status_code))
+            return response
+        elif response.status_code == 404: # status code 404 means bad request
+            if printout==True:
+                print('bad request! Request Status: {}'.format(response.status_code))
+                print('response content: ', response.text)
+            return response
+        else:
+            if printout==True:
+                print('something went wrong. Request was answered with request code: {}. URL: {}'.format(response.status_code, response.url))
+                print('response content: ', response.text)
+            else:
+                pass
+            return response
+
+    except Exception as e:
+        print('something went wrong: {}'.format(e))
+
+
+def unpack_S2_stack(response, bands=('NIR10', 'R', 'G')):
+    '''
+    unpack a netCDF response of get_S2_stack into a date-indexed numpy cube
+    
+    PARAMETERS:
+        response (requests.models.Response): response object returned by get_S2_stack
+        bands (tuple(opt)): requested bands (RANGESUBSET order). The bands of the cube follow this order, since netCDF
+            files list their variables alphabetically, other bands of the file follow them. Defaults to ('NIR10', 'R', 'G').
+        
+    RETURNS:
+        stack (dict): 
+            'dates' (list): acquisition dates as YYYY-MM-DD
+            'bands' (list): band names
+            'x' (numpy.ndarray): easting of the pixel centers
+            'y' (numpy.ndarray): northing of the pixel centers (north to south)
+            'data' (numpy.ndarray): reflectances with shape (time, band, y, x)
+    
+    '''
+    axes, variables = decode_netcdf(response.content)
+    time_axis = next(a for a in ('ansi', 'time', 't', 'date') if a in axes)
+    x_axis = next(a for a in ('E', 'Lon', 'Long', 'x', 'X') if a in axes)
+    y_axis = next(a for a in ('N', 'Lat', 'y', 'Y') if a in axes)
+
+    # only variables over time, y and x are bands
+    variables = {name: v for name, v in variables.items() if set(v[0]) == {time_axis, y_axis, x_axis}}
+    band_names = [b for b in bands if b in variables] + [b for b in variables if b not in bands]
+    data = np.stack([
+        np.transpose(variables[b][1], [variables[b][0].index(time_axis), variables[b][0].index(y_axis), variables[b][0].index(x_axis)])
+        for b in band_names
+    ], axis=1)
+    x = axes[x_axis]
+    y = axes[y_axis]
+    # rows from north to south, like the GeoTIFF responses of get_S2_imagery
+    if y.size > 1 and y[0] < y[-1]:
+        y = y[::-1]
+        data = data[:, :, ::-1, :]
+
+    return {
+        'dates': decode_ansi_dates(axes[time_axis]),
+        'bands': band_names,
+        'x': x,
+        'y': y,
+        'data': np.ascontiguousarray(data)
+    }
+
+
+def get_S2_timeseries(polygon, layer, startdate, enddate, user, pw, host, epsg = 32632, band1='NIR10', band2='R', band3='G', band_subset=True, chunk_days=None, max_workers=4, printout=False, get_query=False):
+    '''
+    get the Sentinel-2 time series of a polygon with one (or a few chunked) multi-temporal WCS requests 
+    instead of one request per day
+    
+    PARAMETERS:
+        polygon (str): polygon boundaries as WKT string (https://en.wikipedia.org/wiki/Well-known_text_representation_of_geometry)
+        layer (str): layer name of the data cube (coverage ID)
+        startdate (str): YYYY-MM-DD
+        enddate (str): YYYY-MM-DD (included)
+        user (str): credentials username
+        pw (str): credentials password
+        host (str): host adress of data cube service
+        epsg (int): defines coordinate reference system (CRS) of the input (easting and northing) and output coordinates. Defaults to 32632.
+        band1 (str): band name (default: NIR10)
+        band2 (str): band name (default: R)
+        band3 (str): band name (default: G)
+        band_subset (bool(opt)): If True, request only returns given bands (band1 - band3). Defaults to True.
+        chunk_days (int(opt)): If given, the date range is split into chunks of chunk_days days, one request per chunk. Defaults to None (single request).
+        max_workers (int(opt)): maximum number of concurrent chunk requests. Defaults to 4.
+        printout (bool(opt)): If True, some information will be printed about the success of request. Defaults to False.
+        get_query (bool(opt)): If True, final WCS URL will be printed. Defaults to False. 
+        
+    RETURNS:
+        stack (dict): see unpack_S2_stack, None if no data was returned
+    
+    '''
+    days = _get_dates(startdate, enddate)
+    if chunk_days is None:
+        chunk_days = len(days)
+    chunks = [(days[i], days[min(i + chunk_days, len(days)) - 1]) for i in range(0, len(days), chunk_days)]
+
+    def fetch(chunk):
+        response = get_S2_stack(polygon, layer, chunk[0], chunk[1], user, pw, host, epsg=epsg, band1=band1, band2=band2, band3=band3,
+                                band_subset=band_subset, printout=printout, get_query=get_query)
+        if response is not None and response.status_code == 200:
+            return unpack_S2_stack(response, bands=(band1, band2, band3))
+
+    with ThreadPoolExecutor(max_workers=max_workers) as executor:
+        stacks = [s for s in executor.map(fetch, chunks) if s is not None]
+
+    if len(stacks) == 0:
+        return None
+    stack = stacks[0]
+    if len(stacks) > 1:
+        stack['dates'] = [d for s in stacks for d in s['dates']]
+        stack['data'] = np.concatenate([s['data'] for s in stacks], axis=0)
+    return stack
+
+
+def _get_bbox(polygon):
+    '''
+    bounding box (xmin, ymin, xmax, ymax) of a WKT polygon string
+    '''
+    coords = [float(c) for c in re.findall(r'-?\d+(?:\.\d+)?(?:[eE][-+]?\d+)?', polygon)]
+    xs = coords[0::2]
+    ys = coords[1::2]
+    return min(xs), min(ys), max(xs), max(ys)
+
+
+def get_S2_acquisition_dates(layer, host, user='', pw='', use_credentials=True, startdate=None, enddate=None):
+    '''
+    get all acquisition dates (time slices) of a data cube from its DescribeCoverage metadata. 
+    The metadata is taken from the (disk-cached) catalog of the host, see jki_datacube.catalog.
+    
+    PARAMETERS:
+        layer (str): layer name of the data cube (coverage ID)
+        host (str): host adress of data cube service
+        user (str): credentials username
+        pw (str): credentials password
+        use_credentials (bool(opt)): If True: personal credentials for datacube service will be used. Defaults to True.
+        startdate (str(opt)): YYYY-MM-DD, only return dates from startdate on. Defaults to None.
+        enddate (str(opt)): YYYY-MM-DD, only return dates up to enddate (included). Defaults to None.
+        
+    RETURNS:
+        dates (list): sorted acquisition dates as YYYY-MM-DD
+    
+    '''
+    info = get_catalog(host, user=user, pw=pw, use_credentials=use_credentials).describe(layer)
+    if len(info.dates) == 0:
+        print('no irregular time axis found for layer {}'.format(layer))
+    return [d for d in info.dates if (startdate is None or d >= startdate) and (enddate is None or d <= enddate)]
+
+
+def build_valid_pixel_wcps(polygon, layer, startdate, enddate, epsg=32632, band='NIR10', noData=0):
+    '''
+    build a WCPS query, which computes the portion of valid pixels [in %] within the bounding box of a polygon 
+    for every time slice of a date range
+    
+    PARAMETERS:
+        polygon (str): polygon boundaries as WKT string
+        layer (str): layer name of the data cube (coverage ID)
+        startdate (str): YYYY-MM-DD
+        enddate (str): YYYY-MM-DD (included)
+        epsg (int): CRS of the polygon. Defaults to 32632.
+        band (str): band to check for valid pixels. Defaults to NIR10.
+        noData (int): no data value of the band. Defaults to 0.
+        
+    RETURNS:
+        wcps (str): WCPS query string
+    
+    '''
+    tile = _get_tile_expression(polygon, epsg, 'ansi:"CRS:1"($t)')
+    n_valid = 'count(clip({tile}.{band}, {polygon}, "{crs}") != {noData})'.format(tile=tile, band=band, polygon=polygon, crs=get_crs_url(epsg), noData=noData)
+    return (
+        'for $c in (' + layer + ') return encode('
+        'coverage portion over $t t(imageCrsDomain($c[ansi("' + startdate + '":"' + enddate + '")], ansi)) '
+        'values (' + n_valid + ' * 100.0) / ' + _get_pixel_count_expression(tile) + ', "text/csv")'
+    )
+
+
+def _get_tile_expression(polygon, epsg, time_subset):
+    '''
+    WCPS subset of $c to the bounding box of a polygon and one time slice
+    '''
+    xmin, ymin, xmax, ymax = _get_bbox(polygon)
+    crs = get_crs_url(epsg)
+    return '$c[{time}, E:"{crs}"({xmin}:{xmax}), N:"{crs}"({ymin}:{ymax})]'.format(time=time_subset, crs=crs, xmin=xmin, xmax=xmax, ymin=ymin, ymax=ymax)
+
+
+def _get_pixel_count_expression(tile):
+    '''
+    WCPS expression of the number of pixels of a 2-D subset
+    '''
+    return '((imageCrsDomain({tile}, E).hi - imageCrsDomain({tile}, E).lo + 1) * (imageCrsDomain({tile}, N).hi - imageCrsDomain({tile}, N).lo + 1))'.format(tile=tile)
+
+
+def get_S2_valid_pixel_portion(polygon, layer, startdate, enddate, user, pw, host, epsg=32632, band='NIR10', noData=0, printout=False, get_query=False):
+    '''
+    get the portion of valid pixels [in %] of every acquisition date within the bounding box of a polygon. 
+    Only counts are computed on the server (WCPS), no imagery is downloaded.
+    
+    PARAMETERS:
+        polygon (str): polygon boundaries as WKT string
+        layer (str): layer name of the data cube (coverage ID)
+        startdate (str): YYYY-MM-DD
+        enddate (str): YYYY-MM-DD (included)
+        user (str): credentials username
+        pw (str): credentials password
+        host (str): host adress of data cube service
+        epsg (int): CRS of the polygon. Defaults to 32632.
+        band (str): band to check for valid pixels. Defaults to NIR10.
+        noData (int): no data value of the band. Defaults to 0.
+        printout (bool(opt)): If True, some information will be printed about the success of request. Defaults to False.
+        get_query (bool(opt)): If True, final WCPS query will be printed. Defaults to False.
+        
+    RETURNS:
+        portions (dict): date (YYYY-MM-DD) -> valid pixel portion [in %]
+    
+    '''
+    try:
+        dates = get_S2_acquisition_dates(layer, host, user=user, pw=pw, startdate=startdate, enddate=enddate)
+        if len(dates) == 0:
+            return {}
+
+        wcps = build_valid_pixel_wcps(polygon, layer, startdate, enddate, epsg=epsg, band=band, noData=noData)
+        if get_query == True:
+            print(wcps)
+
+        response = client.post(host, data={'SERVICE': 'WCS', 'VERSION': '2.0.1', 'REQUEST': 'ProcessCoverages', 'QUERY': wcps}, auth=(user, pw))
+
+        if response.status_code == 200:
+            if printout==True:
+                print('request was sucessfull! Request Status: {}'.format(response.status_code))
+            portions = parse_csv(response.content).ravel().tolist()
+            return dict(zip(dates, portions))
+        else:
+            if printout==True:
+                print('something went wrong. Request was answered with request code: {}. URL: {}'.format(response.status_code, response.url))
+                print('response content: ', response.text)
+            return {}
+
+    except Exception as e:
+        print('something went wrong: {}'.format(e))
+        return {}
+
+
+_VALID_PIXEL_PORTIONS = {}
+
+def get_S2_available_dates(polygon, layer, startdate, enddate, user, pw, host, epsg=32632, valid_pixel_portion=50, band='NIR10', noData=0, printout=False, get_query=False):
+    '''
+    get all dates with an acquisition, whose valid pixel portion within the polygon's bounding box exceeds a threshold. 
+    The valid pixel portions are cached per layer and polygon, so only dates which were not checked before are requested.
+    The dates can be passed to get_S2_imagery_range to skip empty or cloudy acquisitions.
+    
+    PARAMETERS:
+        polygon (str): polygon boundaries as WKT string
+        layer (str): layer name of the data cube (coverage ID)
+        startdate (str): YYYY-MM-DD
+        enddate (str): YYYY-MM-DD (included)
+        user (str): credentials username
+        pw (str): credentials password
+        host (str): host adress of data cube service
+        epsg (int): CRS of the polygon. Defaults to 32632.
+        valid_pixel_portion (float): minimum portion of valid pixels [in %], same meaning as in calculate_savi. Defaults to 50.
+        band (str): band to check for valid pixels. Defaults to NIR10.
+        noData (int): no data value of the band. Defaults to 0.
+        printout (bool(opt)): If True, some information will be printed about the success of request. Defaults to False.
+        get_query (bool(opt)): If True, final WCPS query will be printed. Defaults to False.
+        
+    RETURNS:
+        dates (list): sorted dates as YYYY-MM-DD
+    
+    '''
+    key = (host, layer, polygon, epsg, band)
+    cache = _VALID_PIXEL_PORTIONS.setdefault(key, {})
+
+    dates = get_S2_acquisition_dates(layer, host, user=user, pw=pw, startdate=startdate, enddate=enddate)
+    missing = [d for d in dates if d not in cache]
+    if len(missing) > 0:
+        cache.update(get_S2_valid_pixel_portion(polygon, layer, missing[0], missing[-1], user, pw, host, epsg=epsg, band=band,
+                                                noData=noData, printout=printout, get_query=get_query))
+
+    return [d for d in dates if cache.get(d, 0) > valid_pixel_portion]
+
+
+# band names of the S2_GermanyGrid layer used by the WCPS index queries
+S2_BANDS = {'nir': 'NIR10', 'red': 'R', 'green': 'G', 'blue': 'B'}
+
+def build_index_wcps(polygon, layer, startdate, enddate=None, index='savi', epsg=32632, bands=None, noData=0, scale=10000, L=0.5, statistics=False):
+    '''
+    build a WCPS query, which computes a vegetation/water index inside rasdaman for the clipped polygon, 
+    either as single float32 raster of one date or as summary statistics of every time slice of a date range
+    
+    PARAMETERS:
+        polygon (str): polygon boundaries as WKT string
+        layer (str): layer name of the data cube (coverage ID)
+        startdate (str): YYYY-MM-DD, date of the raster
+        enddate (str(opt)): YYYY-MM-DD (included), end of the date range of the statistics. Defaults to None.
+        index (str(opt)): one of savi, ndvi, evi, ndwi (see jki_datacube.index). Defaults to savi.
+        epsg (int(opt)): CRS of the polygon. Defaults to 32632.
+        bands (dict(opt)): band name (nir, red, green, blue) -> band name in the layer. Defaults to S2_BANDS.
+        noData (int(opt)): no data value of the bands. Defaults to 0.
+        scale (float(opt)): scale factor of the bands (reflectance = value / scale). Defaults to 10000.
+        L (float(opt)): soil brightness correction factor of the SAVI. Defaults to 0.5.
+        statistics (bool(opt)): If True, the query returns mean index and valid pixel portion [in %] per time slice as text/csv, 
+            otherwise the index raster of startdate as image/tiff (no data: NaN). Defaults to False.
+        
+    RETURNS:
+        wcps (str): WCPS query string
+    
+    '''
+    index = index.lower()
+    if index not in INDEX_BANDS:
+        raise ValueError('unknown index {}, choose one of {}'.format(index, ', '.join(INDEX_BANDS)))
+    bands = S2_BANDS if bands is None else bands
+    crs = get_crs_url(epsg)
+    if statistics == True:
+        tile = _get_tile_expression(polygon, epsg, 'ansi:"CRS:1"($t)')
+    else:
+        tile = _get_tile_expression(polygon, epsg, 'ansi("' + startdate + '")')
+    clipped = 'clip({tile}, {polygon}, "{crs}")'.format(tile=tile, polygon=polygon, crs=crs)
+    b = {name: '((float) ' + clipped + '.' + bands[name] + ')' for name in INDEX_BANDS[index]}
+
+    # the reflectance scale is folded into the constants, see jki_datacube.index.calculate_index
+    if index == 'savi':
+        value = '({f} * ({nir} - {red})) / ({nir} + {red} + {c})'.format(f=1 + L, c=L * scale, **b)
+    elif index == 'ndvi':
+        value = '({nir} - {red}) / ({nir} + {red})'.format(**b)
+    elif index == 'evi':
+        value = '(2.5 * ({nir} - {red})) / ({nir} + 6 * {red} - 7.5 * {blue} + {c})'.format(c=float(scale), **b)
+    else:
+        value = '({green} - {nir}) / ({green} + {nir})'.format(**b)
+    valid = '(' + ' and '.join('({}.{} != {})'.format(clipped, bands[name], noData) for name in INDEX_BANDS[index]) + ')'
+
+    if statistics == True:
+        # one row per time slice: mean index of the valid pixels and portion of valid pixels
+        mean = '(add(switch case {valid} return {value} default return 0.0f) / count({valid}))'.format(valid=valid, value=value)
+        portion = '((count({valid}) * 100.0) / {n})'.format(valid=valid, n=_get_pixel_count_expression(tile))
+        return (
+            'for $c in (' + layer + ') return encode('
+            'coverage statistics over $t t(imageCrsDomain($c[ansi("' + startdate + '":"' + enddate + '")], ansi)), $s s(0:1) '
+            'values switch case $s = 0 return (float) ' + mean + ' default return (float) ' + portion + ', "text/csv")'
+        )
+    return (
+        'for $c in (' + layer + ') return encode('
+        'switch case ' + valid + ' return (float) ' + value + ' default return nanf, "image/tiff")'
+    )
+
+
+def get_S2_index(polygon, layer, date, user, pw, host, index='savi', epsg=32632, bands=None, noData=0, printout=False, get_query=False):
+    '''
+    get a vegetation/water index raster computed inside the JKI-CODE-DE DataCube (WCPS), 
+    only a single float32 band crosses the wire instead of the raw bands
+    
+    PARAMETERS:
+        polygon (str): polygon boundaries as WKT string
+        layer (str): layer name of the data cube (coverage ID)
+        date (str): YYYY-MM-DD
+        user (str): credentials username
+        pw (str): credentials password
+        host (str): host adress of data cube service
+        index (str(opt)): one of savi, ndvi, evi, ndwi. Defaults to savi.
+        epsg (int(opt)): CRS of the polygon. Defaults to 32632.
+        bands (dict(opt)): band name (nir, red, green, blue) -> band name in the layer. Defaults to S2_BANDS.
+        noData (int(opt)): no data value of the bands. Defaults to 0.
+        printout (bool(opt)): If True, some information will be printed about the success of request. Defaults to False.
+        get_query (bool(opt)): If True, final WCPS query will be printed. Defaults to False.
+        
+    RETURNS:
+        response (requests.models.Response): binary response object with the index as float32 GeoTIFF (no data: NaN)
+    
+    '''
+    try:
+        wcps = build_index_wcps(polygon, layer, date, index=index, epsg=epsg, bands=bands, noData=noData)
+        if get_query == True:
+            print(wcps)
+
+        response = client.post(host, data={'SERVICE': 'WCS', 'VERSION': '2.0.1', 'REQUEST': 'ProcessCoverages', 'QUERY': wcps}, auth=(user, pw))
+
+        if response.status_code == 200:
+            if printout==True:
+                print('request was sucessfull! Request Status: {}'.format(response.status_code))
+        elif printout==True:
+            print('something went wrong. Request was answered with request code: {}. URL: {}'.format(response.status_code, response.url))
+            print('response content: ', response.text)
+        return response
+
+    except Exception as e:
+        print('something went wrong: {}'.format(e))
+
+
+def get_S2_index_statistics(polygon, layer, startdate, enddate, user, pw, host, index='savi', epsg=32632, bands=None, noData=0, printout=False, get_query=False):
+    '''
+    get the mean of a vegetation/water index and the valid pixel portion of every acquisition date of a date range, 
+    computed inside the JKI-CODE-DE DataCube with a single WCPS query, no imagery is downloaded
+    
+    PARAMETERS:
+        polygon (str): polygon boundaries as WKT string
+        layer (str): layer name of the data cube (coverage ID)
+        startdate (str): YYYY-MM-DD
+        enddate (str): YYYY-MM-DD (included)
+        user (str): credentials username
+        pw (str): credentials password
+        host (str): host adress of data cube service
+        index (str(opt)): one of savi, ndvi, evi, ndwi. Defaults to savi.
+        epsg (int(opt)): CRS of the polygon. Defaults to 32632.
+        bands (dict(opt)): band name (nir, red, green, blue) -> band name in the layer. Defaults to S2_BANDS.
+        noData (int(opt)): no data value of the bands. Defaults to 0.
+        printout (bool(opt)): If True, some information will be printed about the success of request. Defaults to False.
+        get_query (bool(opt)): If True, final WCPS query will be printed. Defaults to False.
+        
+    RETURNS:
+        statistics (dict): date (YYYY-MM-DD) -> [mean index, valid pixel portion in %]
+    
+    '''
+    try:
+        dates = get_S2_acquisition_dates(layer, host, user=user, pw=pw, startdate=startdate, enddate=enddate)
+        if len(dates) == 0:
+            return {}
+
+        wcps = build_index_wcps(polygon, layer, startdate, enddate, index=index, epsg=epsg, bands=bands, noData=noData, statistics=True)
+        if get_query == True:
+            print(wcps)
+
+        response = client.post(host, data={'SERVICE': 'WCS', 'VERSION': '2.0.1', 'REQUEST': 'ProcessCoverages', 'QUERY': wcps}, auth=(user, pw))
+
+        if response.status_code == 200:
+            if printout==True:
+                print('request was sucessfull! Request Status: {}'.format(response.status_code))
+            values = parse_csv(response.content).reshape(-1, 2)
+            return {d: v.tolist() for d, v in zip(dates, values)}
+        else:
+            if printout==True:
+                print('something went wrong. Request was answered with request code: {}. URL: {}'.format(response.status_code, response.url))
+                print('response content: ', response.text)
+            return {}
+
+    except Exception as e:
+        print('something went wrong: {}'.format(e))
+        return {}
+
+
+def get_S2_tile(bbox, layer, date, user, pw, host, epsg = 32632, band1='NIR10', band2='R', band3='G', band_subset=True, printout=False, get_query=False):
+    '''
+    get a rectangular Sentinel-2 tile (no clip) from JKI-CODE-DE DataCube, e.g. the bounding box of several neighbouring fields
+    
+    PARAMETERS:
+        bbox (tuple): (xmin, ymin, xmax, ymax) in the CRS given by epsg
+        layer (str): layer name of the data cube (coverage ID)
+        date (str): YYYY-MM-DD
+        user (str): credentials username
+        pw (str): credentials password
+        host (str): host adress of data cube service
+        epsg (int): defines coordinate reference system (CRS) of the bounding box and output coordinates. Defaults to 32632.
+        band1 (str): band name (default: NIR10)
+        band2 (str): band name (default: R)
+        band3 (str): band name (default: G)
+        band_subset (bool(opt)): If True, request only returns given bands (band1 - band3). Defaults to True.
+        printout (bool(opt)): If True, some information will be printed about the success of request. Defaults to False.
+        get_query (bool(opt)): If True, final WCS URL will be printed. Defaults to False. 
+        
+    RETURNS:
+        response (requests.models.Response): binary response object, in which the S2 tile is stored as GeoTIFF
+    
+    '''
+    try:
+        xmin, ymin, xmax, ymax = bbox
+        query = WCSQuery(layer).subset('ansi', date).crs(epsg).bbox(xmin, ymin, xmax, ymax).format('image/tiff')
+        if band_subset == True:
+            query = query.range_subset(band1, band2, band3)
+        if get_query == True:
+            print(query.url(host))
+
+        response = client.send(query, host, auth=(user, pw))
+
+        if response.status_code == 200:
+            if printout==True:
+                print('request was sucessfull! Request Status: {}'.format(response.status_code))
+        elif printout==True:
+            print('something went wrong. Request was answered with request code: {}. URL: {}'.format(response.status_code, response.url))
+            print('response content: ', response.text)
+        return response
+
+    except Exception as e:
+        print('something went wrong: {}'.format(e))
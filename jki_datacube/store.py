@@ -0,0 +1,326 @@
+'''
+local store of downloaded Sentinel-2 stacks
+
+Every field gets a directory with its raw time series as memory-mapped .npy array (time, band, y, x) and an
+index.json with dates, band names, no data value and georeference. GeoTIFF responses are decoded once when they
+are written, later analyses read slices through mmap without touching the network or holding the season in RAM:
+
+    from jki_datacube.store import FieldStore
+    store = FieldStore('~/data/s2_2020')
+    store.write_responses('field_1', get_S2_imagery_range(polygon, layer, '2020-03-01', '2020-10-31', user, pw, host))
+    ...
+    dates, bands, stack = store.read('field_1', startdate='2020-05-01', enddate='2020-06-30')
+    ndvi = calculate_index(stack, 'ndvi', bands={'nir': bands.index('NIR10'), 'red': bands.index('R')})
+
+A field is written by one process at a time, any number of processes can read.
+'''
+import io
+import json
+import os
+from urllib.parse import quote, unquote
+
+import numpy as np
+
+from ._lazy import lazy_import
+
+rasterio = lazy_import('rasterio')
+
+
+class FieldStore:
+    '''
+    directory of memory-mapped per-field time series
+
+    PARAMETERS:
+        path (str): root directory of the store, it is created if missing
+    '''
+
+    def __init__(self, path):
+        self.path = os.path.expanduser(path)
+        os.makedirs(self.path, exist_ok=True)
+        self._indices = {}
+
+    def _dir(self, field_id):
+        # field IDs are used as directory names, characters such as '/' are escaped
+        return os.path.join(self.path, quote(str(field_id), safe=''))
+
+    @property
+    def fields(self):
+        '''
+        IDs of all stored fields
+        '''
+        return sorted(unquote(name) for name in os.listdir(self.path)
+                      if os.path.exists(os.path.join(self.path, name, 'index.json')))
+
+    def __contains__(self, field_id):
+        return os.path.exists(os.path.join(self._dir(field_id), 'index.json'))
+
+    def index(self, field_id):
+        '''
+        index of a field: dates, bands, nodata, shape, dtype, transform and crs
+
+        PARAMETERS:
+            field_id (str): field ID
+
+        RETURNS:
+            index (dict): index of the field, raises KeyError for unknown fields
+        '''
+        path = os.path.join(self._dir(field_id), 'index.json')
+        if not os.path.exists(path):
+            raise KeyError('field {} is not in the store {}'.format(field_id, self.path))
+        # the index is re-read only if another process has updated the field
+        mtime = os.stat(path).st_mtime_ns
+        cached = self._indices.get(field_id)
+        if cached is None or cached[0] != mtime:
+            with open(path) as f:
+                cached = (mtime, json.load(f))
+            self._indices[field_id] = cached
+        return cached[1]
+
+    def dates(self, field_id):
+        '''
+        stored dates of a field (YYYY-MM-DD, ascending)
+        '''
+        return list(self.index(field_id)['dates']) if field_id in self else []
+
+    def read(self, field_id, startdate=None, enddate=None, bands=None):
+        '''
+        read the time series of a field, the array is a read-only view into the memory-mapped file
+
+        PARAMETERS:
+            field_id (str): field ID
+            startdate (str(opt)): YYYY-MM-DD, first date. Defaults to None (first stored date).
+            enddate (str(opt)): YYYY-MM-DD, last date (inclusive). Defaults to None (last stored date).
+            bands (list(opt)): band names. Defaults to None (all bands). Selecting bands copies the slice into memory.
+
+        RETURNS:
+            dates (list): dates of the time slices
+            bands (list): band names
+            stack (numpy.ndarray): raw bands with shape (time, band, y, x)
+        '''
+        index = self.index(field_id)
+        dates = index['dates']
+        # dates are sorted, so a date range is a slice and needs no copy
+        start = 0 if startdate is None else int(np.searchsorted(dates, startdate, side='left'))
+        end = len(dates) if enddate is None else int(np.searchsorted(dates, enddate, side='right'))
+        stack = np.load(os.path.join(self._dir(field_id), 'data.npy'), mmap_mode='r')[start:end]
+        if bands is None:
+            return dates[start:end], list(index['bands']), stack
+        unknown = [b for b in bands if b not in index['bands']]
+        if len(unknown) > 0:
+            raise ValueError('field {} has no band {}, available bands: {}'.format(field_id, ', '.join(unknown), ', '.join(index['bands'])))
+        return dates[start:end], list(bands), stack[:, [index['bands'].index(b) for b in bands]]
+
+    def write(self, field_id, dates, bands, data, nodata=0, transform=None, crs=None):
+        '''
+        insert or replace time slices of a field. Existing dates are overwritten in place, dates after the last
+        stored date are appended in place, other new dates are merged into the date order (the array file is rewritten then).
+
+        PARAMETERS:
+            field_id (str): field ID
+            dates (list): YYYY-MM-DD of the time slices
+            bands (list): band names, must match the stored bands of the field
+            data (numpy.ndarray): raw bands with shape (time, band, y, x)
+            nodata (int(opt)): no data value. Defaults to 0.
+            transform (tuple(opt)): affine transform (a, b, c, d, e, f) of the images. Defaults to None.
+            crs (str(opt)): coordinate reference system of the images, e.g. EPSG:32632. Defaults to None.
+        '''
+        data = np.asarray(data)
+        dates = [str(d) for d in dates]
+        bands = [str(b) for b in bands]
+        if data.ndim != 4 or data.shape[0] != len(dates) or data.shape[1] != len(bands):
+            raise ValueError('data must have the shape (time, band, y, x) = ({}, {}, y, x), got {}'.format(len(dates), len(bands), data.shape))
+        if len(set(dates)) != len(dates):
+            raise ValueError('dates must be unique')
+        if len(dates) == 0:
+            return
+
+        directory = self._dir(field_id)
+        path = os.path.join(directory, 'data.npy')
+        if field_id in self:
+            index = self.index(field_id)
+            if index['bands'] != bands or tuple(index['shape']) != data.shape[2:]:
+                raise ValueError('field {} is stored with bands {} and shape {}, got bands {} and shape {}'.format(
+                    field_id, index['bands'], tuple(index['shape']), bands, data.shape[2:]))
+            old_dates = index['dates']
+        else:
+            os.makedirs(directory, exist_ok=True)
+            index = {'bands': bands, 'shape': list(data.shape[2:]), 'dtype': data.dtype.str, 'nodata': nodata,
+                     'transform': None if transform is None else list(transform)[:6], 'crs': None if crs is None else str(crs)}
+            old_dates = []
+
+        positions = {d: i for i, d in enumerate(old_dates)}
+        new_dates = sorted(set(dates) - set(positions))
+        appended = False
+        if len(new_dates) > 0 and len(old_dates) > 0 and new_dates[0] > old_dates[-1]:
+            # daily updates only add dates at the end -> the cost does not grow with the stored season
+            order = {d: i for i, d in enumerate(dates)}
+            appended = _append_npy(path, data[[order[d] for d in new_dates]].astype(np.dtype(index['dtype']), copy=False))
+            if appended == True:
+                index['dates'] = old_dates + new_dates
+        if len(new_dates) == 0 or appended == True:
+            # the remaining dates are stored already -> overwrite in place
+            existing = [i for i, d in enumerate(dates) if d in positions]
+            if len(existing) > 0:
+                stack = np.lib.format.open_memmap(path, mode='r+')
+                for i in existing:
+                    stack[positions[dates[i]]] = data[i]
+                stack.flush()
+                del stack
+        else:
+            merged = sorted(old_dates + new_dates)
+            tmp = path + '.' + str(os.getpid()) + '.tmp'
+            stack = np.lib.format.open_memmap(tmp, mode='w+', dtype=np.dtype(index['dtype']), shape=(len(merged),) + data.shape[1:])
+            target = {d: i for i, d in enumerate(merged)}
+            if len(old_dates) > 0:
+                old = np.load(path, mmap_mode='r')
+                # old dates keep their order, so they are copied slice by slice without loading the whole file
+                for d, i in positions.items():
+                    stack[target[d]] = old[i]
+                del old
+            for i, d in enumerate(dates):
+                stack[target[d]] = data[i]
+            stack.flush()
+            del stack
+            os.replace(tmp, path)
+            index['dates'] = merged
+
+        if transform is not None:
+            index['transform'] = list(transform)[:6]
+        if crs is not None:
+            index['crs'] = str(crs)
+        tmp = os.path.join(directory, 'index.json.' + str(os.getpid()) + '.tmp')
+        with open(tmp, 'w') as f:
+            json.dump(index, f)
+        os.replace(tmp, os.path.join(directory, 'index.json'))
+        self._indices.pop(field_id, None)
+
+    def write_responses(self, field_id, results, bands=('NIR10', 'R', 'G'), noData=0, batch_size=16):
+        '''
+        decode GeoTIFF responses of one field (e.g. from get_S2_imagery_range) once and write them to the store.
+        Failed requests and empty images (only noData pixels) are skipped. The images are written in batches of
+        batch_size, so a season is never held in RAM at once.
+
+        PARAMETERS:
+            field_id (str): field ID
+            results (iterable): (date, response) pairs
+            bands (tuple(opt)): band names of the requested bands. Defaults to ('NIR10', 'R', 'G').
+            noData (int(opt)): no data value of the images. Defaults to 0.
+            batch_size (int(opt)): number of decoded images, which are written together. Defaults to 16.
+
+        RETURNS:
+            dates (list): dates, which were written
+        '''
+        written = []
+        dates = []
+        images = []
+        shape = None
+        transform = None
+        crs = None
+        for date, response in results:
+            if response is None or getattr(response, 'status_code', 200) != 200:
+                continue
+            with rasterio.open(io.BytesIO(response.content), nodata=noData) as src:
+                image = src.read()
+                transform = tuple(src.transform)[:6]
+                crs = None if src.crs is None else src.crs.to_string()
+            if np.all(image == noData):
+                continue
+            if shape is None:
+                shape = image.shape
+            elif image.shape != shape:
+                # a clipped field always has the same extent, other shapes are broken responses
+                continue
+            dates.append(date)
+            images.append(image)
+            if len(images) >= batch_size:
+                self.write(field_id, dates, bands[:shape[0]], np.stack(images), nodata=noData, transform=transform, crs=crs)
+                written += dates
+                dates = []
+                images = []
+        if len(images) > 0:
+            self.write(field_id, dates, bands[:shape[0]], np.stack(images), nodata=noData, transform=transform, crs=crs)
+            written += dates
+        return written
+
+    def watermark(self, field_id):
+        '''
+        last date (YYYY-MM-DD), up to which the field is complete, None if it was never updated (see set_watermark)
+        '''
+        path = os.path.join(self._dir(field_id), 'watermark')
+        if not os.path.exists(path):
+            return None
+        with open(path) as f:
+            return f.read().strip() or None
+
+    def set_watermark(self, field_id, date):
+        '''
+        store the last date (YYYY-MM-DD), up to which all time slices of the field were processed. It is kept
+        apart from the dates of the array, since days without data are processed as well.
+        '''
+        directory = self._dir(field_id)
+        os.makedirs(directory, exist_ok=True)
+        tmp = os.path.join(directory, 'watermark.' + str(os.getpid()) + '.tmp')
+        with open(tmp, 'w') as f:
+            f.write(str(date))
+        os.replace(tmp, os.path.join(directory, 'watermark'))
+
+    def delete(self, field_id, dates=None):
+        '''
+        remove a field (including its watermark) or some of its dates from the store
+        '''
+        directory = self._dir(field_id)
+        if dates is None:
+            if not os.path.isdir(directory):
+                return
+            for name in os.listdir(directory):
+                os.remove(os.path.join(directory, name))
+            os.rmdir(directory)
+            self._indices.pop(field_id, None)
+            return
+        if field_id not in self:
+            return
+        index = self.index(field_id)
+        dates = set(dates)
+        keep = [i for i, d in enumerate(index['dates']) if d not in dates]
+        if len(keep) == len(index['dates']):
+            return
+        stack = np.load(os.path.join(directory, 'data.npy'), mmap_mode='r')[keep]
+        watermark = self.watermark(field_id)
+        self.delete(field_id)
+        if watermark is not None:
+            self.set_watermark(field_id, watermark)
+        if len(keep) > 0:
+            self.write(field_id, [index['dates'][i] for i in keep], index['bands'], stack, nodata=index['nodata'],
+                       transform=index['transform'], crs=index['crs'])
+
+
+def _append_npy(path, rows):
+    # append slices to the first axis of a .npy file in place, False if the header cannot be rewritten in place
+    with open(path, 'r+b') as f:
+        version = np.lib.format.read_magic(f)
+        if version == (1, 0):
+            shape, fortran_order, dtype = np.lib.format.read_array_header_1_0(f)
+            write_header = np.lib.format.write_array_header_1_0
+        elif version == (2, 0):
+            shape, fortran_order, dtype = np.lib.format.read_array_header_2_0(f)
+            write_header = np.lib.format.write_array_header_2_0
+        else:
+            return False
+        offset = f.tell()
+        if fortran_order or dtype != rows.dtype or tuple(shape[1:]) != rows.shape[1:]:
+            return False
+        header = io.BytesIO()
+        write_header(header, {'descr': np.lib.format.dtype_to_descr(dtype), 'fortran_order': False, 'shape': (shape[0] + len(rows),) + tuple(shape[1:])})
+        header = header.getvalue()
+        # numpy pads the header, so the first axis can grow without moving the data
+        if len(header) != offset:
+            return False
+        # the data is written behind the slices of the header (not the end of the file, which may hold the rest of
+        # an interrupted append), the new header is written last
+        f.seek(offset + int(np.prod(shape)) * dtype.itemsize)
+        f.write(np.ascontiguousarray(rows).tobytes())
+        f.truncate()
+        f.flush()
+        f.seek(0)
+        f.write(header)
+    return True
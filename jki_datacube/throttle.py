@@ -0,0 +1,327 @@
+'''
+client-side rate limiting and adaptive concurrency per data cube host
+
+Every request of the shared clients (jki_datacube.client, jki_datacube.aio) passes the HostThrottle of its host:
+
+* a token bucket limits the request rate (requests per second, with bursts)
+* an AIMD controller limits the number of concurrent requests. The limit grows by one per window of successful
+  requests and is cut in half on 429/5xx answers and connection errors (optionally also on rising latency).
+
+Hosts with different capacity are configured once, e.g.:
+
+    from jki_datacube.throttle import set_throttle, get_metrics
+    set_throttle(credentials.ras_host, rate=20, max_limit=16)
+    set_throttle(credentials.ras_cde_host, rate=5, burst=10, initial=2, max_limit=8)
+    ...
+    get_metrics() # current limit, in flight requests, latency, throttled answers per host
+'''
+import asyncio
+import collections
+import contextlib
+import threading
+import time
+from urllib.parse import urlsplit
+
+
+class TokenBucket:
+    '''
+    token bucket rate limiter, usable from threads and coroutines
+
+    PARAMETERS:
+        rate (float): tokens (requests) per second, None disables the limit
+        burst (float(opt)): capacity of the bucket, i.e. requests allowed at once after a pause. Defaults to max(1, rate).
+    '''
+
+    def __init__(self, rate, burst=None):
+        self.rate = rate
+        self.burst = max(1.0, rate or 1.0) if burst is None else float(burst)
+        self._tokens = self.burst
+        self._updated = time.monotonic()
+        self._lock = threading.Lock()
+
+    def _reserve(self):
+        # take a token (the balance may become negative) and return the time to wait for it
+        if self.rate is None:
+            return 0.0
+        with self._lock:
+            now = time.monotonic()
+            self._tokens = min(self.burst, self._tokens + (now - self._updated) * self.rate)
+            self._updated = now
+            self._tokens -= 1
+            return max(0.0, -self._tokens / self.rate)
+
+    def acquire(self):
+        '''
+        wait (blocking) until a request may be sent
+        '''
+        wait = self._reserve()
+        if wait > 0:
+            time.sleep(wait)
+
+    async def acquire_async(self):
+        '''
+        wait (without blocking the event loop) until a request may be sent
+        '''
+        wait = self._reserve()
+        if wait > 0:
+            await asyncio.sleep(wait)
+
+    @property
+    def tokens(self):
+        '''
+        currently available tokens
+        '''
+        if self.rate is None:
+            return float('inf')
+        with self._lock:
+            return min(self.burst, self._tokens + (time.monotonic() - self._updated) * self.rate)
+
+
+class AIMDController:
+    '''
+    additive increase / multiplicative decrease limit of concurrent requests, usable from threads and coroutines
+
+    PARAMETERS:
+        initial (int(opt)): limit at start. Defaults to 4.
+        min_limit (int(opt)): lower bound of the limit. Defaults to 1.
+        max_limit (int(opt)): upper bound of the limit. Defaults to 32.
+        increase (float(opt)): added to the limit after every window of successful requests (as many as the limit). Defaults to 1.
+        decrease (float(opt)): factor applied to the limit on congestion, at most once per round trip. Defaults to 0.5.
+        latency_tolerance (float(opt)): If given, congestion is also assumed, if the smoothed latency exceeds the baseline
+            (the lowest observed latency, slowly adapting) by this factor. Only useful for hosts, which answer requests of
+            similar cost: a few fast point queries followed by large coverages look like congestion. Defaults to None
+            (only 429/5xx answers and connection errors decrease the limit).
+    '''
+
+    def __init__(self, initial=4, min_limit=1, max_limit=32, increase=1, decrease=0.5, latency_tolerance=None):
+        self.min_limit = min_limit
+        self.max_limit = max_limit
+        self.increase = increase
+        self.decrease = decrease
+        self.latency_tolerance = latency_tolerance
+        self.limit = float(min(max(initial, min_limit), max_limit))
+        self.in_flight = 0
+        self.latency = None
+        self.baseline = None
+        self.requests = 0
+        self.throttled = 0
+        self.errors = 0
+        self.decreases = 0
+        self._successes = 0
+        self._last_decrease = 0.0
+        self._lock = threading.Lock()
+        self._condition = threading.Condition(self._lock)
+        self._waiters = collections.deque() # (loop, future) of waiting coroutines
+
+    def _free(self):
+        return max(1, int(self.limit)) - self.in_flight
+
+    def _wake(self):
+        # called with the lock held
+        free = self._free()
+        if free <= 0:
+            return
+        self._condition.notify(free)
+        while free > 0 and len(self._waiters) > 0:
+            loop, future = self._waiters.popleft()
+            if not future.done():
+                loop.call_soon_threadsafe(_set_done, future)
+                free -= 1
+
+    def acquire(self):
+        '''
+        wait (blocking) for a free slot
+        '''
+        with self._condition:
+            while self._free() <= 0:
+                self._condition.wait()
+            self.in_flight += 1
+
+    async def acquire_async(self):
+        '''
+        wait (without blocking the event loop) for a free slot, the wait can be cancelled
+        '''
+        loop = asyncio.get_running_loop()
+        while True:
+            with self._lock:
+                if self._free() > 0:
+                    self.in_flight += 1
+                    return
+                future = loop.create_future()
+                self._waiters.append((loop, future))
+            try:
+                await future
+            except asyncio.CancelledError:
+                with self._lock:
+                    # pass a wake-up on to the next waiter
+                    self._wake()
+                raise
+
+    def release(self):
+        '''
+        free a slot
+        '''
+        with self._lock:
+            self.in_flight -= 1
+            self._wake()
+
+    def record(self, latency, status_code=None):
+        '''
+        update the limit with the result of a request
+
+        PARAMETERS:
+            latency (float): duration of the request in seconds
+            status_code (int(opt)): HTTP status code, None for connection errors and timeouts
+        '''
+        with self._lock:
+            self.requests += 1
+            congested = status_code is None or status_code == 429 or status_code >= 500
+            if status_code is None:
+                self.errors += 1
+            elif congested:
+                self.throttled += 1
+            else:
+                self.latency = latency if self.latency is None else 0.8 * self.latency + 0.2 * latency
+                if self.baseline is None or latency < self.baseline:
+                    self.baseline = latency
+                else:
+                    # follow a permanently slower host slowly
+                    self.baseline += 0.01 * (latency - self.baseline)
+                if self.latency_tolerance is not None:
+                    congested = self.latency > self.latency_tolerance * self.baseline
+
+            now = time.monotonic()
+            if congested:
+                self._successes = 0
+                if now - self._last_decrease > (self.latency or 1.0):
+                    self.limit = max(float(self.min_limit), self.limit * self.decrease)
+                    self._last_decrease = now
+                    self.decreases += 1
+            else:
+                self._successes += 1
+                if self._successes >= int(self.limit):
+                    self._successes = 0
+                    self.limit = min(float(self.max_limit), self.limit + self.increase)
+                    self._wake()
+
+    def metrics(self):
+        '''
+        current state as dictionary
+        '''
+        with self._lock:
+            return {
+                'limit': int(self.limit),
+                'in_flight': self.in_flight,
+                'latency': self.latency,
+                'baseline_latency': self.baseline,
+                'requests': self.requests,
+                'throttled': self.throttled,
+                'errors': self.errors,
+                'decreases': self.decreases
+            }
+
+
+def _set_done(future):
+    if not future.done():
+        future.set_result(None)
+
+
+class HostThrottle:
+    '''
+    token bucket and AIMD concurrency controller of one host
+
+    PARAMETERS:
+        rate (float(opt)): requests per second, None disables the rate limit. Defaults to None.
+        burst (float(opt)): requests allowed at once after a pause. Defaults to max(1, rate).
+        kwargs: arguments of AIMDController (initial, min_limit, max_limit, increase, decrease, latency_tolerance)
+    '''
+
+    def __init__(self, rate=None, burst=None, **kwargs):
+        self.bucket = TokenBucket(rate, burst)
+        self.controller = AIMDController(**kwargs)
+
+    @contextlib.contextmanager
+    def slot(self):
+        '''
+        context manager, which waits for a token and a free slot (blocking) and releases the slot afterwards
+        '''
+        self.controller.acquire()
+        try:
+            self.bucket.acquire()
+            yield
+        finally:
+            self.controller.release()
+
+    @contextlib.asynccontextmanager
+    async def slot_async(self):
+        '''
+        asynchronous counterpart of slot
+        '''
+        await self.controller.acquire_async()
+        try:
+            await self.bucket.acquire_async()
+            yield
+        finally:
+            self.controller.release()
+
+    def record(self, latency, status_code=None):
+        '''
+        report the result of a request, see AIMDController.record
+        '''
+        self.controller.record(latency, status_code)
+
+    def metrics(self):
+        '''
+        current state as dictionary (limit, in_flight, latency, ..., rate, tokens)
+        '''
+        metrics = self.controller.metrics()
+        metrics['rate'] = self.bucket.rate
+        metrics['tokens'] = self.bucket.tokens
+        return metrics
+
+
+# arguments of the throttles of hosts, which are not configured with set_throttle. max_limit is the connection pool
+# size of the shared client (DatacubeClient.max_connections), more concurrent requests would open unpooled connections.
+DEFAULT_THROTTLE = {'rate': None, 'initial': 8, 'max_limit': 16}
+
+_THROTTLES = {}
+_LOCK = threading.Lock()
+
+
+def _get_netloc(url):
+    return urlsplit(url).netloc.rsplit('@', 1)[-1].lower()
+
+
+def set_throttle(host, **kwargs):
+    '''
+    configure the throttle of a host, the state of an existing throttle is reset
+
+    PARAMETERS:
+        host (str): host adress of the data cube service (only scheme and network location are used)
+        kwargs: arguments of HostThrottle (rate, burst, initial, min_limit, max_limit, increase, decrease, latency_tolerance)
+
+    RETURNS:
+        throttle (HostThrottle): the new throttle
+    '''
+    with _LOCK:
+        _THROTTLES[_get_netloc(host)] = throttle = HostThrottle(**kwargs)
+    return throttle
+
+
+def get_throttle(url):
+    '''
+    get the throttle of the host of a URL, it is created with DEFAULT_THROTTLE on first use
+    '''
+    netloc = _get_netloc(url)
+    throttle = _THROTTLES.get(netloc)
+    if throttle is None:
+        with _LOCK:
+            throttle = _THROTTLES.setdefault(netloc, HostThrottle(**DEFAULT_THROTTLE))
+    return throttle
+
+
+def get_metrics():
+    '''
+    current state of all throttles as dictionary host -> metrics
+    '''
+    return {netloc: throttle.metrics() for netloc, throttle in list(_THROTTLES.items())}
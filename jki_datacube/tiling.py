@@ -0,0 +1,140 @@
+from concurrent.futures import ThreadPoolExecutor, FIRST_COMPLETED, wait
+
+import numpy as np
+
+from ._lazy import lazy_import
+from .misc import get_point_clusters
+from .s2 import get_S2_tile, _get_dates
+
+rasterio = lazy_import('rasterio')
+riomask = lazy_import('rasterio.mask')
+gpd = lazy_import('geopandas')
+
+
+def plan_tiles(fields, max_extent=5000, epsg=32632, id_column=None):
+    '''
+    group neighbouring fields into request tiles using a regular grid index on the field centroids
+    
+    Every field is assigned to the grid cell (max_extent x max_extent) of its centroid, the tile is the bounding box 
+    of all fields of a cell. A tile is therefore at most max_extent plus the size of its largest field wide and high.
+    
+    PARAMETERS:
+        fields (str or geopandas.GeoDataFrame): path of a vector file or GeoDataFrame with the field polygons
+        max_extent (float(opt)): size of the grid cells in CRS units. Defaults to 5000.
+        epsg (int(opt)): CRS of the tiles, the fields are reprojected. Defaults to 32632.
+        id_column (str(opt)): column with unique field IDs. Defaults to None (row index).
+        
+    RETURNS:
+        tiles (list): list of dicts with 'bbox' (xmin, ymin, xmax, ymax), 'field_ids' (list) and 'geometries' (list)
+    
+    '''
+    if isinstance(fields, str):
+        fields = gpd.read_file(fields)
+    fields = fields.to_crs('EPSG:' + str(epsg))
+    fields = fields[~(fields.geometry.is_empty | fields.geometry.isna())]
+    ids = np.asarray(fields.index if id_column is None else fields[id_column])
+    geometries = np.asarray(fields.geometry, dtype=object)
+    bounds = fields.geometry.bounds.to_numpy()
+    centroids = fields.geometry.centroid
+
+    tiles = []
+    for members in get_point_clusters(centroids.x.to_numpy(), centroids.y.to_numpy(), max_extent):
+        b = bounds[members]
+        tiles.append({
+            'bbox': (b[:, 0].min(), b[:, 1].min(), b[:, 2].max(), b[:, 3].max()),
+            'field_ids': ids[members].tolist(),
+            'geometries': geometries[members].tolist()
+        })
+    return tiles
+
+
+def clip_fields(img, geometries, noData=0):
+    '''
+    clip several fields locally from one tile (rasterio mask), pixels outside a field are set to noData
+    
+    PARAMETERS:
+        img (requests.models.Response): response object with the GeoTIFF tile, e.g. returned by get_S2_tile
+        geometries (list): shapely polygons in the CRS of the tile
+        noData (int(opt)): value of pixels outside the field. Defaults to 0.
+        
+    RETURNS:
+        clipped (list): one [bands, meta] list per geometry, bands (numpy.ndarray) with shape (band, y, x) cropped 
+            to the field, None if the field does not overlap the tile
+    
+    '''
+    clipped = []
+    with rasterio.io.MemoryFile(img.content) as memfile:
+        with memfile.open() as src:
+            for geometry in geometries:
+                try:
+                    bands, transform = riomask.mask(src, [geometry], crop=True, nodata=noData, filled=True)
+                except ValueError:
+                    # field outside the tile
+                    clipped.append(None)
+                    continue
+                meta = src.meta.copy()
+                meta.update({'height': bands.shape[1], 'width': bands.shape[2], 'transform': transform, 'nodata': noData})
+                clipped.append([bands, meta])
+    return clipped
+
+
+def get_S2_imagery_tiles(tiles, layer, startdate, enddate, user, pw, host, epsg=32632, dates=None, max_workers=8, noData=0, printout=False, get_query=False):
+    '''
+    get the Sentinel-2 images of many fields with one request per tile and date instead of one request per field and date
+    
+    Every (tile, date) pair is requested once on a bounded thread pool, the fields of the tile are clipped locally.
+    Results are yielded as soon as a tile arrives.
+    
+    PARAMETERS:
+        tiles (list): tiles returned by plan_tiles
+        layer (str): layer name of the data cube (coverage ID)
+        startdate (str): YYYY-MM-DD
+        enddate (str): YYYY-MM-DD (included)
+        user (str): credentials username
+        pw (str): credentials password
+        host (str): host adress of data cube service
+        epsg (int(opt)): CRS of the tiles. Defaults to 32632.
+        dates (list(opt)): If given, only these dates (YYYY-MM-DD) are requested. Defaults to None (every day).
+        max_workers (int(opt)): maximum number of concurrent requests. Defaults to 8.
+        noData (int(opt)): value of pixels outside a field. Defaults to 0.
+        printout (bool(opt)): If True, some information will be printed about the success of request. Defaults to False.
+        get_query (bool(opt)): If True, final WCS URLs will be printed. Defaults to False.
+        
+    YIELDS:
+        (field_id, date, bands, meta) (tuple): raw bands (band, y, x) of a field, e.g. for jki_datacube.index.calculate_index
+    
+    '''
+    days = _get_dates(startdate, enddate)
+    if dates is not None:
+        dates = set(dates)
+        days = [day for day in days if day in dates]
+
+    def fetch(tile, day):
+        img = get_S2_tile(tile['bbox'], layer, day, user, pw, host, epsg=epsg, printout=printout, get_query=get_query)
+        if img is None or img.status_code != 200:
+            return []
+        return clip_fields(img, tile['geometries'], noData=noData)
+
+    todo = ((tile, day) for day in days for tile in tiles)
+    with ThreadPoolExecutor(max_workers=max_workers) as executor:
+        # keep only a few requests per worker in flight, yielded tiles are released by the executor
+        futures = {}
+        try:
+            for tile, day in todo:
+                futures[executor.submit(fetch, tile, day)] = (tile, day)
+                if len(futures) >= 2 * max_workers:
+                    break
+            while len(futures) > 0:
+                finished, _ = wait(futures, return_when=FIRST_COMPLETED)
+                for future in finished:
+                    tile, day = futures.pop(future)
+                    for field_id, clipped in zip(tile['field_ids'], future.result()):
+                        if clipped is not None:
+                            yield field_id, day, clipped[0], clipped[1]
+                    task = next(todo, None)
+                    if task is not None:
+                        futures[executor.submit(fetch, *task)] = task
+                del finished, future
+        finally:
+            for future in futures:
+                future.cancel()